@@ -241,7 +241,11 @@ def get_top_10_companies(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty or 'Investment_Score' not in df.columns:
         return pd.DataFrame()
     
-    top_10 = df.nlargest(10, 'Investment_Score').copy()
+    # Import locale: screener importa già ai_agent
+    from screener import format_display_columns
+    
+    # Testi formattati (Change %, Market Cap, ...) solo per le 10 righe usate nei prompt
+    top_10 = format_display_columns(df.nlargest(10, 'Investment_Score'))
     return top_10
 
 def analyze_company_with_ai(company_data: pd.Series) -> Dict:
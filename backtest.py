@@ -0,0 +1,282 @@
+"""
+Backtest dei TOP picks per Investment_Score su storico OHLCV giornaliero locale
+
+Lo storico (CSV o Parquet in formato lungo: date, ticker, open, high, low,
+close, volume e, se c'è, market_cap) diventa un pannello data × ticker per
+campo. Gli input dello score sono ricalcolati con operazioni vettoriali sul
+pannello intero, lo score con gli stessi profili dello screener in una sola
+chiamata su tutte le coppie (data, ticker), i primi K per data scelti con
+argpartition per riga. Rendimenti a 10/20 giorni, hit rate e drawdown
+massimo dentro l'orizzonte sono calcolati su tutto il pannello insieme,
+senza cicli per data.
+
+Alcuni input di TradingView non sono ricavabili dai prezzi e sono
+approssimati: Recommend.All (media dei voti su medie mobili e oscillatori,
+come il rating tecnico TradingView) e Volatility.D (escursione del giorno %).
+market_cap_basic resta NaN se lo storico non ha la colonna market_cap.
+
+Uso:
+    python backtest.py fixtures/ohlcv/sample.csv --k 5 --rebalance 5
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from scoring import DEFAULT_PROFILE, get_scoring_profiles, score_profiles
+
+
+# ==================== CONFIGURAZIONE ====================
+DEFAULT_OHLCV_PATH = os.environ.get(
+    "FLUSSO_OHLCV_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ohlcv", "sample.csv"),
+)
+
+HORIZONS = (10, 20)     # giorni di borsa (≈ 2 e 4 settimane)
+MIN_HISTORY = 200       # giorni necessari per SMA200
+CAMPI = ('open', 'high', 'low', 'close', 'volume', 'market_cap')
+
+
+# ==================== DATI ====================
+def load_ohlcv(path=DEFAULT_OHLCV_PATH):
+    """
+    Legge lo storico in formato lungo e lo trasforma in pannelli data × ticker
+
+    Returns:
+        dict campo -> DataFrame (indice date ordinate, colonne ticker)
+    """
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.drop_duplicates(['date', 'ticker'], keep='last')
+    return {
+        campo: df.pivot(index='date', columns='ticker', values=campo).sort_index().astype(float)
+        for campo in CAMPI if campo in df.columns
+    }
+
+
+def make_synthetic_ohlcv(tickers=8, days=320, seed=42, start="2024-01-01"):
+    """Storico sintetico ripetibile (random walk con trend diversi) in formato lungo"""
+    rng = np.random.default_rng(seed)
+    date = pd.bdate_range(start, periods=days)
+    drift = rng.normal(0.0004, 0.0008, tickers)
+    sigma = rng.uniform(0.008, 0.025, tickers)
+    rendimenti = rng.normal(drift, sigma, (days, tickers))
+    close = 50 * np.exp(np.cumsum(rendimenti, axis=0))
+    apertura = close * np.exp(rng.normal(0, sigma / 3, (days, tickers)))
+    escursione = np.abs(rng.normal(0, sigma, (days, tickers))) * close
+    high = np.maximum(close, apertura) + escursione / 2
+    low = np.minimum(close, apertura) - escursione / 2
+    volume = rng.lognormal(13, 0.4, (days, tickers)).round()
+    nomi = [f"SYN:T{i:02d}" for i in range(tickers)]
+    azioni = rng.uniform(2e8, 5e9, tickers)
+    return pd.DataFrame({
+        'date': np.repeat(date, tickers),
+        'ticker': np.tile(nomi, days),
+        'open': apertura.ravel().round(4),
+        'high': high.ravel().round(4),
+        'low': low.ravel().round(4),
+        'close': close.ravel().round(4),
+        'volume': volume.ravel(),
+        'market_cap': (close * azioni).ravel().round(0),
+    })
+
+
+# ==================== INDICATORI ====================
+def _rsi(close, periodo=14):
+    """RSI di Wilder su tutto il pannello"""
+    delta = close.diff()
+    guadagni = delta.clip(lower=0).ewm(alpha=1 / periodo, adjust=False, min_periods=periodo).mean()
+    perdite = (-delta.clip(upper=0)).ewm(alpha=1 / periodo, adjust=False, min_periods=periodo).mean()
+    return 100 - 100 / (1 + guadagni / perdite)
+
+
+def _recommend_all(close, sma, rsi, macd, signal):
+    """Rating tecnico approssimato in [-1, 1]: media dei voti medie mobili e oscillatori"""
+    voti_ma = np.mean([np.sign(close - m) for m in sma], axis=0)
+    voti_osc = np.mean([
+        np.where(rsi < 30, 1.0, np.where(rsi > 70, -1.0, 0.0)),
+        np.sign(macd - signal),
+        np.sign(close - close.shift(10)),
+    ], axis=0)
+    rating = (voti_ma + voti_osc) / 2
+    # Niente rating finché le medie non sono disponibili
+    return pd.DataFrame(rating, index=close.index, columns=close.columns).where(sma[-1].notna())
+
+
+def compute_indicators(panels):
+    """
+    Input dello score per ogni (data, ticker), con le stesse colonne dello screener
+
+    Returns:
+        dict colonna TradingView -> pannello data × ticker
+    """
+    close, high, low = panels['close'], panels['high'], panels['low']
+    volume = panels.get('volume')
+
+    sma = {n: close.rolling(n, min_periods=n).mean() for n in (10, 20, 50, 100, 200)}
+    ema12 = close.ewm(span=12, adjust=False, min_periods=12).mean()
+    ema26 = close.ewm(span=26, adjust=False, min_periods=26).mean()
+    macd = ema12 - ema26
+    signal = macd.ewm(span=9, adjust=False, min_periods=9).mean()
+    rsi = _rsi(close)
+
+    indicatori = {
+        'close': close,
+        'change': close.pct_change() * 100,
+        'RSI': rsi,
+        'MACD.macd': macd,
+        'MACD.signal': signal,
+        'SMA50': sma[50],
+        'SMA200': sma[200],
+        'Volatility.D': (high - low) / low * 100,
+        'Recommend.All': _recommend_all(close, [sma[n] for n in (10, 20, 50, 100, 200)], rsi, macd, signal),
+        'Perf.W': close.pct_change(5) * 100,
+        'Perf.1M': close.pct_change(21) * 100,
+        'market_cap_basic': panels.get('market_cap', pd.DataFrame(np.nan, index=close.index, columns=close.columns)),
+    }
+    if volume is not None:
+        indicatori['relative_volume_10d_calc'] = volume / volume.rolling(10, min_periods=10).mean()
+    return indicatori
+
+
+def score_panel(indicatori, profile=DEFAULT_PROFILE):
+    """Investment_Score di ogni (data, ticker) con un'unica valutazione del profilo"""
+    close = indicatori['close']
+    lungo = pd.DataFrame({nome: pannello.to_numpy().ravel() for nome, pannello in indicatori.items()})
+    profili = [p for p in get_scoring_profiles() if p["name"] == profile]
+    if not profili:
+        raise ValueError(f"Profilo di scoring sconosciuto: {profile}")
+    punteggi = score_profiles(lungo, profili)['Investment_Score'].to_numpy()
+    return pd.DataFrame(punteggi.reshape(close.shape), index=close.index, columns=close.columns)
+
+
+# ==================== BACKTEST ====================
+def _forward_returns(close, h):
+    """Rendimento da chiusura a chiusura dopo h giorni"""
+    return close.shift(-h) / close - 1
+
+
+def _forward_drawdown(close, low, h):
+    """Peggior minimo nei successivi h giorni rispetto alla chiusura di ingresso (≤ 0)"""
+    minimo = low.iloc[::-1].rolling(h, min_periods=h).min().iloc[::-1].shift(-1)
+    return np.minimum(minimo / close - 1, 0)
+
+
+def top_k_mask(scores, k):
+    """Maschera data × ticker dei k punteggi più alti di ogni data (argpartition per riga)"""
+    valori = scores.to_numpy(dtype=float)
+    righe, colonne = valori.shape
+    mask = np.zeros_like(valori, dtype=bool)
+    if colonne == 0:
+        return mask
+    k = min(k, colonne)
+    pieni = np.where(np.isnan(valori), -np.inf, valori)
+    scelte = np.argpartition(-pieni, k - 1, axis=1)[:, :k]
+    mask[np.arange(righe)[:, None], scelte] = True
+    return mask & ~np.isnan(valori)
+
+
+def run_backtest(panels, k=5, horizons=HORIZONS, rebalance_every=5, profile=DEFAULT_PROFILE,
+                 min_history=MIN_HISTORY):
+    """
+    Backtest dei primi k titoli per score su tutto il pannello
+
+    Args:
+        panels: risultato di load_ohlcv
+        k: titoli scelti per data
+        horizons: orizzonti dei rendimenti in giorni di borsa
+        rebalance_every: una data di selezione ogni N giorni
+        profile: profilo di scoring
+        min_history: giorni di storico prima della prima selezione
+
+    Returns:
+        dict con:
+            summary: una riga per orizzonte (rendimento medio/mediano dei pick,
+                     hit rate, media dell'universo, extra-rendimento, drawdown)
+            by_date: rendimento medio dei pick e dell'universo per data e orizzonte
+            picks:   pick in formato lungo con score e rendimenti futuri
+    """
+    indicatori = compute_indicators(panels)
+    scores = score_panel(indicatori, profile)
+    close, low = panels['close'], panels['low']
+
+    # Date di selezione: dopo il riscaldamento degli indicatori, ogni rebalance_every giorni
+    posizioni = np.arange(len(close))
+    date_valide = (posizioni >= min_history) & ((posizioni - min_history) % rebalance_every == 0)
+    picks = top_k_mask(scores, k) & date_valide[:, None]
+    universo = close.notna().to_numpy() & date_valide[:, None]
+
+    riepilogo = []
+    per_data = {}
+    lungo = {'score': scores.to_numpy()[picks]}
+    for h in horizons:
+        rendimenti = _forward_returns(close, h).to_numpy()
+        drawdown = _forward_drawdown(close, low, h).to_numpy()
+        disponibili = ~np.isnan(rendimenti)
+        scelti = picks & disponibili
+        tutti = universo & disponibili
+
+        # ⭐ Statistiche sul pannello intero con maschere, nessun ciclo per data ⭐
+        n_scelti = scelti.sum(axis=1)
+        n_tutti = tutti.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media_pick = np.where(scelti, rendimenti, 0).sum(axis=1) / n_scelti
+            media_universo = np.where(tutti, rendimenti, 0).sum(axis=1) / n_tutti
+        per_data[f'pick_{h}d'] = media_pick
+        per_data[f'universo_{h}d'] = media_universo
+
+        r = rendimenti[scelti]
+        dd = drawdown[scelti]
+        date_con_pick = n_scelti > 0
+        riepilogo.append({
+            'orizzonte': f"{h}g",
+            'pick': int(scelti.sum()),
+            'date': int(date_con_pick.sum()),
+            'rendimento_medio': r.mean() if r.size else np.nan,
+            'rendimento_mediano': np.median(r) if r.size else np.nan,
+            'hit_rate': (r > 0).mean() if r.size else np.nan,
+            'universo_medio': rendimenti[tutti].mean() if tutti.any() else np.nan,
+            'extra_rendimento': np.nanmean(media_pick[date_con_pick] - media_universo[date_con_pick])
+                                if date_con_pick.any() else np.nan,
+            'drawdown_medio': np.nanmean(dd) if dd.size else np.nan,
+            'drawdown_peggiore': np.nanmin(dd) if dd.size else np.nan,
+        })
+        lungo[f'rendimento_{h}d'] = rendimenti[picks]
+        lungo[f'drawdown_{h}d'] = drawdown[picks]
+
+    righe, colonne = np.nonzero(picks)
+    picks_df = pd.DataFrame({'date': close.index[righe], 'ticker': close.columns[colonne], **lungo})
+    picks_df = picks_df.sort_values(['date', 'score'], ascending=[True, False]).reset_index(drop=True)
+
+    by_date = pd.DataFrame(per_data, index=close.index)[date_valide]
+    by_date = by_date.dropna(how='all')
+    return {
+        'summary': pd.DataFrame(riepilogo).set_index('orizzonte'),
+        'by_date': by_date,
+        'picks': picks_df,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest dei TOP picks per Investment_Score")
+    parser.add_argument("path", nargs="?", default=DEFAULT_OHLCV_PATH, help="storico OHLCV (CSV o Parquet)")
+    parser.add_argument("--k", type=int, default=5, help="titoli scelti per data")
+    parser.add_argument("--rebalance", type=int, default=5, help="giorni tra due selezioni")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="profilo di scoring")
+    parser.add_argument("--make-fixture", action="store_true", help="scrive uno storico sintetico in path ed esce")
+    args = parser.parse_args()
+
+    if args.make_fixture:
+        os.makedirs(os.path.dirname(args.path) or ".", exist_ok=True)
+        make_synthetic_ohlcv().to_csv(args.path, index=False)
+        print(f"Storico sintetico scritto in {args.path}")
+    else:
+        risultato = run_backtest(load_ohlcv(args.path), k=args.k, rebalance_every=args.rebalance,
+                                 profile=args.profile)
+        print(risultato['summary'].to_string(float_format=lambda v: f"{v:.4f}"))
@@ -0,0 +1,96 @@
+"""
+Convertitori numerici per i valori in formato italiano dei fogli Google.
+
+Ogni convertitore lavora su una Series intera con operazioni .str
+vettoriali e restituisce float64; le celle non convertibili diventano NaN.
+"""
+
+import pandas as pd
+
+
+# Suffisso delle colonne numeriche aggiunte accanto a quelle testuali
+SUFFISSO_NUMERICO = "_NUM"
+
+# Simboli di valuta, percentuale e spazi (anche non separabili) da ignorare
+_SIMBOLI = r"[€$£%\s ]"
+
+
+def _testo_pulito(serie):
+    """Serie come stringhe senza simboli né spazi"""
+    return serie.astype(str).str.replace(_SIMBOLI, "", regex=True)
+
+
+def _a_float(testo):
+    """Conversione finale tollerante: ciò che non è un numero diventa NaN"""
+    return pd.to_numeric(testo, errors="coerce").astype("float64")
+
+
+def _converti(serie, normalizza):
+    """Applica normalizza alle celle testuali; i numeri veri passano invariati"""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64")
+    valori = _a_float(normalizza(_testo_pulito(serie)))
+    if pd.api.types.infer_dtype(serie, skipna=True) not in ("string", "empty"):
+        # Colonna mista: le celle già numeriche non vanno ripulite dai punti
+        numeri = serie.map(lambda v: not isinstance(v, str)) & serie.notna()
+        valori = valori.where(~numeri, _a_float(serie.where(numeri)))
+    return valori
+
+
+def _euro(testo):
+    """Punti come migliaia, virgola come decimale"""
+    return testo.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+
+
+def _decimale(testo):
+    """Punti come migliaia solo se c'è anche la virgola"""
+    con_virgola = testo.str.contains(",", regex=False)
+    testo = testo.where(~con_virgola, testo.str.replace(".", "", regex=False))
+    return testo.str.replace(",", ".", regex=False)
+
+
+def parse_euro(serie):
+    """'€ 2.228,92' -> 2228.92 (il punto è sempre separatore delle migliaia)"""
+    return _converti(serie, _euro)
+
+
+def parse_decimal(serie):
+    """'1.234,5' -> 1234.5, '12,5' -> 12.5; senza virgola il punto resta decimale"""
+    return _converti(serie, _decimale)
+
+
+def parse_percent(serie):
+    """'6,68%' -> 6.68 (in punti percentuali, non frazione)"""
+    return parse_decimal(serie)
+
+
+# Registro dei convertitori usabili negli schemi (chiave "numeric")
+CONVERTERS = {
+    "euro": parse_euro,
+    "decimal": parse_decimal,
+    "percent": parse_percent,
+}
+
+
+def numeric_name(colonna):
+    """Nome della colonna numerica derivata da una colonna testuale"""
+    return f"{colonna}{SUFFISSO_NUMERICO}"
+
+
+def apply_converters(df, spec):
+    """
+    Aggiunge a df una colonna float64 per ogni colonna in spec
+
+    Args:
+        df: DataFrame (modificato in place)
+        spec: dict colonna -> chiave in CONVERTERS
+    """
+    for colonna, tipo in spec.items():
+        df[numeric_name(colonna)] = CONVERTERS[tipo](df[colonna])
+    return df
+
+
+def to_float(valore, tipo="euro", default=0.0):
+    """Converte un singolo valore (per celle isolate come i totali)"""
+    risultato = CONVERTERS[tipo](pd.Series([valore], dtype=object)).iloc[0]
+    return default if pd.isna(risultato) else float(risultato)
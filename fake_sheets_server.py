@@ -0,0 +1,237 @@
+"""
+Server locale che simula Google Sheets (export CSV) e i webhook Apps Script
+Serve a provare e misurare l'app senza rete e con dati ripetibili
+
+Uso:
+    python fake_sheets_server.py --port 8765 --latency 0.2 --scale 10
+
+    export FLUSSO_SHEETS_BASE_URL=http://127.0.0.1:8765
+    export FLUSSO_WEBHOOK_URL=http://127.0.0.1:8765/macros/s/fake/exec
+    export FLUSSO_PORTFOLIO_SUMMARY_GID=riepilogo
+    streamlit run main.py
+
+Export: GET /spreadsheets/d/<id>/export?format=csv&gid=<gid> legge
+fixtures/sheets/<gid>.csv (ETag + 304 come Google). Il gid 0 è la tabella
+delle posizioni letta dal Portfolio; il riepilogo letto da portfolio_global
+(header=None, celle fisse) è nel gid "riepilogo". Webhook: POST su
+/macros/s/<id>/exec con gli stessi payload JSON dell'app; le modifiche
+restano in memoria, i file delle fixture non vengono mai riscritti.
+
+Solo libreria standard: non richiede Streamlit né pandas.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+# ==================== CONFIGURAZIONE ====================
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sheets")
+
+# gid dei fogli modificati dai webhook (stessi valori usati dalle pagine dell'app)
+GID_TRANSAZIONI = "1594640549"
+GID_PROPOSTE = "836776830"
+GID_ORDINI = "1901209178"
+
+# gid del blocco di riepilogo del portfolio (FLUSSO_PORTFOLIO_SUMMARY_GID)
+GID_RIEPILOGO = "riepilogo"
+
+# Colonne dei votanti nel foglio Proposte
+VOTANTI = ['GALLOZ', 'STE', 'GARGIU', 'ALE', 'GIACA']
+
+# Posizione della colonna STATO nel foglio Ordini
+COLONNA_STATO_ORDINI = 5
+
+
+class FakeSheets:
+    """Fogli in memoria (lista di righe per gid) con CSV ed ETag calcolati su richiesta"""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, scale=1):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self._csv = {}
+        for nome in sorted(os.listdir(fixtures_dir)):
+            if not nome.endswith(".csv"):
+                continue
+            with open(os.path.join(fixtures_dir, nome), newline="", encoding="utf-8") as f:
+                righe = list(csv.reader(f))
+            if scale > 1 and len(righe) > 1:
+                # Righe dati ripetute per simulare fogli grandi
+                righe = righe[:1] + righe[1:] * scale
+            self.rows[nome[:-len(".csv")]] = righe
+
+    def export(self, gid):
+        """Restituisce (bytes CSV, etag) del foglio, None se il gid non esiste"""
+        with self.lock:
+            if gid not in self.rows:
+                return None
+            if gid not in self._csv:
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator="\n").writerows(self.rows[gid])
+                body = buffer.getvalue().encode("utf-8")
+                self._csv[gid] = (body, '"%s"' % hashlib.md5(body).hexdigest())
+            return self._csv[gid]
+
+    def append_row(self, gid, valori):
+        """
+        Aggiunge una riga allineata al numero di colonne dell'header, come appendRow:
+        subito dopo l'ultima riga con contenuto (occupando la prima riga vuota in coda)
+        """
+        with self.lock:
+            righe = self.rows[gid]
+            larghezza = len(righe[0]) if righe else len(valori)
+            riga = [str(v) for v in valori[:larghezza]] + [""] * (larghezza - len(valori))
+            posizione = max((i + 1 for i, r in enumerate(righe) if any(c.strip() for c in r)), default=0)
+            if posizione < len(righe):
+                righe[posizione] = riga
+            else:
+                righe.append(riga)
+            self._csv.pop(gid, None)
+            return posizione + 1
+
+    def set_cell(self, gid, row_number, colonna, valore):
+        """Scrive una cella (row_number = riga del foglio, header = 1)"""
+        with self.lock:
+            righe = self.rows[gid]
+            if not 2 <= row_number <= len(righe):
+                raise ValueError(f"Riga {row_number} inesistente")
+            riga = righe[row_number - 1]
+            riga.extend([""] * (colonna + 1 - len(riga)))
+            riga[colonna] = str(valore)
+            self._csv.pop(gid, None)
+
+    def handle_webhook(self, payload):
+        """Esegue l'azione del webhook come lo script Apps Script; restituisce (success, message)"""
+        action = payload.get("action")
+
+        if action == "vote":
+            votante = payload.get("votante")
+            if votante not in VOTANTI:
+                return False, f"Votante sconosciuto: {votante}"
+            intestazione = self.rows[GID_PROPOSTE][0]
+            colonna = intestazione.index(votante) if votante in intestazione else 15 + VOTANTI.index(votante)
+            self.set_cell(GID_PROPOSTE, int(payload["row_number"]), colonna, payload.get("voto", ""))
+            return True, f"✅ Voto di {votante} registrato"
+
+        if action == "update_stato_ordine":
+            self.set_cell(GID_ORDINI, int(payload["row_number"]), COLONNA_STATO_ORDINI, payload["stato_esecuzione"])
+            return True, f"✅ Ordine aggiornato a {payload['stato_esecuzione']}"
+
+        if "data_cronologica" in payload:
+            riga = self.append_row(GID_PROPOSTE, [
+                payload.get(campo, "") for campo in (
+                    "data_cronologica", "responsabile", "buy_sell", "strumento", "quantita",
+                    "pmc", "sl", "tp", "orizzonte", "allegato", "motivazione", "link",
+                    "immagine", "valuta",
+                )
+            ])
+            return True, f"✅ Proposta salvata (riga {riga})"
+
+        if "operazione" in payload:
+            riga = self.append_row(GID_TRANSAZIONI, [
+                payload.get(campo, "") for campo in (
+                    "data", "operazione", "strumento", "pmc", "quantita", "totale", "valuta",
+                    "tasso_cambio", "commissioni", "controvalore", "lungo_breve", "nome_strumento",
+                )
+            ])
+            return True, f"✅ Transazione salvata (riga {riga})"
+
+        return False, "Azione non riconosciuta"
+
+
+def make_handler(sheets, latency=0.0, jitter=0.0):
+    """Handler HTTP legato a un'istanza FakeSheets e alla latenza simulata"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, come Google
+
+        def _attendi(self):
+            ritardo = latency + random.uniform(0, jitter) if jitter else latency
+            if ritardo > 0:
+                time.sleep(ritardo)
+
+        def _rispondi(self, status, body=b"", content_type="application/json", headers=None):
+            self.send_response(status)
+            for nome, valore in (headers or {}).items():
+                self.send_header(nome, valore)
+            if body:
+                self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _json(self, status, dati):
+            self._rispondi(status, json.dumps(dati).encode("utf-8"))
+
+        def do_GET(self):
+            self._attendi()
+            url = urlparse(self.path)
+            if url.path.endswith("/export"):
+                gid = parse_qs(url.query).get("gid", ["0"])[0]
+                risultato = sheets.export(gid)
+                if risultato is None:
+                    self._json(404, {"error": f"gid {gid} non presente nelle fixture"})
+                    return
+                body, etag = risultato
+                if self.headers.get("If-None-Match") == etag:
+                    self._rispondi(304, headers={"ETag": etag})
+                    return
+                self._rispondi(200, body, "text/csv; charset=utf-8", {"ETag": etag})
+            elif url.path.endswith("/exec"):
+                # Il tab "Configurazione" fa una GET per verificare il webhook
+                self._json(200, {"status": "ok", "message": "Fake Apps Script attivo"})
+            else:
+                self._json(404, {"error": "percorso sconosciuto"})
+
+        def do_POST(self):
+            self._attendi()
+            lunghezza = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(lunghezza) or b"{}")
+                success, message = sheets.handle_webhook(payload)
+            except (ValueError, KeyError) as e:
+                success, message = False, f"❌ {e}"
+            self._json(200, {"success": success, "message": message})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run(host="127.0.0.1", port=8765, fixtures_dir=FIXTURES_DIR, latency=0.0, jitter=0.0, scale=1):
+    """Avvia il server (bloccante)"""
+    sheets = FakeSheets(fixtures_dir, scale)
+    server = ThreadingHTTPServer((host, port), make_handler(sheets, latency, jitter))
+    server.daemon_threads = True
+    print(f"Fake Google Sheets su http://{host}:{port} ({len(sheets.rows)} fogli, latenza {latency}s)")
+    print(f"  export FLUSSO_SHEETS_BASE_URL=http://{host}:{port}")
+    print(f"  export FLUSSO_WEBHOOK_URL=http://{host}:{port}/macros/s/fake/exec")
+    print(f"  export FLUSSO_PORTFOLIO_SUMMARY_GID={GID_RIEPILOGO}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server locale per export CSV e webhook dei fogli Google")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="cartella con i CSV <gid>.csv")
+    parser.add_argument("--latency", type=float, default=0.0, help="secondi aggiunti a ogni richiesta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="ritardo casuale extra massimo (secondi)")
+    parser.add_argument("--scale", type=int, default=1, help="ripete le righe dati N volte")
+    args = parser.parse_args()
+    run(args.host, args.port, args.fixtures, args.latency, args.jitter, args.scale)
@@ -0,0 +1,132 @@
+"""
+Indici di filtro per i DataFrame mostrati con filtri interattivi
+
+build_filter_index precalcola, una volta per versione dei dati, una
+bitmask (array bool) per ogni valore delle colonne a bassa cardinalità,
+le date come giorni interi e le colonne numeriche come array float.
+filter_mask combina le selezioni con AND/OR bit a bit senza toccare il
+DataFrame, che viene tagliato una sola volta alla fine (apply_filters).
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+def to_categoricals(df, columns):
+    """Converte in category le colonne indicate (in place), ignorando quelle assenti"""
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def build_filter_index(df, columns=(), date_column=None, numeric_columns=()):
+    """
+    Precalcola le maschere per filtrare df
+
+    Args:
+        df: DataFrame da filtrare
+        columns: colonne a bassa cardinalità (una bitmask per valore)
+        date_column: colonna datetime per i filtri per intervallo di date
+        numeric_columns: colonne numeriche per i filtri a soglia
+
+    Returns:
+        dict con n, valori per colonna (in ordine), maschere, giorni e numeri
+    """
+    n = len(df)
+    indice = {"n": n, "values": {}, "masks": {}, "days": None, "numbers": {}}
+
+    for col in columns:
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codici = serie.cat.codes.to_numpy()
+            valori = list(serie.cat.categories)
+        else:
+            codici, valori = pd.factorize(serie, sort=True)
+            valori = list(valori)
+        presenti = np.bincount(codici[codici >= 0], minlength=len(valori)) if n else np.zeros(len(valori), int)
+        indice["values"][col] = [v for v, k in zip(valori, presenti) if k]
+        indice["masks"][col] = {v: codici == i for i, v in enumerate(valori) if presenti[i]}
+
+    if date_column and date_column in df.columns:
+        # Giorni dal 1970 come interi: confronto per data senza .dt.date riga per riga
+        indice["days"] = df[date_column].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+
+    for col in numeric_columns:
+        if col in df.columns:
+            indice["numbers"][col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+
+    return indice
+
+
+def filter_mask(indice, selections=None, date_range=None, min_values=None):
+    """
+    Maschera delle righe che soddisfano tutti i filtri
+
+    Args:
+        indice: risultato di build_filter_index
+        selections: {colonna: valore o lista di valori}; vuoto/None = nessun filtro
+        date_range: (inizio, fine) inclusi, date o None
+        min_values: {colonna numerica: soglia minima inclusa}
+
+    Returns:
+        array bool lungo n
+    """
+    n = indice["n"]
+    mask = np.ones(n, dtype=bool)
+
+    for col, valori in (selections or {}).items():
+        if valori is None or (isinstance(valori, (list, tuple, set)) and not valori):
+            continue
+        if not isinstance(valori, (list, tuple, set)):
+            valori = [valori]
+        maschere = indice["masks"].get(col, {})
+        scelta = np.zeros(n, dtype=bool)
+        for valore in valori:
+            if valore in maschere:
+                scelta |= maschere[valore]
+        mask &= scelta
+
+    if date_range is not None and indice["days"] is not None:
+        inizio, fine = date_range
+        if inizio is not None:
+            mask &= indice["days"] >= np.datetime64(inizio, "D")
+        if fine is not None:
+            mask &= indice["days"] <= np.datetime64(fine, "D")
+
+    for col, soglia in (min_values or {}).items():
+        if soglia is not None and col in indice["numbers"]:
+            mask &= indice["numbers"][col] >= soglia
+
+    return mask
+
+
+def apply_filters(df, indice, **filtri):
+    """Righe di df che soddisfano i filtri (un solo taglio finale, niente copie intermedie)"""
+    return df.iloc[np.flatnonzero(filter_mask(indice, **filtri))]
+
+
+def _sola_lettura(indice):
+    """Rende non scrivibili gli array dell'indice (condiviso tra sessioni e rerun)"""
+    array = list(indice["numbers"].values())
+    for maschere in indice["masks"].values():
+        array.extend(maschere.values())
+    if indice["days"] is not None:
+        array.append(indice["days"])
+    for a in array:
+        a.setflags(write=False)
+    return indice
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def cached_filter_index(chiave, _df, columns=(), date_column=None, numeric_columns=()):
+    """
+    build_filter_index calcolato una volta per chiave (es. digest del foglio)
+
+    Restituisce lo stesso oggetto a ogni rerun, senza copiarlo: è in sola lettura
+    (filter_mask crea sempre maschere nuove e non modifica l'indice)
+    """
+    return _sola_lettura(build_filter_index(_df, columns, date_column, numeric_columns))
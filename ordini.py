@@ -4,7 +4,9 @@ import plotly.express as px
 from datetime import datetime
 import requests
 
-from portfolio import load_sheet_csv
+from portfolio import load_sheet_csv, load_sheets_csv
+from sheets import invalidate, register_sheet, patch_sheet, set_cell, resolve_webhook_url
+from converters import apply_converters, numeric_name, to_float
 
 st.set_page_config(
     page_title="Gestione Ordini",
@@ -19,21 +21,19 @@ GID_ORDINI = "1901209178"
 SPREADSHEET_ID_PORTFOLIO = "1mD9jxDJv26aZwCdIbvQVjlJGBhRwKWwQnPpPPq0ON5Y"
 GID_PORTFOLIO_STATUS = "1033121372"
 
-WEBHOOK_URL_ORDINI = "https://script.google.com/macros/s/AKfycbx_lAUdZTKFgybEbjG_6RHTf08hnXtOlLfSaSxuP7RR5-HmEKiDpjwDpJKIAayXQSjLQw/exec"
+WEBHOOK_URL_ORDINI = resolve_webhook_url("https://script.google.com/macros/s/AKfycbx_lAUdZTKFgybEbjG_6RHTf08hnXtOlLfSaSxuP7RR5-HmEKiDpjwDpJKIAayXQSjLQw/exec")
 
 
-def get_liquidita_disponibile():
-    """Carica liquidità dal Portfolio"""
+def get_liquidita_disponibile(df_liquidity=None):
+    """Carica liquidità dal Portfolio (riusa il foglio Portfolio_Status se già caricato)"""
     try:
-        df_liquidity = load_sheet_csv(SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO_STATUS)
+        if df_liquidity is None:
+            df_liquidity = load_sheet_csv(SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO_STATUS)
         df_liquidity = pd.DataFrame(
             df_liquidity.iloc[2:3, 0:4].values,
             columns=df_liquidity.iloc[1, 0:4].values
         )
-        liquidita = df_liquidity.iloc[0, 2]
-        if isinstance(liquidita, str):
-            liquidita = float(liquidita.replace('€', '').replace('.', '').replace(',', '.').strip())
-        return float(liquidita)
+        return to_float(df_liquidity.iloc[0, 2], "euro")
     except Exception as e:
         st.sidebar.error(f"Errore liquidità: {str(e)}")
         return 0.0
@@ -56,6 +56,17 @@ def aggiorna_stato_ordine_via_webhook(row_number, stato_esecuzione, webhook_url)
     except Exception as e:
         return False, f"Errore: {str(e)}"
 
+def applica_stato_ordine_in_cache(row_number, stato_esecuzione):
+    """Write-through: aggiorna subito lo STATO dell'ordine nel foglio in cache"""
+    def mutate(df):
+        # Stessa logica di ordini_app: STATO è la 6ª colonna dopo aver tolto le Unnamed
+        colonne = [c for c in df.columns if not str(c).startswith('Unnamed')]
+        if len(colonne) > 5:
+            set_cell(df, row_number, df.columns.get_loc(colonne[5]), stato_esecuzione)
+        return df
+    
+    return patch_sheet("ordini", mutate)
+
 def get_exchange_rate(from_currency, to_currency='EUR'):
     """Exchange API (200+ valute) + fallback Frankfurter"""
     if from_currency == to_currency:
@@ -98,28 +109,17 @@ def calcola_valore_ordini_attivi(df_ordini):
     ordini = df_ordini.copy()
 
     if 'N.AZIONI' in ordini.columns and 'ENTRY PRICE' in ordini.columns:
-        ordini['N.AZIONI_CLEAN'] = (
-            ordini['N.AZIONI'].astype(str)
-            .str.replace(',', '.')
-            .str.replace(' ', '')
-        )
-        ordini['ENTRY_PRICE_CLEAN'] = (
-            ordini['ENTRY PRICE'].astype(str)
-            .str.replace(',', '.')
-            .str.replace(' ', '')
-            .str.replace('€', '')
-            .str.replace('$', '')
-        )
-
-        ordini['N.AZIONI_NUM'] = pd.to_numeric(ordini['N.AZIONI_CLEAN'], errors='coerce')
-        ordini['ENTRY_PRICE_NUM'] = pd.to_numeric(ordini['ENTRY_PRICE_CLEAN'], errors='coerce')
+        # Colonne float64 create al caricamento dallo schema "ordini"
+        for colonna in ('N.AZIONI', 'ENTRY PRICE'):
+            if numeric_name(colonna) not in ordini.columns:
+                apply_converters(ordini, {colonna: "decimal"})
 
         ordini['VALUTA'] = ordini['VALUTA'].fillna('EUR').str.upper()
         ordini['EXCHANGE_RATE'] = ordini['VALUTA'].apply(lambda x: get_exchange_rate(x, 'EUR'))
 
         ordini['VALORE_EUR'] = (
-            ordini['N.AZIONI_NUM']
-            * ordini['ENTRY_PRICE_NUM']
+            ordini[numeric_name('N.AZIONI')]
+            * ordini[numeric_name('ENTRY PRICE')]
             * ordini['EXCHANGE_RATE']
         )
 
@@ -136,6 +136,10 @@ def calcola_valore_ordini_attivi(df_ordini):
 
 
 def ordini_app():
+    # Fogli tenuti aggiornati dal refresher di processo
+    register_sheet("portfolio_status", SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO_STATUS, interval=30, header=0)
+    register_sheet("ordini", SPREADSHEET_ID_ORDINI, GID_ORDINI, interval=30, header=0)
+    
     st.title("🕹️ Gestione Ordini")
     st.markdown("Monitora e gestisci gli ordini di trading approvati")
     st.markdown("---")
@@ -143,7 +147,7 @@ def ordini_app():
     # SIDEBAR
     st.sidebar.markdown("### ⚙️ Opzioni")
     if st.sidebar.button("🔄 Aggiorna Dati", type="primary"):
-        st.cache_data.clear()
+        invalidate("ordini", "portfolio_status")
         st.rerun()
     st.sidebar.markdown("---")
     st.sidebar.caption("💡 Aggiornamento automatico ogni 2 minuti")
@@ -151,8 +155,12 @@ def ordini_app():
     try:
         # CARICA DATI
         with st.spinner("Caricamento..."):
-            liquidita_disponibile = get_liquidita_disponibile()
-            df_ordini = load_sheet_csv(SPREADSHEET_ID_ORDINI, GID_ORDINI)
+            # Portfolio_Status e Ordini scaricati in parallelo
+            df_status, df_ordini = load_sheets_csv([
+                (SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO_STATUS),
+                (SPREADSHEET_ID_ORDINI, GID_ORDINI, "ordini"),
+            ])
+            liquidita_disponibile = get_liquidita_disponibile(df_status)
         
         st.sidebar.markdown("---")
         st.sidebar.markdown("### 💰 Liquidità")
@@ -162,31 +170,7 @@ def ordini_app():
             st.warning("⚠️ Nessun ordine trovato")
             st.stop()
         
-        # ⭐ RIMUOVI COLONNE VUOTE/UNNAMED PRIMA DI RINOMINARE
-        df_ordini = df_ordini.loc[:, ~df_ordini.columns.str.contains('^Unnamed', na=False)]
-        
-        # PRENDI SOLO LE PRIME 15 COLONNE
-        df_ordini = df_ordini.iloc[:, :15]
-        
-        # RINOMINA LE 14 COLONNE
-        df_ordini.columns = [
-            'DATA', 'TIME', 'COMPONENTE1', 'COMPONENTE2',
-            'VOTO A FAVORE', 'STATO', 'ASSET', 'PROPOSTA',
-            'ENTRY PRICE', 'N.AZIONI', 'VALUTA', '% SU TOT. PF.',
-            'TP', 'SL', 'TEMPO'
-        ]
-        
-        df_ordini['ROW_NUMBER'] = range(2, len(df_ordini) + 2)
-        
-        # CONVERTI DATE
-        if 'DATA' in df_ordini.columns:
-            df_ordini['DATA'] = pd.to_datetime(df_ordini['DATA'], format='%d/%m/%Y', errors='coerce', dayfirst=True)
-        
-        # GESTISCI STATO
-        df_ordini['STATO'] = df_ordini['STATO'].fillna('Attivo').replace('', 'Attivo')
-        
-        # RIMUOVI RIGHE COMPLETAMENTE VUOTE
-        df_ordini = df_ordini.dropna(how='all')
+        # Colonne, ROW_NUMBER, date e STATO di default già normalizzati dallo schema "ordini"
         df_ordini = df_ordini.sort_values('DATA', ascending=False, na_position='last').reset_index(drop=True)
         
         st.success(f"✅ {len(df_ordini)} ordini caricati")
@@ -254,7 +238,7 @@ def ordini_app():
                             success, msg = aggiorna_stato_ordine_via_webhook(ordine['ROW_NUMBER'], 'ESEGUITO', WEBHOOK_URL_ORDINI)
                             if success:
                                 st.success(msg)
-                                st.cache_data.clear()
+                                applica_stato_ordine_in_cache(ordine['ROW_NUMBER'], 'ESEGUITO')
                                 st.rerun()
                             else:
                                 st.error(msg)
@@ -263,7 +247,7 @@ def ordini_app():
                             success, msg = aggiorna_stato_ordine_via_webhook(ordine['ROW_NUMBER'], 'CANCELLATO', WEBHOOK_URL_ORDINI)
                             if success:
                                 st.success(msg)
-                                st.cache_data.clear()
+                                applica_stato_ordine_in_cache(ordine['ROW_NUMBER'], 'CANCELLATO')
                                 st.rerun()
                             else:
                                 st.error(msg)
@@ -301,7 +285,7 @@ def ordini_app():
                             success, msg = aggiorna_stato_ordine_via_webhook(ordine['ROW_NUMBER'], 'ATTIVO', WEBHOOK_URL_ORDINI)
                             if success:
                                 st.success(msg)
-                                st.cache_data.clear()
+                                applica_stato_ordine_in_cache(ordine['ROW_NUMBER'], 'ATTIVO')
                                 st.rerun()
                             else:
                                 st.error(msg)
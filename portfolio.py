@@ -5,55 +5,34 @@ import plotly.graph_objects as go
 import numpy as np
 import time
 
-@st.cache_data(ttl=30)
-def load_sheet_csv(spreadsheet_id, gid):
-    """Carica foglio pubblico via CSV export e rimuove righe vuote"""
-    
-    # ⭐ CACHE BUSTING: Aggiungi timestamp per forzare dati freschi ⭐
-    timestamp = int(time.time())
-    url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export?format=csv&gid={gid}&t={timestamp}"
+from sheets import load_sheet, load_sheets, invalidate, register_sheet
+from sheet_schema import normalize_sheet
+from converters import numeric_name
+
+
+def load_sheet_csv(spreadsheet_id, gid, schema="generico"):
+    """Carica foglio pubblico via CSV export e lo normalizza con lo schema indicato"""
+    # ⭐ Rivalidazione su hash del contenuto: se il foglio non cambia non si riparsa nulla ⭐
+    df, digest = load_sheet(spreadsheet_id, gid, max_age=30, header=0)
+    return normalize_sheet(schema, df, digest)
+
+
+def load_sheets_csv(sheets):
+    """
+    Carica più fogli in parallelo con una sola richiesta per foglio
     
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # ⭐ HEADER=0 è il default (usa prima riga come intestazioni) ⭐
-            df = pd.read_csv(url, header=0)
-            
-            if not df.empty:
-                # ⭐ RIMUOVI IMMEDIATAMENTE ULTIMA RIGA SE VUOTA ⭐
-                # Questo risolve il problema della riga vuota finale nel CSV di Google
-                while len(df) > 0:
-                    ultima_riga = df.iloc[-1]
-                    
-                    # Controlla se TUTTI i valori nell'ultima riga sono NaN o stringa vuota
-                    is_empty = all(
-                        pd.isna(val) or (isinstance(val, str) and val.strip() == '')
-                        for val in ultima_riga
-                    )
-                    
-                    if is_empty:
-                        # Ultima riga vuota, eliminala
-                        df = df.iloc[:-1]
-                    else:
-                        # Ultima riga valida, esci dal loop
-                        break
-                
-                # ⭐ PULIZIA AGGIUNTIVA: Rimuovi tutte le righe completamente vuote ⭐
-                df = df.dropna(how='all')
-                
-                # Reset index finale
-                df = df.reset_index(drop=True)
-                
-                return df
-                
-            time.sleep(1)
-            
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            time.sleep(2)
+    Args:
+        sheets: lista di (spreadsheet_id, gid) o (spreadsheet_id, gid, schema), anche ripetute
     
-    return None
+    Returns:
+        list: DataFrame normalizzati nello stesso ordine (None se il foglio è vuoto)
+    """
+    sheets = [tuple(s) if len(s) == 3 else (s[0], s[1], "generico") for s in sheets]
+    risultati = load_sheets([(sid, gid) for sid, gid, _ in sheets], max_age=30, header=0)
+    return [
+        normalize_sheet(schema, df, digest)
+        for (_, _, schema), (df, digest) in zip(sheets, risultati)
+    ]
 
 
 
@@ -71,13 +50,18 @@ def portfolio_tracker_app():
     gid_portfolio_status = 1033121372
     gid_dati = 1009022145
     
+    # Fogli tenuti aggiornati dal refresher di processo
+    register_sheet("portfolio", spreadsheet_id, gid_portfolio, interval=30, header=0)
+    register_sheet("portfolio_status", spreadsheet_id, gid_portfolio_status, interval=30, header=0)
+    register_sheet("portfolio_dati", spreadsheet_id, gid_dati, interval=30, header=0)
+    
     # Opzioni nella sidebar
     st.sidebar.markdown("### ⚙️ Opzioni Portfolio")
     show_metrics = st.sidebar.checkbox("Mostra metriche", value=False)
     show_debug = st.sidebar.checkbox("🔍 Debug: Info caricamento", value=False)
     
     if st.sidebar.button("🔄 Aggiorna Dati", type="primary"):
-        st.cache_data.clear()
+        invalidate("portfolio", "portfolio_status", "portfolio_dati")
         st.rerun()
     
     st.sidebar.markdown("---")
@@ -85,10 +69,13 @@ def portfolio_tracker_app():
     
     try:
         with st.spinner("Caricamento dati dal Google Sheet..."):
-            df = load_sheet_csv(spreadsheet_id, gid_portfolio)
-            df_status = load_sheet_csv(spreadsheet_id, gid_portfolio_status)
-            df_liquidity = load_sheet_csv(spreadsheet_id, gid_portfolio_status)
-            df_dati = load_sheet_csv(spreadsheet_id, gid_dati)
+            # ⭐ Un solo round-trip: i fogli arrivano in parallelo, Portfolio_Status una volta sola ⭐
+            df, df_status, df_liquidity, df_dati = load_sheets_csv([
+                (spreadsheet_id, gid_portfolio, "portfolio"),
+                (spreadsheet_id, gid_portfolio_status),
+                (spreadsheet_id, gid_portfolio_status),
+                (spreadsheet_id, gid_dati, "portfolio_dati"),
+            ])
         
         if df is None or df.empty:
             st.error("❌ Impossibile caricare il foglio 'Portfolio'")
@@ -103,46 +90,10 @@ def portfolio_tracker_app():
             st.stop()
         
         # ==================== FILTRAGGIO BASATO SOLO SU TICKER ====================
-        df_original_len = len(df)
-        
-        # ⭐ FILTRO UNICO: Mantieni solo righe con TICKER valido (colonna C, indice 2) ⭐
-        df_filtered = df.copy()
-        
-        # Step 1: Rimuovi righe completamente vuote
-        df_filtered = df_filtered.dropna(how='all')
-        
-        # Step 2: Rimuovi righe dove tutte le celle sono stringhe vuote
-        mask_non_vuote = df_filtered.apply(
-            lambda row: any(pd.notna(val) and str(val).strip() != '' for val in row), 
-            axis=1
-        )
-        df_filtered = df_filtered[mask_non_vuote]
-        
-        # Step 3: FILTRO PRINCIPALE - Mantieni solo righe con TICKER valido
-        if len(df_filtered.columns) >= 3:
-            ticker_col = df_filtered.iloc[:, 2]  # Colonna C (TICKER)
-            
-            # Ticker deve essere non-nullo e non-vuoto
-            mask_ticker = ticker_col.notna() & (ticker_col.astype(str).str.strip() != '')
-            df_filtered = df_filtered[mask_ticker]
-        
-        # Step 4: Reset index
-        df_filtered = df_filtered.reset_index(drop=True)
-        
-        # Step 5: Controllo finale - Rimuovi ultima riga se ancora vuota (loop sicuro)
-        while len(df_filtered) > 0:
-            ultima_riga = df_filtered.iloc[-1]
-            
-            # Controlla se il ticker dell'ultima riga è vuoto
-            ticker_ultima = str(ultima_riga.iloc[2] if len(ultima_riga) > 2 else '').strip()
-            
-            if ticker_ultima == '' or pd.isna(ultima_riga.iloc[2] if len(ultima_riga) > 2 else None):
-                # Ultima riga senza ticker, rimuovila
-                df_filtered = df_filtered.iloc[:-1]
-                df_filtered = df_filtered.reset_index(drop=True)
-            else:
-                # Ultima riga con ticker valido, esci
-                break
+        # ⭐ Righe senza TICKER (colonna C) già scartate dallo schema "portfolio" ⭐
+        df_filtered = df
+        df_original_len = df.attrs.get('righe_originali', len(df))
+        colonna_valore = numeric_name(df.columns[8]) if len(df.columns) >= 9 else None
         
         removed_total = df_original_len - len(df_filtered)
         
@@ -202,9 +153,7 @@ def portfolio_tracker_app():
                 df_chart = df_filtered.iloc[:, [3, 8]].copy()  # NAME (D) e VALUE (I)
                 df_chart.columns = ['NAME', 'VALUE']
                 
-                # Converti VALUE in numerico
-                df_chart['VALUE_CLEAN'] = df_chart['VALUE'].astype(str).str.replace('€', '').str.replace('.', '').str.replace(',', '.').str.strip()
-                df_chart['VALUE_NUMERIC'] = pd.to_numeric(df_chart['VALUE_CLEAN'], errors='coerce')
+                df_chart['VALUE_NUMERIC'] = df_filtered[colonna_valore]  # float64 già convertito al caricamento
                 df_chart = df_chart[df_chart['VALUE_NUMERIC'] > 0].dropna()
                 
                 if len(df_chart) > 0:
@@ -249,8 +198,7 @@ def portfolio_tracker_app():
                     df_asset_type.columns = ['ASSET', 'VALUE']
                     df_asset_type = df_asset_type[df_asset_type['ASSET'].notna() & (df_asset_type['ASSET'].astype(str).str.strip() != '')]
                     
-                    df_asset_type['VALUE_CLEAN'] = df_asset_type['VALUE'].astype(str).str.replace('€', '').str.replace('.', '').str.replace(',', '.').str.strip()
-                    df_asset_type['VALUE_NUMERIC'] = pd.to_numeric(df_asset_type['VALUE_CLEAN'], errors='coerce')
+                    df_asset_type['VALUE_NUMERIC'] = df_filtered[colonna_valore]  # float64 già convertito al caricamento
                     df_asset_type = df_asset_type[df_asset_type['VALUE_NUMERIC'] > 0].dropna()
                     
                     if len(df_asset_type) > 0:
@@ -295,8 +243,7 @@ def portfolio_tracker_app():
                     df_pos_value.columns = ['LUNGO/BREVE', 'VALUE']
                     df_pos_value = df_pos_value[df_pos_value['LUNGO/BREVE'].notna() & (df_pos_value['LUNGO/BREVE'].astype(str).str.strip() != '')]
                     
-                    df_pos_value['VALUE_CLEAN'] = df_pos_value['VALUE'].astype(str).str.replace('€', '').str.replace('.', '').str.replace(',', '.').str.strip()
-                    df_pos_value['VALUE_NUMERIC'] = pd.to_numeric(df_pos_value['VALUE_CLEAN'], errors='coerce')
+                    df_pos_value['VALUE_NUMERIC'] = df_filtered[colonna_valore]  # float64 già convertito al caricamento
                     df_pos_value = df_pos_value[df_pos_value['VALUE_NUMERIC'] > 0].dropna()
                     
                     if len(df_pos_value) > 0:
@@ -341,17 +288,15 @@ def portfolio_tracker_app():
             st.subheader("📈 P&L - Historical Data")
             
             try:
-                df_chart_data = df_dati.iloc[:, [9, 2]].copy()
-                df_chart_data.columns = ['Data', 'P&L%']
+                # P&L% (colonna C) già convertito in float64 dallo schema "portfolio_dati"
+                df_chart_data = pd.DataFrame({
+                    'Data': df_dati.iloc[:, 9],
+                    'P&L%': df_dati[numeric_name(df_dati.columns[2])],
+                })
                 
                 df_chart_data['Data'] = pd.to_datetime(df_chart_data['Data'], errors='coerce')
                 df_chart_data = df_chart_data.dropna(subset=['Data'])
                 df_chart_data = df_chart_data[df_chart_data['Data'] >= '2025-01-01']
-                
-                if df_chart_data['P&L%'].dtype == 'object':
-                    df_chart_data['P&L%'] = df_chart_data['P&L%'].astype(str).str.replace('%', '').str.replace(',', '.').str.strip()
-                
-                df_chart_data['P&L%'] = pd.to_numeric(df_chart_data['P&L%'], errors='coerce')
                 df_chart_data = df_chart_data.dropna()
                 df_chart_data = df_chart_data.sort_values('Data')
                 
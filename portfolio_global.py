@@ -3,44 +3,24 @@ Modulo globale per leggere e condividere i dati del Portfolio
 COMPLETAMENTE ISOLATO - Non interferisce con altre funzionalità
 """
 
+import os
+
 import streamlit as st
 import pandas as pd
-import requests
-from io import StringIO
 from datetime import datetime
 
+from sheets import read_sheet_csv, mark_sheets_stale
+from converters import parse_euro, to_float
+
 
 # ==================== CONFIGURAZIONE ====================
 SPREADSHEET_ID_PORTFOLIO = "1mD9jxDJv26aZwCdIbvQVjlJGBhRwKWwQnPpPPq0ON5Y"
-GID_PORTFOLIO = "0"
+# Foglio con il blocco di riepilogo (DEPOSIT, VALUE €, ... / liquidità); configurabile
+# per puntarlo a un foglio dedicato, es. quello del server di prova
+GID_PORTFOLIO = os.environ.get("FLUSSO_PORTFOLIO_SUMMARY_GID", "0")
 
 
 # ==================== FUNZIONI INTERNE (NON ESPORTATE) ====================
-def _parse_euro_value(value):
-    """Converte un valore in formato '€ 2.228,92' in float"""
-    if pd.isna(value) or value == '':
-        return 0.0
-    
-    try:
-        value_str = str(value).replace('€', '').replace(' ', '').strip()
-        value_str = value_str.replace('.', '').replace(',', '.')
-        return float(value_str)
-    except:
-        return 0.0
-
-
-def _parse_percent_value(value):
-    """Converte un valore in formato '6,68%' in float"""
-    if pd.isna(value) or value == '':
-        return 0.0
-    
-    try:
-        value_str = str(value).replace('%', '').replace(',', '.').strip()
-        return float(value_str)
-    except:
-        return 0.0
-
-
 @st.cache_data(ttl=120, show_spinner=False)
 def _load_portfolio_from_sheets():
     """
@@ -48,23 +28,17 @@ def _load_portfolio_from_sheets():
     NON chiamare direttamente - usa get_portfolio_data()
     """
     try:
-        url = f"https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID_PORTFOLIO}/export?format=csv&gid={GID_PORTFOLIO}"
-        
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            return None
-        
-        df = pd.read_csv(StringIO(response.text), header=None)
+        df = read_sheet_csv(SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO, header=None)
         
         # Parsing sicuro - se il formato cambia, ritorna valori di default
         try:
-            deposit = _parse_euro_value(df.iloc[1, 0])
-            value_eur = _parse_euro_value(df.iloc[1, 1])
-            pl_percent = _parse_percent_value(df.iloc[1, 2])
-            pl_tot = _parse_euro_value(df.iloc[1, 3])
-            commission_tax = _parse_euro_value(df.iloc[4, 0])
-            cash_disp = _parse_euro_value(df.iloc[4, 2])
-            cash_indisp = _parse_euro_value(df.iloc[4, 3])
+            # Tutte le celle in euro convertite in un solo passaggio (vuote -> 0.0)
+            celle_euro = pd.Series([df.iloc[1, 0], df.iloc[1, 1], df.iloc[1, 3],
+                                    df.iloc[4, 0], df.iloc[4, 2], df.iloc[4, 3]], dtype=object)
+            deposit, value_eur, pl_tot, commission_tax, cash_disp, cash_indisp = (
+                parse_euro(celle_euro).fillna(0.0).tolist()
+            )
+            pl_percent = to_float(df.iloc[1, 2], "percent")
         except:
             # Se parsing fallisce, ritorna valori nulli senza crashare
             return None
@@ -308,6 +282,7 @@ def refresh_portfolio_data():
     Da usare insieme a st.cache_data.clear() se necessario
     """
     try:
+        mark_sheets_stale([(SPREADSHEET_ID_PORTFOLIO, GID_PORTFOLIO)])
         _load_portfolio_from_sheets.clear()
         return get_portfolio_data(silent=True)
     except:
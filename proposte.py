@@ -5,26 +5,15 @@ import plotly.graph_objects as go
 from datetime import datetime
 import requests
 
+from sheets import load_sheet, invalidate, register_sheet, patch_sheet, set_cell, append_row, resolve_webhook_url
+from sheet_schema import COLONNE_PROPOSTE, normalize_sheet
+
 
-@st.cache_data(ttl=120)
 def load_sheet_csv_proposte(spreadsheet_id, gid):
-    """Carica foglio pubblico via CSV export"""
-    url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export?format=csv&gid={gid}"
-    
-    import time
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            df = pd.read_csv(url)
-            if not df.empty:
-                return df
-            time.sleep(1)
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            time.sleep(2)
-    
-    return None
+    """Carica foglio pubblico via CSV export (rivalidato ogni 2 minuti) e lo normalizza"""
+    df, digest = load_sheet(spreadsheet_id, gid, max_age=120)
+    return normalize_sheet("proposte", df, digest)
+
 
 def get_exchange_rate(from_currency, to_currency='EUR'):
     """Exchange API (200+ valute) + fallback Frankfurter"""
@@ -125,6 +114,18 @@ def vote_proposta_via_webhook(row_number, votante, voto, webhook_url):
         return False, f"Errore imprevisto: {str(e)}"
 
 
+def applica_proposta_in_cache(proposta_data):
+    """Write-through: aggiunge subito la nuova proposta al foglio in cache"""
+    valori = [proposta_data.get(col, '') for col in COLONNE_PROPOSTE[:COLONNE_PROPOSTE.index('VALUTA') + 1]]
+    return patch_sheet("proposte", lambda df: append_row(df, valori))
+
+
+def applica_voto_in_cache(row_number, votante, voto):
+    """Write-through: registra subito il voto nel foglio in cache"""
+    colonna = COLONNE_PROPOSTE.index(votante)
+    return patch_sheet("proposte", lambda df: set_cell(df, row_number, colonna, voto))
+
+
 def proposte_app():
     """Applicazione Gestione Proposte"""
     
@@ -134,16 +135,17 @@ def proposte_app():
     # ID del foglio Google Sheets
     spreadsheet_id = "1WEt_YQCASRr5EWFk77DbBI6DcOIw2ifRIMlzAaG58uY"
     gid_proposte = "836776830"
+    register_sheet("proposte", spreadsheet_id, gid_proposte, interval=120)
     
     # ==================== CONFIGURAZIONE WEBHOOK ====================
-    WEBHOOK_URL = "https://script.google.com/macros/s/AKfycbwPSIjUt9gAYh0EY1vuoqEgyqQTSxxUrQgjGZqGrOFx4BWDeWbZCwcThGlivJsHznkD/exec"
+    WEBHOOK_URL = resolve_webhook_url("https://script.google.com/macros/s/AKfycbwPSIjUt9gAYh0EY1vuoqEgyqQTSxxUrQgjGZqGrOFx4BWDeWbZCwcThGlivJsHznkD/exec")
     
     # Opzioni sidebar
     st.sidebar.markdown("### ⚙️ Opzioni Proposte")
     
     # Bottone refresh
     if st.sidebar.button("🔄 Aggiorna Proposte", type="primary"):
-        st.cache_data.clear()
+        invalidate("proposte")
         st.rerun()
     
     st.sidebar.markdown("---")
@@ -162,51 +164,10 @@ def proposte_app():
             st.info("💡 Verifica che il foglio sia pubblico")
             st.stop()
         
-        # Definisci i nomi delle colonne attese
-        expected_columns = [
-            'DATA', 'RESPONSABILE', 'OPERAZIONE', 'STRUMENTO', 'QUANTITA',
-            'PMC', 'SL', 'TP', 'ORIZZONTE TEMPORALE', 'ALLEGATO',
-            'MOTIVAZIONE', 'LINK', 'IMMAGINE', 'VALUTA', 'ESITO',
-            'GALLOZ', 'STE', 'GARGIU', 'ALE', 'GIACA'
-        ]
-        
-        if len(df_proposte.columns) >= 20:
-            df_proposte.columns = expected_columns
-        else:
+        # Colonne, ROW_NUMBER, date, ESITO e righe vuote già normalizzati dallo schema "proposte"
+        if 'GIACA' not in df_proposte.columns:
             st.warning(f"⚠️ Il foglio ha {len(df_proposte.columns)} colonne, ne servono 20")
         
-        # Aggiungi colonna numero riga (per identificare la proposta nel voto)
-        df_proposte['ROW_NUMBER'] = range(2, len(df_proposte) + 2)  # +2 perché riga 1 è header
-        
-        # Converti date
-        df_proposte['DATA'] = df_proposte['DATA'].astype(str).str.replace(
-            r'(\d{2})\.(\d{2})\.(\d{2})',
-            r'\1:\2:\3',
-            regex=True
-        )
-        
-        df_proposte['DATA'] = pd.to_datetime(
-            df_proposte['DATA'],
-            format='%d/%m/%Y %H:%M:%S',
-            errors='coerce',
-            dayfirst=True
-        )
-        
-        df_proposte['ORIZZONTE TEMPORALE'] = pd.to_datetime(
-            df_proposte['ORIZZONTE TEMPORALE'],
-            format='%d/%m/%Y',
-            errors='coerce',
-            dayfirst=True
-        )
-        
-        # Converti ESITO in numerico INTERO
-        df_proposte['ESITO'] = pd.to_numeric(df_proposte['ESITO'], errors='coerce').astype('Int64')
-        
-        # Rimuovi righe vuote
-        colonne_chiave = ['STRUMENTO', 'OPERAZIONE', 'RESPONSABILE']
-        mask_valide = df_proposte[colonne_chiave].notna().any(axis=1)
-        df_proposte = df_proposte[mask_valide]
-        
         # Ordina per data decrescente
         df_proposte = df_proposte.sort_values(
             'DATA',
@@ -331,7 +292,7 @@ def proposte_app():
         # ⭐ NASCONDI COLONNE SPECIFICHE ⭐
         colonne_nascoste = [
             'ROW_NUMBER', 'ALLEGATO', 'MOTIVAZIONE', 'LINK', 'IMMAGINE',
-            'GALLOZ', 'STE', 'GARGIU', 'ALE', 'GIACA']
+            'GALLOZ', 'STE', 'GARGIU', 'ALE', 'GIACA', 'QUANTITA_NUM', 'PMC_NUM']
         
         # Seleziona solo le colonne da mostrare
         cols_to_display = [col for col in df_display.columns if col not in colonne_nascoste]
@@ -382,9 +343,10 @@ def proposte_app():
                 st.write(f"**TP:** {proposta['TP']}")
                 st.write(f"**Valuta:** {proposta['VALUTA']}")
                 try:
-                    quantita_val = float(str(proposta['QUANTITA']).replace(',', '.'))
-                    pmc_val = float(str(proposta['PMC']).replace(',', '.'))
-                    valore_totale = quantita_val * pmc_val
+                    # QUANTITA_NUM e PMC_NUM convertiti al caricamento dallo schema "proposte"
+                    valore_totale = proposta['QUANTITA_NUM'] * proposta['PMC_NUM']
+                    if pd.isna(valore_totale):
+                        raise ValueError("Quantità o PMC non numerici")
                     if proposta['VALUTA'] != "EUR":
                         exchange_rate = get_exchange_rate(proposta['VALUTA'], 'EUR')
                         valore_eur = valore_totale * exchange_rate
@@ -553,7 +515,7 @@ def proposte_app():
                 if success:
                     st.success(f"✅ {message}")
                     st.balloons()
-                    st.cache_data.clear()
+                    applica_proposta_in_cache(new_proposta)
                     st.info("🔄 Torna al tab 'Visualizza Proposte' e clicca 'Aggiorna'")
                 else:
                     st.error(f"❌ {message}")
@@ -609,9 +571,10 @@ def proposte_app():
                     st.write(f"**PMC:** {proposta['PMC']}")
                     st.write(f"**Valuta:** {proposta['VALUTA']}")
                     try:
-                        quantita_val = float(str(proposta['QUANTITA']).replace(',', '.'))
-                        pmc_val = float(str(proposta['PMC']).replace(',', '.'))
-                        valore_totale = quantita_val * pmc_val
+                        # QUANTITA_NUM e PMC_NUM convertiti al caricamento dallo schema "proposte"
+                        valore_totale = proposta['QUANTITA_NUM'] * proposta['PMC_NUM']
+                        if pd.isna(valore_totale):
+                            raise ValueError("Quantità o PMC non numerici")
                         if proposta['VALUTA'] != "EUR":
                             exchange_rate = get_exchange_rate('EUR', proposta['VALUTA'])
                             valore_eur = valore_totale / exchange_rate
@@ -656,7 +619,7 @@ def proposte_app():
                             )
                         if success:
                             st.success(message)
-                            st.cache_data.clear()
+                            applica_voto_in_cache(proposta['ROW_NUMBER'], votante, 'x')
                             st.rerun()
                         else:
                             st.error(message)
@@ -672,7 +635,7 @@ def proposte_app():
                             )
                         if success:
                             st.success(message)
-                            st.cache_data.clear()
+                            applica_voto_in_cache(proposta['ROW_NUMBER'], votante, 'o')
                             st.rerun()
                         else:
                             st.error(message)
@@ -0,0 +1,211 @@
+"""
+Profili di scoring dello screener definiti come dati (JSON, o YAML se PyYAML è installato)
+
+Un profilo elenca i fattori con la colonna di input, le fasce (soglie e punti)
+e il peso. compile_profile lo trasforma una volta sola in valutatori vettoriali
+(np.select sull'intera colonna); score_profiles valuta più profili sullo stesso
+DataFrame in un solo passaggio, calcolando ogni fattore condiviso una volta.
+
+Formato di un fattore:
+    {"name": "RSI_Score", "column": "RSI", "weight": 0.20,
+     "bands": [{"gte": 50, "lte": 70, "points": 10}, ...], "default": 1}
+
+- column: nome o lista di nomi alternativi (vale il primo presente)
+- minus: colonna sottratta al valore (es. MACD - signal)
+- bands: valutate in ordine, vince la prima che corrisponde (gt/gte/lt/lte)
+- terms: in alternativa alle fasce, somma di confronti tra colonne
+  [{"left": "close", "op": "gt", "right": "SMA50", "points": 5}, ...]
+- missing: punti se un input è NaN (default 0)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+
+# ==================== CONFIGURAZIONE ====================
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_profiles")
+
+# Profilo che produce Investment_Score e le colonne *_Score mostrate nell'app
+DEFAULT_PROFILE = "momentum_2_4w"
+
+_OPERATORI = {
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+}
+
+
+def score_column(profile_name):
+    """Colonna con il punteggio 0-100 di un profilo non primario (il primario è Investment_Score)"""
+    return f"Score_{profile_name}"
+
+
+def load_profile(path):
+    """Legge un profilo da file JSON o YAML"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if not YAML_AVAILABLE:
+                raise ImportError(f"PyYAML non installato: impossibile leggere {path}")
+            profile = yaml.safe_load(f)
+        else:
+            profile = json.load(f)
+    profile.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return profile
+
+
+def _chiave(spec):
+    """Chiave canonica di un fattore (senza nome e peso) per condividerne il calcolo"""
+    return json.dumps({k: v for k, v in spec.items() if k not in ("name", "weight")}, sort_keys=True)
+
+
+def _input(spec_colonna, colonne):
+    """Array float64 della prima colonna presente (NaN se nessuna)"""
+    nomi = [spec_colonna] if isinstance(spec_colonna, str) else list(spec_colonna)
+    for nome in nomi:
+        if nome in colonne:
+            return colonne[nome]
+    return None
+
+
+def _compila_fattore(spec):
+    """Restituisce una funzione colonne -> array dei punti del fattore"""
+    missing = spec.get("missing", 0)
+
+    if "terms" in spec:
+        termini = [
+            (t["left"], _OPERATORI[t["op"]], t["right"], t["points"])
+            for t in spec["terms"]
+        ]
+        richieste = spec.get("requires") or sorted(
+            {t[0] for t in termini} | {t[2] for t in termini if isinstance(t[2], str)}
+        )
+
+        def valuta(colonne, n):
+            valori = {nome: _input(nome, colonne) for nome in richieste}
+            if any(v is None for v in valori.values()):
+                return np.full(n, missing)
+            totale = 0
+            for left, op, right, points in termini:
+                destra = valori[right] if isinstance(right, str) else right
+                totale = totale + points * op(valori[left], destra)
+            mancanti = np.logical_or.reduce([np.isnan(v) for v in valori.values()])
+            return np.where(mancanti, missing, totale)
+
+        return valuta
+
+    fasce = spec["bands"]
+    default = spec.get("default", 0)
+
+    def valuta(colonne, n):
+        x = _input(spec["column"], colonne)
+        if x is None:
+            return np.full(n, missing)
+        if "minus" in spec:
+            y = _input(spec["minus"], colonne)
+            x = x - y if y is not None else np.full(n, np.nan)
+        condizioni = [np.isnan(x)]
+        for fascia in fasce:
+            condizione = np.ones(n, dtype=bool)
+            for op, funzione in _OPERATORI.items():
+                if op in fascia:
+                    condizione &= funzione(x, fascia[op])
+            condizioni.append(condizione)
+        return np.select(condizioni, [missing] + [f["points"] for f in fasce], default=default)
+
+    return valuta
+
+
+def compile_profile(profile):
+    """Compila un profilo: fattori con peso, valutatori e punteggio massimo"""
+    fattori = [
+        {"name": spec["name"], "weight": spec["weight"], "key": _chiave(spec), "evaluate": _compila_fattore(spec)}
+        for spec in profile["factors"]
+    ]
+    # Normalizzazione 0-100: punti massimi per fattore × somma dei pesi
+    max_score = profile.get("max_points", 10) * sum(f["weight"] for f in fattori)
+    colonne = set()
+    for spec in profile["factors"]:
+        for campo in ("column", "minus"):
+            if campo in spec:
+                colonne.update([spec[campo]] if isinstance(spec[campo], str) else spec[campo])
+        for termine in spec.get("terms", []):
+            colonne.add(termine["left"])
+            if isinstance(termine["right"], str):
+                colonne.add(termine["right"])
+    return {
+        "name": profile["name"],
+        "label": profile.get("label", profile["name"]),
+        "factors": fattori,
+        "max_score": max_score,
+        "columns": colonne,
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def get_scoring_profiles(directory=PROFILES_DIR):
+    """Profili compilati una volta per processo, in ordine con quello di default per primo"""
+    profili = {}
+    for nome in sorted(os.listdir(directory)):
+        if nome.endswith((".json", ".yaml", ".yml")):
+            compilato = compile_profile(load_profile(os.path.join(directory, nome)))
+            profili[compilato["name"]] = compilato
+    ordine = sorted(profili, key=lambda nome: nome != DEFAULT_PROFILE)
+    return [profili[nome] for nome in ordine]
+
+
+def score_profiles(df, profiles, primary=None):
+    """
+    Valuta uno o più profili compilati sullo stesso DataFrame in un solo passaggio
+
+    Args:
+        df: DataFrame dello screener
+        profiles: lista di profili compilati (compile_profile / get_scoring_profiles)
+        primary: profilo che scrive Investment_Score e le colonne dei fattori
+                 (default: il primo della lista)
+
+    Returns:
+        Copia di df con Investment_Score, i *_Score del profilo primario
+        e una colonna Score_<profilo> per ogni altro profilo
+    """
+    scored_df = df.copy()
+    n = len(scored_df)
+    primary = primary or profiles[0]["name"]
+
+    # Inizializza il punteggio
+    scored_df['Investment_Score'] = 0.0
+
+    # Ogni colonna di input convertita una volta, ogni fattore valutato una volta
+    richieste = set().union(*(p["columns"] for p in profiles))
+    colonne = {
+        nome: pd.to_numeric(scored_df[nome], errors='coerce').to_numpy(dtype=float)
+        for nome in richieste if nome in scored_df.columns
+    }
+    punti = {}
+
+    for profile in profiles:
+        score = np.zeros(n)
+        for fattore in profile["factors"]:
+            if fattore["key"] not in punti:
+                punti[fattore["key"]] = fattore["evaluate"](colonne, n)
+            if profile["name"] == primary:
+                scored_df[fattore["name"]] = punti[fattore["key"]]
+            score += punti[fattore["key"]] * fattore["weight"]
+
+        score = np.round((score / profile["max_score"]) * 100, 1)
+        if profile["name"] == primary:
+            scored_df['Investment_Score'] = score
+        else:
+            scored_df[score_column(profile["name"])] = score
+
+    return scored_df
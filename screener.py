@@ -1,4 +1,5 @@
 import streamlit as st
+import os
 import pandas as pd
 import time
 from tradingview_screener import Query, Column
@@ -12,6 +13,13 @@ import random
 from typing import List, Dict
 import re
 from ai_agent import call_groq_api, escape_markdown_latex
+from scoring import get_scoring_profiles, score_profiles, score_column, DEFAULT_PROFILE
+from tv_data import (MARKETS, MAX_UNIVERSE_ROWS, clear_query_cache, fan_out, fetch_tickers,
+                     get_market_latency, iter_query_pages, query_fingerprint, shared_query)
+from screener_history import append_snapshot, score_history
+from screener_cube import build_screener_cube, cube_metrics, cube_options, sector_performance, slice_cube
+from filter_index import apply_filters, build_filter_index, to_categoricals
+from backtest import DEFAULT_OHLCV_PATH, load_ohlcv, run_backtest
 from fpdf import FPDF
 
 def generate_pdf_report(title, content, filename_prefix):
@@ -88,6 +96,49 @@ def format_percentage(value):
         return "N/A"
     return f"{value:.2f}%"
 
+# Etichette del rating tecnico (soglie su Recommend.All, come format_technical_rating)
+RATING_LABELS = ['🔴 Strong Sell', '🔴 Sell', '🟡 Neutral', '🟢 Buy', '🟢 Strong Buy', 'N/A']
+
+def format_technical_ratings(ratings):
+    """Versione vettoriale di format_technical_rating: Series categoriale"""
+    valori = ratings.to_numpy(dtype=float)
+    etichette = np.select(
+        [np.isnan(valori), valori >= 0.5, valori >= 0.1, valori >= -0.1, valori >= -0.5],
+        ['N/A', '🟢 Strong Buy', '🟢 Buy', '🟡 Neutral', '🔴 Sell'],
+        default='🔴 Strong Sell'
+    )
+    return pd.Series(pd.Categorical(etichette, categories=RATING_LABELS), index=ratings.index)
+
+def format_currencies(values, currency='$'):
+    """Versione vettoriale di format_currency (solo per le righe da mostrare)"""
+    valori = values.to_numpy(dtype=float)
+    scale = np.select([valori >= 1e12, valori >= 1e9, valori >= 1e6], [1e12, 1e9, 1e6], default=1.0)
+    suffissi = np.select([valori >= 1e12, valori >= 1e9, valori >= 1e6], ['T', 'B', 'M'], default='')
+    testo = pd.Series(valori / scale, index=values.index).map('{:.2f}'.format)
+    return (currency + testo + suffissi).where(values.notna(), 'N/A')
+
+def format_percentages(values):
+    """Versione vettoriale di format_percentage"""
+    return values.map('{:.2f}%'.format).where(values.notna(), 'N/A')
+
+# Colonne testuali per le card, calcolate solo sulle righe mostrate
+DISPLAY_TEXT_COLUMNS = {
+    'Market Cap': ('market_cap_basic', format_currencies),
+    'Change %': ('change', format_percentages),
+    'Volume': ('volume', lambda v: format_currencies(v, '')),
+    'Volatility %': ('Volatility.D', format_percentages),
+    'Perf Week %': ('Perf.W', format_percentages),
+    'Perf Month %': ('Perf.1M', format_percentages),
+}
+
+def format_display_columns(df):
+    """Copia di una porzione del frame con le colonne formattate come testo (card, report AI)"""
+    df = df.copy()
+    for nome, (sorgente, formatter) in DISPLAY_TEXT_COLUMNS.items():
+        if sorgente in df.columns:
+            df[nome] = formatter(df[sorgente])
+    return df
+
 def calculate_investment_score(df):
     """
     Calcola un punteggio di investimento per ogni azione basato su:
@@ -95,284 +146,346 @@ def calculate_investment_score(df):
     - Trend (prezzo vs medie mobili)
     - Volatilità controllata
     - Raccomandazioni tecniche
-    - Volume relativo
-    """
-    scored_df = df.copy()
+    - Capitalizzazione
     
-    # Inizializza il punteggio
-    scored_df['Investment_Score'] = 0.0
+    Fasce e pesi sono nel profilo scoring_profiles/momentum_2_4w.json,
+    compilato una volta in valutatori vettoriali (vedi scoring.py)
+    """
+    profili = [p for p in get_scoring_profiles() if p["name"] == DEFAULT_PROFILE]
+    return score_profiles(df, profili)
+
+def get_tradingview_url(symbol):
+    """Generate TradingView URL for a given symbol"""
+    if ':' in symbol:
+        clean_symbol = symbol.split(':')[1]
+    else:
+        clean_symbol = symbol
+    # Ritorna SOLO l'URL (senza HTML)
+    return f"https://www.tradingview.com/chart/?symbol={symbol}"
     
-    # 1. RSI Score (peso 20%) - preferenza per RSI tra 50-70 (momentum positivo ma non ipercomprato)
-    def rsi_score(rsi):
-        if pd.isna(rsi):
-            return 0
-        if 50 <= rsi <= 70:
-            return 10  # Zona ottimale
-        elif 40 <= rsi < 50:
-            return 7  # Buona
-        elif 30 <= rsi < 40:
-            return 5  # Accettabile
-        elif rsi > 80:
-            return 2  # Ipercomprato
-        else:
-            return 1  # Troppo basso
+def build_screener_query():
+    """Query TradingView dello screener (mercati, colonne per lo scoring, filtri e ordinamento)"""
+    return (
+        Query()
+        .set_markets(*MARKETS)
+        .select('name', 'description', 'country', 'sector', 'currency', 'close', 'change', 'volume',
+               'market_cap_basic', 'RSI', 'MACD.macd', 'MACD.signal', 'SMA50', 'SMA200',
+               'Volatility.D', 'Recommend.All', 'float_shares_percent_current',
+               'relative_volume_10d_calc', 'price_earnings_ttm', 'earnings_per_share_basic_ttm',
+               'Perf.W', 'Perf.1M')
+        .where(
+            Column('type').isin(['stock','etf']),
+            Column('is_primary') == True,
+            Column('market_cap_basic').between(10_000_000_000, 200_000_000_000_000),
+            Column('close') > Column('SMA50'),
+            Column('close') > Column('SMA100'),
+            Column('close') > Column('SMA200'),
+            Column('RSI').between(30, 80),
+            Column('MACD.macd') > Column('MACD.signal'),
+            Column('Volatility.D') > 0.2,
+            Column('Recommend.All') > 0.1,
+            Column('relative_volume_10d_calc') > 0.7,
+            Column('float_shares_percent_current') > 0.3,
+        )
+        .order_by('market_cap_basic', ascending=False)
+    )
+
+def prepare_screener_frame(df):
+    """Scoring e colonne formattate per una porzione di risultati (anche una singola pagina)"""
+    if df.empty:
+        return df
     
-    scored_df['RSI_Score'] = scored_df['RSI'].apply(rsi_score)
-    scored_df['Investment_Score'] += scored_df['RSI_Score'] * 0.20
+    # Tutti i profili di scoring in un passaggio (Investment_Score = profilo di default)
+    df = score_profiles(df, get_scoring_profiles())
+    # ⭐ Colonne numeriche: la formattazione si fa solo in visualizzazione ⭐
+    df['Rating'] = format_technical_ratings(df['Recommend.All'])
+    to_categoricals(df, ['country', 'sector', 'currency'])
+    df['Price'] = df['close'].round(2)
+    df['TradingView_URL'] = "https://www.tradingview.com/chart/?symbol=" + df['name'].astype(str)
     
-    # 2. MACD Score (peso 15%) - MACD sopra signal line è positivo
-    def macd_score(macd, signal):
-        if pd.isna(macd) or pd.isna(signal):
-            return 0
-        diff = macd - signal
-        if diff > 0.05:
-            return 10
-        elif diff > 0:
-            return 7
-        elif diff > -0.05:
-            return 4
-        else:
-            return 1
+    return df.rename(columns={
+        'name': 'Symbol',
+        'description': 'Company',
+        'country': 'Country',
+        'sector': 'Sector',
+        'currency': 'Currency'
+    })
+
+def _screener_top(query):
+    """Primi 200 titoli per capitalizzazione: (DataFrame, {mercato: errore})"""
+    # ⭐ Una richiesta per mercato in parallelo: i primi 200 di ogni mercato
+    # contengono sicuramente i primi 200 globali per capitalizzazione ⭐
+    _, df, errori = fan_out(query.limit(200))
+    if not df.empty:
+        df = df.sort_values('market_cap_basic', ascending=False).head(200).reset_index(drop=True)
+        df = prepare_screener_frame(df)
+    df.attrs['fetched_at'] = datetime.now()
+    # Solo chi scarica davvero salva lo storico (le sessioni in attesa riusano il risultato)
+    append_snapshot(df, df.attrs['fetched_at'])
+    return df, errori
+
+def _screener_universe(query, on_page=None):
+    """Tutti i risultati a pagine: (DataFrame, errori) con i parziali se una pagina fallisce"""
+    # ⭐ Ogni pagina è già scorata quando arriva, la UI vede i risultati parziali ⭐
+    pagine = {}
+    errori = {}
+    try:
+        for offset, total, page in iter_query_pages(query):
+            if page.empty:
+                continue
+            pagine[offset] = prepare_screener_frame(page)
+            if on_page is not None:
+                parziale = pd.concat([pagine[o] for o in sorted(pagine)], ignore_index=True)
+                on_page(len(parziale), min(total, MAX_UNIVERSE_ROWS), parziale)
+    except Exception as e:
+        if not pagine:
+            raise
+        errori['pagine successive'] = str(e)
     
-    scored_df['MACD_Score'] = scored_df.apply(
-        lambda row: macd_score(
-            row.get('MACD.macd', None) if 'MACD.macd' in row.index else row.get('macd', None),
-            row.get('MACD.signal', None) if 'MACD.signal' in row.index else row.get('signal', None)
-        ), axis=1
-    )
-    scored_df['Investment_Score'] += scored_df['MACD_Score'] * 0.15
+    # Ordine finale come la query (per capitalizzazione), indipendente dall'arrivo delle pagine
+    df = pd.concat([pagine[o] for o in sorted(pagine)], ignore_index=True) if pagine else pd.DataFrame()
+    df.attrs['fetched_at'] = datetime.now()
+    append_snapshot(df, df.attrs['fetched_at'])
+    return df, errori
+
+def fetch_screener_data(full_universe=False, on_page=None):
+    """
+    Fetch data from TradingView screener with enhanced columns for scoring
     
-    # 3. Trend Score (peso 25%) - prezzo vs SMA50 e SMA200
-    def trend_score(price, sma50, sma200):
-        if pd.isna(price) or pd.isna(sma50) or pd.isna(sma200):
-            return 0
-        score = 0
-        # Prezzo sopra SMA50
-        if price > sma50:
-            score += 5
-        # Prezzo sopra SMA200
-        if price > sma200:
-            score += 3
-        # SMA50 sopra SMA200 (uptrend confermato)
-        if sma50 > sma200:
-            score += 2
-        return score
+    Il risultato è condiviso tra tutte le sessioni (cache per impronta della query):
+    più utenti che aggiornano insieme costano una sola richiesta a TradingView
     
-    scored_df['Trend_Score'] = scored_df.apply(
-        lambda row: trend_score(row['close'], row['SMA50'], row['SMA200']), axis=1
-    )
-    scored_df['Investment_Score'] += scored_df['Trend_Score'] * 0.25
+    Args:
+        full_universe: se True scorre tutti i risultati a pagine invece dei primi 200
+        on_page: callback(righe_caricate, totale, df_parziale) chiamata a ogni pagina
+    """
+    query = build_screener_query()
+    chiave = query_fingerprint(query, "universo" if full_universe else "top200")
+    # Risultati parziali serviti ma non salvati in cache
+    completo = lambda risultato: not risultato[1]
     
-    # 4. Technical Rating Score (peso 20%)
-    def tech_rating_score(rating):
-        if pd.isna(rating):
-            return 0
-        if rating >= 0.5:
-            return 10
-        elif rating >= 0.3:
-            return 8
-        elif rating >= 0.1:
-            return 6
-        elif rating >= -0.1:
-            return 4
+    try:
+        if full_universe:
+            (df, errori), _ = shared_query(chiave, lambda: _screener_universe(query, on_page), cacheable=completo)
         else:
-            return 2
-    
-    scored_df['Tech_Rating_Score'] = scored_df['Recommend.All'].apply(tech_rating_score)
-    scored_df['Investment_Score'] += scored_df['Tech_Rating_Score'] * 0.20
+            with st.spinner("🔍 Recupero dati dal mercato..."):
+                (df, errori), _ = shared_query(chiave, lambda: _screener_top(query), cacheable=completo)
+    except Exception as e:
+        st.error(f"❌ Errore nel recupero dati: {e}")
+        return pd.DataFrame()
     
-    # 5. Volatility Score (peso 10%) - volatilità moderata è preferibile
-    def volatility_score(vol):
-        if pd.isna(vol):
-            return 0
-        if 0.5 <= vol <= 2.0:  # Volatilità ideale per guadagni a 2-4 settimane
-            return 10
-        elif 0.3 <= vol < 0.5:
-            return 7
-        elif 2.0 < vol <= 3.0:
-            return 6
-        elif vol > 3.0:
-            return 3
-        else:
-            return 2
+    if errori:
+        st.warning(f"⚠️ Risultati parziali, non disponibili: {', '.join(sorted(errori))}")
+    return df
+
+# Auto-refresh: solo quotazioni (close/change) dei titoli migliori, in un fragment
+AUTO_REFRESH_SECONDS = 30
+LIVE_COLUMNS = ['close', 'change']
+LIVE_MAX_TICKERS = 500
+
+def refresh_quotes(df, max_tickers=LIVE_MAX_TICKERS):
+    """
+    Aggiorna close/change dei titoli migliori e ricalcola lo score solo dove sono cambiati
     
-    scored_df['Volatility_Score'] = scored_df['Volatility.D'].apply(volatility_score)
-    scored_df['Investment_Score'] += scored_df['Volatility_Score'] * 0.10
+    Returns:
+        (DataFrame aggiornato - una copia, mai quello condiviso -, numero di righe cambiate)
+    """
+    if df.empty or 'ticker' not in df.columns:
+        return df, 0
+    tickers = df.nlargest(max_tickers, 'Investment_Score')['ticker'].tolist()
+    quotes, _ = fetch_tickers(tickers, LIVE_COLUMNS, ttl=AUTO_REFRESH_SECONDS / 2)
+    if quotes.empty:
+        return df, 0
     
-    # 6. Market Cap Score (peso 10%) - preferenza per cap intermedia
-    def mcap_score(mcap):
-        if pd.isna(mcap):
-            return 0
-        if 1e9 <= mcap <= 50e9:  # 1B-50B sweet spot
-            return 10
-        elif 50e9 < mcap <= 200e9:
-            return 8
-        elif 500e6 <= mcap < 1e9:
-            return 6
-        else:
-            return 4
+    nuove = quotes.reindex(df['ticker']).set_axis(df.index)
+    mosse = nuove['close'].notna() & ((nuove['close'] != df['close']) | (nuove['change'] != df['change']))
+    if not mosse.any():
+        return df, 0
     
-    scored_df['MCap_Score'] = scored_df['market_cap_basic'].apply(mcap_score)
-    scored_df['Investment_Score'] += scored_df['MCap_Score'] * 0.10
+    df = df.copy()
+    df.loc[mosse, LIVE_COLUMNS] = nuove.loc[mosse, LIVE_COLUMNS]
+    df.loc[mosse, 'Price'] = df.loc[mosse, 'close'].round(2)
+    # ⭐ Score ricalcolato solo sulle righe mosse ⭐
+    rescored = score_profiles(df.loc[mosse], get_scoring_profiles())
+    colonne_score = [c for c in rescored.columns
+                     if c == 'Investment_Score' or c.endswith('_Score') or c.startswith('Score_')]
+    df.loc[mosse, colonne_score] = rescored[colonne_score]
+    return df, int(mosse.sum())
+
+def live_quotes_panel():
+    """Pannello aggiornato dal fragment: solo quotazioni e score, il resto della pagina non si ricarica"""
+    df = st.session_state.data
+    if df.empty:
+        st.caption("📡 Auto-refresh attivo: carica i dati per seguire le quotazioni")
+        return
     
-    # Normalizza il punteggio finale (0-100)
-    max_possible_score = 10 * (0.20 + 0.15 + 0.25 + 0.20 + 0.10 + 0.10)
-    scored_df['Investment_Score'] = (scored_df['Investment_Score'] / max_possible_score) * 100
-    scored_df['Investment_Score'] = scored_df['Investment_Score'].round(1)
+    aggiornato, mosse = refresh_quotes(df)
+    if mosse:
+        st.session_state.data = aggiornato
+        st.session_state.data_version += 1
+        st.session_state.top_5_stocks = get_top_5_investment_picks(aggiornato)
     
-    return scored_df
+    st.caption(f"📡 Quotazioni verificate alle {datetime.now().strftime('%H:%M:%S')}: {mosse} titoli aggiornati")
+    st.dataframe(
+        aggiornato.nlargest(10, 'Investment_Score')[['Symbol', 'Company', 'Price', 'change', 'Investment_Score']],
+        column_config={
+            "change": st.column_config.NumberColumn("Change %", format="%.2f%%"),
+            "Investment_Score": st.column_config.NumberColumn("Score", format="%.1f"),
+        },
+        hide_index=True,
+        use_container_width=True
+    )
 
-def get_tradingview_url(symbol):
-    """Generate TradingView URL for a given symbol"""
-    if ':' in symbol:
-        clean_symbol = symbol.split(':')[1]
+# Motivazioni delle scelte: (colonna sub-score, soglia minima, testo), in ordine di priorità
+RECOMMENDATION_REASONS = [
+    ('RSI_Score', 8, "RSI ottimale"),
+    ('MACD_Score', 7, "MACD positivo"),
+    ('Trend_Score', 8, "Strong uptrend"),
+    ('Tech_Rating_Score', 8, "Analisi tecnica positiva"),
+    ('Volatility_Score', 7, "Volatilità controllata"),
+]
+MAX_REASONS = 3
+
+def _top_k_positions(scores, k):
+    """Posizioni dei k punteggi più alti (come nlargest: a parità vince la riga precedente), NaN esclusi"""
+    valide = np.flatnonzero(~np.isnan(scores))
+    valori = scores[valide]
+    if k < len(valori):
+        # ⭐ argpartition: soglia del k-esimo in O(n), senza ordinare tutto ⭐
+        soglia = -np.partition(-valori, k - 1)[k - 1]
+        sopra = np.flatnonzero(valori > soglia)
+        pari = np.flatnonzero(valori == soglia)[:k - len(sopra)]
+        scelte = np.concatenate([sopra, pari])
     else:
-        clean_symbol = symbol
-    # Ritorna SOLO l'URL (senza HTML)
-    return f"https://www.tradingview.com/chart/?symbol={symbol}"
+        scelte = np.arange(len(valori))
+    ordine = np.lexsort((scelte, -valori[scelte]))
+    return valide[scelte[ordine]]
+
+def _group_top_k_positions(scores, groups, k):
+    """Prime k posizioni per gruppo in un solo ordinamento (gruppo, -score, posizione)"""
+    codici, _ = pd.factorize(groups, sort=True)
+    validi = np.flatnonzero(~np.isnan(scores) & (codici >= 0))
+    ordine = validi[np.lexsort((validi, -scores[validi], codici[validi]))]
+    codici_ordinati = codici[ordine]
+    # Rango nel gruppo = posizione - inizio del gruppo nell'ordinamento
+    inizio = np.r_[0, np.flatnonzero(np.diff(codici_ordinati)) + 1]
+    lunghezze = np.diff(np.r_[inizio, len(ordine)])
+    rango = np.arange(len(ordine)) - np.repeat(inizio, lunghezze)
+    return ordine[rango < k], rango[rango < k]
+
+def recommendation_reasons(df, max_reasons=MAX_REASONS):
+    """Motivazioni 'RSI ottimale | MACD positivo | ...' con maschere vettoriali (prime max_reasons vere)"""
+    n = len(df)
+    maschere = np.column_stack([
+        (pd.to_numeric(df[col], errors='coerce') >= soglia).to_numpy() if col in df.columns else np.zeros(n, dtype=bool)
+        for col, soglia, _ in RECOMMENDATION_REASONS
+    ]) if n else np.zeros((0, len(RECOMMENDATION_REASONS)), dtype=bool)
+    maschere &= np.cumsum(maschere, axis=1) <= max_reasons
     
-def fetch_screener_data():
-    """Fetch data from TradingView screener with enhanced columns for scoring"""
-    try:
-        with st.spinner("🔍 Recupero dati dal mercato..."):
-            query = (
-                Query()
-                .set_markets('america', 'australia','belgium','brazil', 'canada', 'chile', 'china','italy',
-                            'czech', 'denmark', 'egypt', 'estonia', 'finland', 'france', 'germany', 'greece',
-                            'hongkong', 'hungary','india', 'indonesia', 'ireland', 'israel', 'japan','korea',
-                            'kuwait', 'lithuania', 'luxembourg', 'malaysia', 'mexico', 'morocco', 'netherlands',
-                            'newzealand', 'norway', 'peru', 'philippines', 'poland', 'portugal', 'qatar', 'russia',
-                            'singapore', 'slovakia', 'spain', 'sweden', 'switzerland', 'taiwan', 'uae', 'uk',
-                            'venezuela', 'vietnam', 'crypto')
-                .select('name', 'description', 'country', 'sector', 'currency', 'close', 'change', 'volume',
-                       'market_cap_basic', 'RSI', 'MACD.macd', 'MACD.signal', 'SMA50', 'SMA200',
-                       'Volatility.D', 'Recommend.All', 'float_shares_percent_current',
-                       'relative_volume_10d_calc', 'price_earnings_ttm', 'earnings_per_share_basic_ttm',
-                       'Perf.W', 'Perf.1M')
-                .where(
-                    Column('type').isin(['stock','etf']),
-                    Column('is_primary') == True,
-                    Column('market_cap_basic').between(10_000_000_000, 200_000_000_000_000),
-                    Column('close') > Column('SMA50'),
-                    Column('close') > Column('SMA100'),
-                    Column('close') > Column('SMA200'),
-                    Column('RSI').between(30, 80),
-                    Column('MACD.macd') > Column('MACD.signal'),
-                    Column('Volatility.D') > 0.2,
-                    Column('Recommend.All') > 0.1,
-                    Column('relative_volume_10d_calc') > 0.7,
-                    Column('float_shares_percent_current') > 0.3,
-                )
-                .order_by('market_cap_basic', ascending=False)
-                .limit(200)
-                .get_scanner_data()
-            )
-            
-            df = query[1]
-            
-            if not df.empty:
-                df = calculate_investment_score(df)
-                df['Rating'] = df['Recommend.All'].apply(format_technical_rating)
-                df['Market Cap'] = df['market_cap_basic'].apply(lambda x: format_currency(x))
-                df['Price'] = df['close'].round(2)
-                df['Change %'] = df['change'].apply(format_percentage)
-                df['Volume'] = df['volume'].apply(lambda x: format_currency(x, ''))
-                df['RSI'] = df['RSI'].round(1)
-                df['Volatility %'] = df['Volatility.D'].apply(format_percentage)
-                df['TradingView_URL'] = df['name'].apply(get_tradingview_url)
-                df['Perf Week %'] = df['Perf.W'].apply(format_percentage)
-                df['Perf Month %'] = df['Perf.1M'].apply(format_percentage)
-                
-                df = df.rename(columns={
-                    'name': 'Symbol',
-                    'description': 'Company',
-                    'country': 'Country',
-                    'sector': 'Sector',
-                    'currency': 'Currency'
-                })
-                
-            return df
-            
-    except Exception as e:
-        st.error(f"❌ Errore nel recupero dati: {e}")
+    testo = pd.Series('', index=df.index, dtype=object)
+    for j, (_, _, etichetta) in enumerate(RECOMMENDATION_REASONS):
+        separatore = np.where(testo.to_numpy() != '', ' | ', '')
+        testo = testo.where(~maschere[:, j], testo + separatore + etichetta)
+    return testo
+
+def top_k_picks(df, k=5, by='Investment_Score', group_by=None):
+    """
+    Migliori k titoli per punteggio, globali o per gruppo (es. 'Sector', 'Country')
+    
+    Args:
+        df: DataFrame dello screener
+        k: titoli per gruppo
+        by: colonna del punteggio
+        group_by: colonna di raggruppamento (None = classifica unica)
+    
+    Returns:
+        Copia delle righe scelte con Rank (1 = migliore nel gruppo) e Recommendation_Reason,
+        ordinate per gruppo e punteggio
+    """
+    if df.empty:
         return pd.DataFrame()
+    
+    scores = pd.to_numeric(df[by], errors='coerce').to_numpy(dtype=float)
+    if group_by is None:
+        posizioni = _top_k_positions(scores, k)
+        rango = np.arange(len(posizioni))
+    else:
+        posizioni, rango = _group_top_k_positions(scores, df[group_by].to_numpy(dtype=object), k)
+    
+    picks = df.iloc[posizioni].copy()
+    picks['Rank'] = rango + 1
+    picks['Recommendation_Reason'] = recommendation_reasons(picks)
+    return picks
+
+@st.cache_data(max_entries=16, show_spinner="🧪 Backtest in corso...")
+def backtest_summary(path, mtime, k, rebalance_every):
+    """Riepilogo del backtest in percentuale (mtime nella chiave: cambia se cambia il file)"""
+    riepilogo = run_backtest(load_ohlcv(path), k=k, rebalance_every=rebalance_every)['summary']
+    percentuali = riepilogo.columns.difference(['pick', 'date'])
+    return riepilogo.assign(**{c: riepilogo[c] * 100 for c in percentuali})
 
 def get_top_5_investment_picks(df):
     """Seleziona le top 5 azioni con le migliori probabilità di guadagno"""
     if df.empty:
         return pd.DataFrame()
-    
-    top_5 = df.nlargest(5, 'Investment_Score').copy()
-    
-    def generate_recommendation_reason(row):
-        reasons = []
-        if row['RSI_Score'] >= 8:
-            reasons.append("RSI ottimale")
-        if row['MACD_Score'] >= 7:
-            reasons.append("MACD positivo")
-        if row['Trend_Score'] >= 8:
-            reasons.append("Strong uptrend")
-        if row['Tech_Rating_Score'] >= 8:
-            reasons.append("Analisi tecnica positiva")
-        if row['Volatility_Score'] >= 7:
-            reasons.append("Volatilità controllata")
-        return " | ".join(reasons[:3])
-    
-    top_5['Recommendation_Reason'] = top_5.apply(generate_recommendation_reason, axis=1)
-    
-    return top_5
+    return format_display_columns(top_k_picks(df, k=5))
 
 # ============================================================================
 # FUNZIONI ANALISI FONDAMENTALE - AGGIUNGI PRIMA DI stock_screener_app()
 # ============================================================================
 
-def fetch_fundamental_data(symbol: str):
-    """Recupera dati fondamentali per un ticker specifico da tutti i mercati."""
-    
-    markets = [
-        'america', 'australia', 'belgium', 'brazil', 'canada', 'chile', 'china', 'italy',
-        'czech', 'denmark', 'egypt', 'estonia', 'finland', 'france', 'germany', 'greece',
-        'hongkong', 'hungary', 'india', 'indonesia', 'ireland', 'israel', 'japan', 'korea',
-        'kuwait', 'lithuania', 'luxembourg', 'malaysia', 'mexico', 'morocco', 'netherlands',
-        'newzealand', 'norway', 'peru', 'philippines', 'poland', 'portugal', 'qatar', 'russia',
-        'singapore', 'slovakia', 'spain', 'sweden', 'switzerland', 'taiwan', 'uae', 'uk',
-        'venezuela', 'vietnam', 'crypto'
-    ]
-    
-    columns = [
-        'name', 'description', 'country', 'sector', 'close','currency',
-        'market_cap_basic', 'total_revenue_yoy_growth_fy', 'gross_profit_yoy_growth_fy',
-        'net_income_yoy_growth_fy', 'earnings_per_share_diluted_yoy_growth_fy',
-        'price_earnings_ttm', 'price_free_cash_flow_ttm', 'total_assets',
-        'total_debt', 'operating_margin', 'ebitda_yoy_growth_fy',
-        'net_margin_ttm', 'free_cash_flow_yoy_growth_fy', 'price_sales_ratio','total_liabilities_fy','total_current_assets',
-        'capex_per_share_ttm','ebitda','ebit_ttm','net_income','effective_interest_rate_on_debt_fy', 'capital_expenditures_yoy_growth_ttm', 
-        'enterprise_value_to_free_cash_flow_ttm', 'free_cash_flow_cagr_5y', 
-        'invent_turnover_current', 'price_target_low', 'price_target_high', 
-        'price_target_median', 'revenue_forecast_fq', 'earnings_per_share_forecast_fq',
-        'SMA50', 'SMA200','beta_1_year','beta_2_year'
-    ]
-    
+FUNDAMENTAL_COLUMNS = [
+    'name', 'description', 'country', 'sector', 'close','currency',
+    'market_cap_basic', 'total_revenue_yoy_growth_fy', 'gross_profit_yoy_growth_fy',
+    'net_income_yoy_growth_fy', 'earnings_per_share_diluted_yoy_growth_fy',
+    'price_earnings_ttm', 'price_free_cash_flow_ttm', 'total_assets',
+    'total_debt', 'operating_margin', 'ebitda_yoy_growth_fy',
+    'net_margin_ttm', 'free_cash_flow_yoy_growth_fy', 'price_sales_ratio','total_liabilities_fy','total_current_assets',
+    'capex_per_share_ttm','ebitda','ebit_ttm','net_income','effective_interest_rate_on_debt_fy', 'capital_expenditures_yoy_growth_ttm', 
+    'enterprise_value_to_free_cash_flow_ttm', 'free_cash_flow_cagr_5y', 
+    'invent_turnover_current', 'price_target_low', 'price_target_high', 
+    'price_target_median', 'revenue_forecast_fq', 'earnings_per_share_forecast_fq',
+    'SMA50', 'SMA200','beta_1_year','beta_2_year'
+]
+
+def _parse_symbols(symbols):
+    """Simbolo singolo o lista (anche 'A, B' separati da virgola) -> lista maiuscola senza duplicati"""
+    if isinstance(symbols, str):
+        symbols = symbols.split(',')
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+
+def _fetch_symbols(symbols, columns, label):
+    """Dati di uno o più simboli in blocco, indicizzati per simbolo"""
+    symbols = _parse_symbols(symbols)
     try:
-        query = Query().set_markets(*markets).set_tickers(symbol).select(*columns)
-        total, df = query.get_scanner_data()
-        
-        if df.empty:
-            st.warning(f"❌ Nessun dato trovato per {symbol}")
-            return pd.DataFrame()
-        
-        df_filtered = df.head(1).copy()
-        
-        # Normalizza colonne mancanti
-        for col in columns:
-            if col not in df_filtered.columns:
-                df_filtered[col] = np.nan
-        
-        return df_filtered
-        
+        df, _ = fetch_tickers(symbols, columns)
     except Exception as e:
-        st.error(f"Errore nel caricamento dati fondamentali: {e}")
+        st.error(f"❌ Errore nel caricamento dati {label}: {e}")
         return pd.DataFrame()
+    
+    mancanti = [s for s in symbols if s not in df.index]
+    if mancanti:
+        st.warning(f"❌ Nessun dato trovato per {', '.join(mancanti)}")
+    return df
+
+def fetch_ticker_snapshot(symbols):
+    """
+    Snapshot completo (colonne fondamentali + tecniche) di uno o più ticker
+    
+    Le due analisi leggono lo stesso snapshot: aprire un ticker in entrambi
+    i tab costa una sola query (cache per ticker di breve durata)
+    """
+    return _fetch_symbols(symbols, SNAPSHOT_COLUMNS, "del ticker")
+
+def fetch_fundamental_data(symbols):
+    """
+    Recupera dati fondamentali per uno o più ticker (EXCHANGE:TICKER)
+    
+    Una richiesta per gruppo di mercati per tutti i ticker insieme;
+    DataFrame indicizzato per simbolo (vuoto se non trovato nulla)
+    """
+    df = fetch_ticker_snapshot(symbols)
+    return df[FUNDAMENTAL_COLUMNS] if not df.empty else df
 
 def generate_fundamental_ai_report(company_name: str, fundamentals: dict):
     """Genera report AI usando i dati fondamentali disponibili."""
@@ -423,7 +536,11 @@ IMPORTANTE:
 
 
 def process_fundamental_results(df_result, symbol):
-    """Processa e mostra i risultati dell'analisi fondamentale."""
+    """Processa e mostra i risultati dell'analisi fondamentale (df_result None = dallo snapshot)."""
+    if df_result is None:
+        df_result = fetch_fundamental_data(symbol)
+    if df_result.empty:
+        return
     row = df_result.iloc[0]
     company_name = row.get('description', symbol.upper())
     
@@ -463,78 +580,51 @@ def process_fundamental_results(df_result, symbol):
                 st.error("❌ Errore nella generazione del report AI.")
                 st.info("💡 Riprova più tardi o verifica la connessione API.")
 
-def fetch_technical_data(ticker: str):
-    """
-    Recupera i dati tecnici completi da TradingView per un ticker specifico.
-    Ritorna un DataFrame con i dati della prima riga trovata.
-    """
-    # Definisci i mercati dove cercare
-    markets = [
-        'america', 'australia', 'belgium', 'brazil', 'canada', 'chile', 'china', 'italy',
-        'czech', 'denmark', 'egypt', 'estonia', 'finland', 'france', 'germany', 'greece',
-        'hongkong', 'hungary', 'india', 'indonesia', 'ireland', 'israel', 'japan', 'korea',
-        'kuwait', 'lithuania', 'luxembourg', 'malaysia', 'mexico', 'morocco', 'netherlands',
-        'newzealand', 'norway', 'peru', 'philippines', 'poland', 'portugal', 'qatar', 'russia',
-        'singapore', 'slovakia', 'spain', 'sweden', 'switzerland', 'taiwan', 'uae', 'uk',
-        'venezuela', 'vietnam', 'crypto'
-    ]
+TECHNICAL_COLUMNS = [
+    # Info base
+    'name', 'description', 'close', 'open', 'high', 'low', 'volume',
+    'change', 'change_abs', 'Recommend.All',
     
-    columns = [
-        # Info base
-        'name', 'description', 'close', 'open', 'high', 'low', 'volume',
-        'change', 'change_abs', 'Recommend.All',
-        
-        # Indicatori di Trend
-        'RSI', 'RSI[1]', 'Stoch.K', 'Stoch.D', 
-        'MACD.macd', 'MACD.signal', 'ADX', 'ADX+DI', 'ADX-DI',
-        'CCI20', 'Mom', 'Stoch.RSI.K',
-        
-        # Medie Mobili
-        'SMA20', 'EMA20', 'SMA50', 'EMA50', 'SMA100', 'SMA200',
-        'EMA10', 'EMA30',
-        
-        # Volatilità
-        'ATR', 'ATR[1]', 'BB.upper', 'BB.lower', 'BB.basis',
-        'Volatility.D', 'Volatility.W', 'Volatility.M',
-        
-        # Volume
-        'average_volume_10d_calc', 'average_volume_30d_calc',
-        'average_volume_60d_calc', 'relative_volume_10d_calc',
-        
-        # Pivot Points
-        'Pivot.M.Classic.S1', 'Pivot.M.Classic.R1',
-        'Pivot.M.Classic.S2', 'Pivot.M.Classic.R2',
-        'Pivot.M.Classic.S3', 'Pivot.M.Classic.R3',
-        'Pivot.M.Classic.Middle',
-        
-        # Performance
-        'Perf.W', 'Perf.1M', 'Perf.3M', 'Perf.6M', 'Perf.Y',
-        
-        # Dati Fondamentali Base
-        'market_cap_basic', 'price_earnings_ttm', 'sector', 'country'
-    ]
+    # Indicatori di Trend
+    'RSI', 'RSI[1]', 'Stoch.K', 'Stoch.D', 
+    'MACD.macd', 'MACD.signal', 'ADX', 'ADX+DI', 'ADX-DI',
+    'CCI20', 'Mom', 'Stoch.RSI.K',
     
-    try:
-        query = Query().set_markets(*markets).set_tickers(ticker).select(*columns)
-        total, df = query.get_scanner_data()
-        
-        if df.empty:
-            st.warning(f"❌ Nessun dato trovato per {ticker}")
-            return pd.DataFrame()
-        
-        df_filtered = df.head(1).copy()
-        
-        # Normalizza colonne mancanti
-        for col in columns:
-            if col not in df_filtered.columns:
-                df_filtered[col] = np.nan
-        
-        return df_filtered
+    # Medie Mobili
+    'SMA20', 'EMA20', 'SMA50', 'EMA50', 'SMA100', 'SMA200',
+    'EMA10', 'EMA30',
     
-    except Exception as e:
-        st.error(f"❌ Errore nel caricamento dati tecnici: {e}")
-        return pd.DataFrame()
+    # Volatilità
+    'ATR', 'ATR[1]', 'BB.upper', 'BB.lower', 'BB.basis',
+    'Volatility.D', 'Volatility.W', 'Volatility.M',
+    
+    # Volume
+    'average_volume_10d_calc', 'average_volume_30d_calc',
+    'average_volume_60d_calc', 'relative_volume_10d_calc',
+    
+    # Pivot Points
+    'Pivot.M.Classic.S1', 'Pivot.M.Classic.R1',
+    'Pivot.M.Classic.S2', 'Pivot.M.Classic.R2',
+    'Pivot.M.Classic.S3', 'Pivot.M.Classic.R3',
+    'Pivot.M.Classic.Middle',
+    
+    # Performance
+    'Perf.W', 'Perf.1M', 'Perf.3M', 'Perf.6M', 'Perf.Y',
+    
+    # Dati Fondamentali Base
+    'market_cap_basic', 'price_earnings_ttm', 'sector', 'country'
+]
+
+# Unione delle colonne dei due tab, nell'ordine (una sola query per ticker)
+SNAPSHOT_COLUMNS = list(dict.fromkeys(FUNDAMENTAL_COLUMNS + TECHNICAL_COLUMNS))
 
+def fetch_technical_data(tickers):
+    """
+    Recupera i dati tecnici completi da TradingView per uno o più ticker
+    Ritorna un DataFrame indicizzato per simbolo (una riga per ticker trovato)
+    """
+    df = fetch_ticker_snapshot(tickers)
+    return df[TECHNICAL_COLUMNS] if not df.empty else df
 
 def generate_technical_ai_report(ticker: str, technical_dict: dict) -> str:
     """
@@ -660,7 +750,11 @@ ISTRUZIONI CRITICHE:
         return f"❌ Errore nella generazione del report AI: {str(e)}"
 
 def process_technical_results(df_result, ticker):
-    """Processa e mostra i risultati dell'analisi tecnica."""
+    """Processa e mostra i risultati dell'analisi tecnica (df_result None = dallo snapshot)."""
+    if df_result is None:
+        df_result = fetch_technical_data(ticker)
+    if df_result.empty:
+        return
     row = df_result.iloc[0]
     company_name = row.get('description', ticker.upper())
     
@@ -762,6 +856,9 @@ def stock_screener_app():
     # SESSION STATE INITIALIZATION
     if 'data' not in st.session_state:
         st.session_state.data = pd.DataFrame()
+    if 'data_version' not in st.session_state:
+        # Incrementata a ogni sostituzione di data: chiave delle cache derivate (cubo, indici)
+        st.session_state.data_version = 0
     if 'last_update' not in st.session_state:
         st.session_state.last_update = None
     if 'top_5_stocks' not in st.session_state:
@@ -775,11 +872,30 @@ def stock_screener_app():
     col1, col2, col3 = st.columns([2, 1, 1])
     
     with col1:
+        full_universe = st.checkbox("🌐 Universo completo (oltre i primi 200)", value=False)
         if st.button("🔄 Aggiorna Dati", type="primary", use_container_width=True):
-            new_data = fetch_screener_data()
+            if full_universe:
+                progresso = st.progress(0.0, text="🔍 Recupero dati dal mercato...")
+                anteprima = st.empty()
+                
+                def mostra_pagina(caricate, totale, parziale):
+                    progresso.progress(min(caricate / max(totale, 1), 1.0), text=f"🔍 {caricate}/{totale} titoli caricati")
+                    anteprima.dataframe(
+                        parziale.nlargest(20, 'Investment_Score')[['Symbol', 'Company', 'Country', 'Investment_Score']],
+                        hide_index=True, use_container_width=True
+                    )
+                
+                new_data = fetch_screener_data(full_universe=True, on_page=mostra_pagina)
+                progresso.empty()
+                anteprima.empty()
+            else:
+                new_data = fetch_screener_data()
             if not new_data.empty:
+                # Stesso DataFrame condiviso tra le sessioni: non va modificato in place
                 st.session_state.data = new_data
+                st.session_state.data_version += 1
                 st.session_state.top_5_stocks = get_top_5_investment_picks(new_data)
+                st.session_state.last_update = new_data.attrs.get('fetched_at')
                 
                 st.success(f"✅ Aggiornati {len(new_data)} titoli)")
             else:
@@ -787,17 +903,24 @@ def stock_screener_app():
     
     with col2:
         if st.button("🧹 Pulisci Cache", use_container_width=True):
+            clear_query_cache()
             st.success("✅ Cache pulita!")
     
     with col3:
-        auto_refresh = st.checkbox("🔄 Auto-refresh (30s)")
-        if auto_refresh:
-            time.sleep(30)
-            st.rerun()
+        auto_refresh = st.checkbox(f"🔄 Auto-refresh ({AUTO_REFRESH_SECONDS}s)", key="auto_refresh")
     
     if st.session_state.last_update:
         st.info(f"🕐 Ultimo aggiornamento: {st.session_state.last_update.strftime('%d/%m/%Y %H:%M:%S')}")
     
+    if auto_refresh:
+        # ⭐ Fragment: si riesegue da solo senza bloccare i widget né ricaricare filtri, tab e report AI ⭐
+        st.fragment(live_quotes_panel, run_every=AUTO_REFRESH_SECONDS)()
+    
+    latenze = get_market_latency()
+    if not latenze.empty:
+        with st.expander("⏱️ Latenza per mercato"):
+            st.dataframe(latenze, hide_index=True, use_container_width=True)
+    
     # --- TAB SYSTEM ---
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Dashboard", "🎯 Top Picks", "📕 Fundamentals", "📈 Technicals"])
     
@@ -806,57 +929,100 @@ def stock_screener_app():
         if not st.session_state.data.empty:
             df = st.session_state.data
             
+            # Confronto A/B: il profilo scelto pilota Investment_Score in tutta la dashboard
+            profili = get_scoring_profiles()
+            etichette = {p["name"]: p["label"] for p in profili}
+            profilo = st.selectbox(
+                "🧮 Profilo di scoring",
+                [p["name"] for p in profili
+                 if p["name"] == DEFAULT_PROFILE or score_column(p["name"]) in df.columns],
+                format_func=lambda nome: etichette[nome]
+            )
+            if profilo and profilo != DEFAULT_PROFILE:
+                df = df.assign(Investment_Score=df[score_column(profilo)])
+            
+            # ⭐ Cubo Paese × Settore × Rating × score: un groupby per versione dei dati e profilo ⭐
+            chiave_cubo = (st.session_state.data_version, profilo)
+            cubo_cache = st.session_state.get('screener_cube')
+            if cubo_cache is None or cubo_cache['chiave'] != chiave_cubo:
+                cubo_cache = {
+                    'chiave': chiave_cubo,
+                    'cubo': build_screener_cube(df),
+                    'indice': build_filter_index(df, ['Country', 'Sector', 'Rating'],
+                                                 numeric_columns=['Investment_Score']),
+                }
+                st.session_state.screener_cube = cubo_cache
+            cubo = cubo_cache['cubo']
+            
             # Summary metrics
             st.subheader("📊 Riepilogo")
             col1, col2, col3, col4, col5 = st.columns(5)
+            metriche = cube_metrics(cubo)
             
             with col1:
-                st.metric("Totale Titoli", len(df))
+                st.metric("Totale Titoli", metriche['count'])
             with col2:
-                buy_signals = len(df[df['Rating'].str.contains('Buy', na=False)])
-                st.metric("Segnali Buy", buy_signals)
+                st.metric("Segnali Buy", metriche['buy'])
             with col3:
-                strong_buy = len(df[df['Rating'].str.contains('Strong Buy', na=False)])
-                st.metric("Strong Buy", strong_buy)
+                st.metric("Strong Buy", metriche['strong_buy'])
             with col4:
-                avg_rating = df['Recommend.All'].mean()
-                st.metric("Rating Medio", f"{avg_rating:.2f}")
+                st.metric("Rating Medio", f"{metriche['avg_rating']:.2f}")
             with col5:
-                avg_score = df['Investment_Score'].mean()
-                st.metric("Score Medio", f"{avg_score:.1f}/100")
+                st.metric("Score Medio", f"{metriche['avg_score']:.1f}/100")
             
             # Filters
             st.subheader("🔍 Filtri")
             col1, col2, col3, col4 = st.columns(4)
+            opzioni = cube_options(cubo)
             
             with col1:
-                countries = ['Tutti'] + sorted(df['Country'].unique().tolist())
-                selected_country = st.selectbox("Paese", countries)
+                selected_country = st.selectbox("Paese", ['Tutti'] + opzioni['Country'])
             
             with col2:
-                sectors = ['Tutti'] + sorted(df['Sector'].dropna().unique().tolist())
-                selected_sector = st.selectbox("Settore", sectors)
+                selected_sector = st.selectbox("Settore", ['Tutti'] + opzioni['Sector'])
             
             with col3:
-                ratings = ['Tutti'] + sorted(df['Rating'].unique().tolist())
-                selected_rating = st.selectbox("Rating", ratings)
+                selected_rating = st.selectbox("Rating", ['Tutti'] + opzioni['Rating'])
             
             with col4:
                 min_score = st.slider("Score Minimo", 0, 100, 50)
             
-            # Apply filters
-            filtered_df = df.copy()
-            
-            if selected_country != 'Tutti':
-                filtered_df = filtered_df[filtered_df['Country'] == selected_country]
-            
-            if selected_sector != 'Tutti':
-                filtered_df = filtered_df[filtered_df['Sector'] == selected_sector]
+            filtri = {
+                'country': None if selected_country == 'Tutti' else selected_country,
+                'sector': None if selected_sector == 'Tutti' else selected_sector,
+                'rating': None if selected_rating == 'Tutti' else selected_rating,
+                'min_score': min_score,
+            }
+            fetta = slice_cube(cubo, **filtri)
             
-            if selected_rating != 'Tutti':
-                filtered_df = filtered_df[filtered_df['Rating'] == selected_rating]
+            # Apply filters: bitmask precalcolate in AND, un solo taglio del frame
+            filtered_df = apply_filters(
+                df, cubo_cache['indice'],
+                selections={'Country': filtri['country'], 'Sector': filtri['sector'], 'Rating': filtri['rating']},
+                min_values={'Investment_Score': min_score}
+            )
             
-            filtered_df = filtered_df[filtered_df['Investment_Score'] >= min_score]
+            # ⭐ Storico score dai download precedenti (senza nuove richieste a TradingView) ⭐
+            with st.expander("📈 Storico Score"):
+                # Serie per ticker (nomi uguali su borse diverse restano separati), score del profilo scelto
+                ticker_storico = st.multiselect(
+                    "Titoli", df['ticker'].tolist(),
+                    default=df.nlargest(3, 'Investment_Score')['ticker'].tolist(),
+                    key="score_history_tickers"
+                )
+                giorni = st.slider("Giorni", 7, 365, 30, key="score_history_days")
+                colonna_storico = 'Investment_Score' if profilo == DEFAULT_PROFILE else score_column(profilo)
+                storico = (score_history(ticker_storico, days=giorni, score_column=colonna_storico)
+                           if ticker_storico else pd.DataFrame())
+                if storico.empty or colonna_storico not in storico.columns:
+                    st.info("Nessuno storico disponibile per i titoli selezionati.")
+                else:
+                    fig_storico = px.line(
+                        storico, x='fetched_at', y=colonna_storico, color='ticker', markers=True,
+                        hover_data=['Symbol', 'Price', 'Rating'],
+                        labels={'fetched_at': 'Data', colonna_storico: 'Score', 'ticker': 'Ticker'}
+                    )
+                    st.plotly_chart(fig_storico, use_container_width=True)
             
             # ============================================================
             # GRAFICI PLOTLY - PERFORMANCE SETTORI SETTIMANALE
@@ -864,8 +1030,8 @@ def stock_screener_app():
             st.subheader("📈 Performance Settori - Ultima Settimana")
             st.markdown("*Basata sui titoli selezionati dal tuo screener*")
             
-            if not filtered_df.empty and 'Perf.W' in filtered_df.columns:
-                sector_weekly_perf = filtered_df.groupby('Sector')['Perf.W'].agg(['mean', 'count']).reset_index()
+            if not fetta.empty and 'Perf.W' in df.columns:
+                sector_weekly_perf = sector_performance(fetta, 'Perf.W')
                 sector_weekly_perf = sector_weekly_perf[sector_weekly_perf['count'] >= 2]
                 sector_weekly_perf = sector_weekly_perf.sort_values('mean', ascending=True)
                 
@@ -936,7 +1102,18 @@ def stock_screener_app():
             st.markdown(f"**Visualizzati {len(filtered_df)} di {len(df)} titoli**")
             
             available_columns = ['Company', 'Symbol', 'Country', 'Sector', 'Currency', 'Price', 'Rating',
-                                'Investment_Score', 'Recommend.All', 'RSI', 'Volume', 'TradingView_URL']
+                                'Investment_Score', 'Recommend.All', 'RSI', 'Market Cap', 'Change %', 'Volume',
+                                'Volatility %', 'Perf Week %', 'Perf Month %', 'TradingView_URL']
+            
+            # Colonne numeriche mostrate in unità leggibili (restano ordinabili)
+            numeric_display = {
+                'Market Cap': ('market_cap_basic', 1e9, st.column_config.NumberColumn("Market Cap", format="$%.2fB")),
+                'Volume': ('volume', 1e6, st.column_config.NumberColumn("Volume", format="%.2fM")),
+                'Change %': ('change', 1, st.column_config.NumberColumn("Change %", format="%.2f%%")),
+                'Volatility %': ('Volatility.D', 1, st.column_config.NumberColumn("Volatility %", format="%.2f%%")),
+                'Perf Week %': ('Perf.W', 1, st.column_config.NumberColumn("Perf Week %", format="%.2f%%")),
+                'Perf Month %': ('Perf.1M', 1, st.column_config.NumberColumn("Perf Month %", format="%.2f%%")),
+            }
             
             display_columns = st.multiselect(
                 "Seleziona colonne da visualizzare:",
@@ -945,10 +1122,17 @@ def stock_screener_app():
             )
             
             if display_columns:
-                display_df = filtered_df[display_columns].copy()
+                sorgenti = [numeric_display[c][0] if c in numeric_display else c for c in display_columns]
+                display_df = filtered_df[sorgenti].copy()
+                display_df.columns = display_columns
+                for nome in display_columns:
+                    if nome in numeric_display and numeric_display[nome][1] != 1:
+                        display_df[nome] = display_df[nome] / numeric_display[nome][1]
                 
-                if 'Investment_Score' in display_df.columns:
-                    display_df['Investment_Score'] = display_df['Investment_Score'].round(1)
+                # Arrotondamenti solo per la tabella: il frame tiene i valori grezzi per il rescoring
+                for nome in ('Investment_Score', 'RSI'):
+                    if nome in display_df.columns:
+                        display_df[nome] = display_df[nome].round(1)
                 
                 column_names = {
                     'Company': 'Azienda',
@@ -1000,7 +1184,8 @@ def stock_screener_app():
                         "Chart": st.column_config.LinkColumn(
                             "Chart",
                             display_text="📊 View"
-                        )
+                        ),
+                        **{nome: cfg for nome, (_, _, cfg) in numeric_display.items()},
                     },
                     use_container_width=True,
                     height=400,
@@ -1059,7 +1244,7 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                     
                     with col3:
                         st.markdown("**Metriche Chiave:**")
-                        st.markdown(f"RSI: {stock['RSI']} | Rating: {stock['Rating']}")
+                        st.markdown(f"RSI: {stock['RSI']:.1f} | Rating: {stock['Rating']}")
                         st.markdown(f"Vol: {stock['Volatility %']} | MCap: {stock['Market Cap']}")
                         st.markdown(f"Perf 1W: {stock['Perf Week %']} | 1M: {stock['Perf Month %']}")
                     
@@ -1073,8 +1258,49 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                     
                     st.markdown("---")
         
+            # Classifiche per gruppo: un solo ordinamento per tutti i gruppi
+            with st.expander("🏆 Classifiche per Settore / Paese"):
+                col_gruppo, col_k = st.columns(2)
+                with col_gruppo:
+                    gruppo = st.selectbox("Raggruppa per", ['Sector', 'Country'],
+                                          format_func=lambda c: {'Sector': 'Settore', 'Country': 'Paese'}[c],
+                                          key="leaderboard_group")
+                with col_k:
+                    k = st.slider("Titoli per gruppo", 1, 10, 3, key="leaderboard_k")
+                classifica = top_k_picks(st.session_state.data, k=k, group_by=gruppo)
+                if not classifica.empty:
+                    st.dataframe(
+                        classifica[[gruppo, 'Rank', 'Symbol', 'Company', 'Investment_Score', 'Recommendation_Reason']],
+                        column_config={"Investment_Score": st.column_config.NumberColumn("Score", format="%.1f")},
+                        hide_index=True,
+                        use_container_width=True
+                    )
+        
         else:
             st.info("📊 Aggiorna i dati per visualizzare i TOP 5 picks!")
+        
+        # Verifica della promessa "2-4 settimane" su storico locale
+        with st.expander("🧪 Backtest dello score (storico locale)"):
+            if not os.path.exists(DEFAULT_OHLCV_PATH):
+                st.info(f"Nessuno storico OHLCV in {DEFAULT_OHLCV_PATH} (vedi FLUSSO_OHLCV_PATH)")
+            else:
+                col_k, col_r = st.columns(2)
+                with col_k:
+                    k_backtest = st.slider("Titoli per data", 1, 20, 5, key="backtest_k")
+                with col_r:
+                    ribilancio = st.slider("Giorni tra le selezioni", 1, 20, 5, key="backtest_rebalance")
+                riepilogo = backtest_summary(DEFAULT_OHLCV_PATH, os.path.getmtime(DEFAULT_OHLCV_PATH),
+                                             k_backtest, ribilancio)
+                st.dataframe(
+                    riepilogo,
+                    column_config={
+                        colonna: st.column_config.NumberColumn(colonna, format="%.2f%%")
+                        for colonna in ['rendimento_medio', 'rendimento_mediano', 'hit_rate', 'universo_medio',
+                                        'extra_rendimento', 'drawdown_medio', 'drawdown_peggiore']
+                    },
+                    use_container_width=True
+                )
+                st.caption("Recommend.All e Volatility.D sono approssimati dai prezzi: risultati indicativi.")
     
     #========== TAB 3: ANALISI FONDAMENTALE =========
     
@@ -1089,7 +1315,7 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                 "Inserisci Simbolo con prefisso (es. NASDAQ:AAPL, MIL:ENEL):", 
                 "", 
                 key="fundamental_search_input",
-                help="Formato richiesto: EXCHANGE:TICKER",
+                help="Formato richiesto: EXCHANGE:TICKER (più simboli separati da virgola per il confronto)",
                 placeholder="Es. NASDAQ:AAPL"
             )
         
@@ -1120,7 +1346,15 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                     analyze_btn = True
 
         
-        if symbol and analyze_btn:
+        if len(_parse_symbols(symbol)) > 1 and analyze_btn:
+            # ⭐ Confronto tra più aziende: una sola richiesta per gruppo di mercati ⭐
+            with st.spinner("🔍 Ricerca dati fondamentali..."):
+                df_result = fetch_fundamental_data(symbol)
+            if not df_result.empty:
+                st.subheader("⚖️ Confronto Fondamentali")
+                st.dataframe(df_result.T, use_container_width=True)
+        
+        elif symbol and analyze_btn:
             with st.spinner(f"🔍 Ricerca dati fondamentali per {symbol.upper()}..."):
                 df_result = fetch_fundamental_data(symbol.upper())
                 
@@ -1207,7 +1441,7 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                 "Inserisci Simbolo con prefisso (es. NASDAQ:AAPL, MIL:ENEL):", 
                 "", 
                 key="technical_search_input",
-                help="Formato: TICKER o TICKER.MI per titoli italiani",
+                help="Formato: EXCHANGE:TICKER (più simboli separati da virgola per il confronto)",
                 placeholder="Es. NASDAQ:AAPL"
             )
         
@@ -1237,7 +1471,14 @@ Questa app utilizza un **algoritmo di scoring intelligente** e **notizie tradott
                     ticker = ticker_val
                     analyze_btn_tech = True
         
-        if ticker and analyze_btn_tech:
+        if len(_parse_symbols(ticker)) > 1 and analyze_btn_tech:
+            with st.spinner("🔍 Ricerca dati tecnici..."):
+                df_result = fetch_technical_data(ticker)
+            if not df_result.empty:
+                st.subheader("⚖️ Confronto Tecnico")
+                st.dataframe(df_result.T, use_container_width=True)
+        
+        elif ticker and analyze_btn_tech:
             with st.spinner(f"🔍 Ricerca dati tecnici per {ticker.upper()}..."):
                 df_result = fetch_technical_data(ticker.upper())
                 
@@ -0,0 +1,104 @@
+"""
+Cubo pre-aggregato dei risultati dello screener per la Dashboard
+
+Un solo groupby per aggiornamento dei dati su Paese × Settore × Rating ×
+fascia di score (parte intera di Investment_Score): conteggi e somme di
+Perf.W, Perf.1M, score e rating tecnico. Le somme si possono ricombinare,
+quindi metriche, opzioni dei filtri e grafico dei settori per qualsiasi
+combinazione di filtri si ricavano dal cubo senza toccare il DataFrame.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+DIMENSIONI = ['Country', 'Sector', 'Rating', 'score_bin']
+
+# Colonna sorgente -> (somma, conteggio dei valori non nulli)
+MISURE = {
+    'Investment_Score': ('score_sum', 'score_n'),
+    'Recommend.All': ('rec_sum', 'rec_n'),
+    'Perf.W': ('perf_w_sum', 'perf_w_n'),
+    'Perf.1M': ('perf_m_sum', 'perf_m_n'),
+}
+
+
+def build_screener_cube(df):
+    """
+    Aggrega il DataFrame dello screener in un cubo (una riga per combinazione presente)
+
+    Returns:
+        DataFrame con le dimensioni, 'n' e somma/conteggio per ogni misura
+    """
+    if df.empty:
+        return pd.DataFrame(columns=DIMENSIONI + ['n'] + [c for coppia in MISURE.values() for c in coppia])
+
+    # Fascia intera: score >= soglia intera equivale a score_bin >= soglia
+    # Rating mancante = 'N/A' come in format_technical_ratings (mai la stringa 'nan')
+    base = pd.DataFrame({
+        'Country': df['Country'].astype(object),
+        'Sector': df['Sector'].astype(object),
+        'Rating': df['Rating'].astype(object).fillna('N/A').astype(str),
+        'score_bin': np.floor(df['Investment_Score'].to_numpy(dtype=float)),
+        'n': 1,
+    }, index=df.index)
+    for colonna, (somma, conteggio) in MISURE.items():
+        valori = df[colonna] if colonna in df.columns else pd.Series(np.nan, index=df.index)
+        valori = pd.to_numeric(valori, errors='coerce')
+        base[somma] = valori.fillna(0.0)
+        base[conteggio] = valori.notna().astype(int)
+
+    return base.groupby(DIMENSIONI, dropna=False, sort=False).sum().reset_index()
+
+
+def cube_options(cube):
+    """Valori disponibili per i filtri Paese / Settore / Rating"""
+    return {
+        'Country': sorted(cube['Country'].dropna().unique().tolist()),
+        'Sector': sorted(cube['Sector'].dropna().unique().tolist()),
+        'Rating': sorted(cube['Rating'].dropna().unique().tolist()),
+    }
+
+
+def slice_cube(cube, country=None, sector=None, rating=None, min_score=None):
+    """Righe del cubo che soddisfano i filtri (None = nessun filtro)"""
+    mask = np.ones(len(cube), dtype=bool)
+    if country is not None:
+        mask &= (cube['Country'] == country).to_numpy()
+    if sector is not None:
+        mask &= (cube['Sector'] == sector).to_numpy()
+    if rating is not None:
+        mask &= (cube['Rating'] == rating).to_numpy()
+    if min_score is not None:
+        mask &= (cube['score_bin'] >= min_score).to_numpy()
+    return cube[mask]
+
+
+def cube_metrics(fetta):
+    """Metriche di riepilogo di una fetta del cubo"""
+    n = int(fetta['n'].sum())
+    buy = fetta['Rating'].str.contains('Buy', na=False)
+    return {
+        'count': n,
+        'buy': int(fetta.loc[buy, 'n'].sum()),
+        'strong_buy': int(fetta.loc[fetta['Rating'].str.contains('Strong Buy', na=False), 'n'].sum()),
+        'avg_rating': fetta['rec_sum'].sum() / fetta['rec_n'].sum() if fetta['rec_n'].sum() else np.nan,
+        'avg_score': fetta['score_sum'].sum() / fetta['score_n'].sum() if fetta['score_n'].sum() else np.nan,
+    }
+
+
+def sector_performance(fetta, column='Perf.W'):
+    """
+    Performance media per settore di una fetta (come groupby('Sector')[column].agg(['mean', 'count']))
+
+    Returns:
+        DataFrame con Sector, mean, count
+    """
+    somma, conteggio = MISURE[column]
+    per_settore = fetta.dropna(subset=['Sector']).groupby('Sector')[[somma, conteggio]].sum()
+    per_settore = per_settore[per_settore[conteggio] > 0]
+    return pd.DataFrame({
+        'Sector': per_settore.index,
+        'mean': per_settore[somma].to_numpy() / per_settore[conteggio].to_numpy(),
+        'count': per_settore[conteggio].to_numpy(),
+    })
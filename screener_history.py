@@ -0,0 +1,189 @@
+"""
+Storico dei risultati dello screener (append-only, Parquet partizionato per data)
+
+Ogni download dello screener viene salvato come un file in
+<HISTORY_DIR>/date=YYYY-MM-DD/; le letture scartano le partizioni fuori
+dall'intervallo richiesto senza aprirle e leggono solo le colonne e i
+simboli richiesti. Serve a seguire nel tempo Investment_Score, rating e
+performance senza interrogare di nuovo TradingView.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+# ==================== CONFIGURAZIONE ====================
+HISTORY_DIR = os.environ.get("FLUSSO_HISTORY_DIR", os.path.join(".flusso_cache", "screener_history"))
+
+# Colonne salvate (più le Score_<profilo> dei profili alternativi); le altre si possono ricalcolare
+HISTORY_COLUMNS = [
+    'ticker', 'Symbol', 'Company', 'Country', 'Sector', 'Price', 'Rating', 'Recommend.All',
+    'Investment_Score', 'RSI', 'market_cap_basic', 'change', 'Perf.W', 'Perf.1M',
+]
+
+# Partizioni più vecchie eliminate automaticamente (una volta al giorno, da append_snapshot)
+HISTORY_KEEP_DAYS = int(os.environ.get("FLUSSO_HISTORY_KEEP_DAYS", "365"))
+
+_PREFISSO_PARTIZIONE = "date="
+
+# Giorno dell'ultima pulizia eseguita da questo processo
+_ultima_pulizia = None
+
+
+def _partition_dir(giorno):
+    return os.path.join(HISTORY_DIR, f"{_PREFISSO_PARTIZIONE}{giorno.isoformat()}")
+
+
+def append_snapshot(df, fetched_at=None):
+    """
+    Aggiunge allo storico un risultato dello screener (scrittura atomica, errori ignorati)
+
+    Args:
+        df: DataFrame preparato dallo screener
+        fetched_at: momento del download (default: adesso)
+
+    Returns:
+        Percorso del file scritto, None se non salvato
+    """
+    if not PARQUET_AVAILABLE or df.empty:
+        return None
+    fetched_at = fetched_at or datetime.now()
+    colonne = [c for c in df.columns if c in HISTORY_COLUMNS or str(c).startswith("Score_")]
+    snapshot = df[colonne].copy()
+    if 'Rating' in snapshot.columns:
+        snapshot['Rating'] = snapshot['Rating'].astype(str)
+    snapshot.insert(0, 'fetched_at', pd.Timestamp(fetched_at))
+
+    cartella = _partition_dir(fetched_at.date())
+    path = os.path.join(cartella, f"{fetched_at.strftime('%H%M%S_%f')}.parquet")
+    try:
+        os.makedirs(cartella, exist_ok=True)
+        snapshot.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+    except Exception:
+        # Lo storico è un extra: non deve mai far fallire l'aggiornamento dei dati
+        return None
+    _pulizia_giornaliera()
+    return path
+
+
+def _pulizia_giornaliera():
+    """prune_history al più una volta al giorno per processo (errori ignorati)"""
+    global _ultima_pulizia
+    oggi = date.today()
+    if _ultima_pulizia == oggi:
+        return
+    _ultima_pulizia = oggi
+    try:
+        prune_history(HISTORY_KEEP_DAYS)
+    except OSError:
+        pass
+
+
+def _partizioni(start=None, end=None):
+    """Cartelle delle date comprese tra start ed end (inclusi), in ordine"""
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    cartelle = []
+    for nome in sorted(os.listdir(HISTORY_DIR)):
+        if not nome.startswith(_PREFISSO_PARTIZIONE):
+            continue
+        try:
+            giorno = date.fromisoformat(nome[len(_PREFISSO_PARTIZIONE):])
+        except ValueError:
+            continue
+        if (start is None or giorno >= start) and (end is None or giorno <= end):
+            cartelle.append(os.path.join(HISTORY_DIR, nome))
+    return cartelle
+
+
+def load_history(start=None, end=None, symbols=None, columns=None, key='Symbol'):
+    """
+    Legge lo storico in un intervallo di date
+
+    Args:
+        start, end: date (incluse); None = senza limite
+        symbols: valori di key da leggere (None = tutti), filtrati in lettura
+        columns: colonne da leggere oltre a fetched_at e key (None = tutte)
+        key: colonna che identifica il titolo ('ticker' = EXCHANGE:SIMBOLO, univoco);
+             i file che non la contengono vengono saltati
+
+    Returns:
+        DataFrame ordinato per fetched_at (vuoto se non c'è storico)
+    """
+    if not PARQUET_AVAILABLE:
+        return pd.DataFrame()
+    if columns is not None:
+        columns = list(dict.fromkeys(['fetched_at', key] + list(columns)))
+    filters = [(key, 'in', list(symbols))] if symbols else None
+
+    frames = []
+    for cartella in _partizioni(start, end):
+        for nome in sorted(os.listdir(cartella)):
+            if not nome.endswith(".parquet"):
+                continue
+            path = os.path.join(cartella, nome)
+            try:
+                # Solo le colonne richieste presenti nel file (gli Score_ cambiano coi profili)
+                schema = pq.read_schema(path).names
+                if key not in schema:
+                    continue
+                presenti = [c for c in columns if c in schema] if columns is not None else None
+                frame = pd.read_parquet(path, columns=presenti, filters=filters)
+            except Exception:
+                continue
+            if not frame.empty:
+                frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values('fetched_at', kind='stable').reset_index(drop=True)
+
+
+def history_version(start=None, end=None):
+    """Partizioni nell'intervallo con la data di modifica (cambia a ogni scrittura o pulizia)"""
+    return tuple((os.path.basename(c), os.stat(c).st_mtime_ns) for c in _partizioni(start, end))
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _score_history(tickers, start, score_column, versione):
+    return load_history(start=start, symbols=list(tickers), key='ticker',
+                        columns=[score_column, 'Symbol', 'Price', 'Rating'])
+
+
+def score_history(tickers, days=30, score_column='Investment_Score'):
+    """
+    Traiettoria dello score (e di prezzo e rating) di uno o più ticker negli ultimi giorni
+
+    Serie distinte per ticker (EXCHANGE:SIMBOLO): nomi uguali su mercati diversi non si
+    mescolano. Il risultato resta in cache finché nessun file dello storico nell'intervallo cambia
+
+    Args:
+        tickers: ticker o lista di ticker
+        days: giorni di storico
+        score_column: colonna del punteggio (Investment_Score o Score_<profilo>)
+    """
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    start = date.today() - timedelta(days=days)
+    return _score_history(tuple(tickers), start, score_column, history_version(start))
+
+
+def prune_history(keep_days=365):
+    """Elimina le partizioni più vecchie di keep_days giorni; restituisce quante"""
+    limite = date.today() - timedelta(days=keep_days)
+    rimosse = 0
+    for cartella in _partizioni(end=limite - timedelta(days=1)):
+        for nome in os.listdir(cartella):
+            os.remove(os.path.join(cartella, nome))
+        os.rmdir(cartella)
+        rimosse += 1
+    return rimosse
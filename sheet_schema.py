@@ -0,0 +1,205 @@
+"""
+Schemi dei fogli Google e normalizzazione condivisa dai loader.
+
+Ogni tab ha uno schema dichiarativo (nomi colonne, date, dtype, colonne
+chiave per riconoscere le righe vuote); normalize_sheet applica lo schema
+con operazioni vettoriali sull'intero DataFrame, una sola volta per
+contenuto del foglio (chiave = digest del CSV).
+"""
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+from converters import apply_converters
+from filter_index import to_categoricals
+
+
+# Ordine delle colonne del foglio Proposte
+COLONNE_PROPOSTE = [
+    'DATA', 'RESPONSABILE', 'OPERAZIONE', 'STRUMENTO', 'QUANTITA',
+    'PMC', 'SL', 'TP', 'ORIZZONTE TEMPORALE', 'ALLEGATO',
+    'MOTIVAZIONE', 'LINK', 'IMMAGINE', 'VALUTA', 'ESITO',
+    'GALLOZ', 'STE', 'GARGIU', 'ALE', 'GIACA'
+]
+
+# Ordine delle colonne del foglio Ordini (dopo aver tolto le Unnamed)
+COLONNE_ORDINI = [
+    'DATA', 'TIME', 'COMPONENTE1', 'COMPONENTE2',
+    'VOTO A FAVORE', 'STATO', 'ASSET', 'PROPOSTA',
+    'ENTRY PRICE', 'N.AZIONI', 'VALUTA', '% SU TOT. PF.',
+    'TP', 'SL', 'TEMPO'
+]
+
+# Ordine delle colonne del foglio Transazioni
+COLONNE_TRANSAZIONI = [
+    'Data', 'Operazione', 'Strumento', 'PMC', 'Quantità',
+    'Totale', 'Valuta', 'Tasso di cambio', 'Commissioni', 'Controvalore €'
+]
+
+# Chiavi supportate da uno schema (tutte opzionali):
+#   drop_unnamed: rimuove le colonne 'Unnamed: n' generate da celle header vuote
+#   columns:      rinomina le prime len(columns) colonne (solo se ci sono tutte)
+#   row_number:   aggiunge ROW_NUMBER = riga nel foglio (header = riga 1)
+#   key_columns:  colonne (nome o posizione) che rendono valida una riga;
+#                 una riga è vuota se sono tutte vuote (default: tutte le colonne)
+#   defaults:     valore per le celle vuote di una colonna
+#   dates:        colonna -> formato (o tupla di formati provati in ordine)
+#   dtypes:       colonna -> dtype (numerici convertiti con to_numeric)
+#   categories:   colonne a bassa cardinalità convertite in category (filtri veloci)
+#   numeric:      colonna (nome o posizione) -> convertitore in converters.CONVERTERS;
+#                 aggiunge la colonna float64 '<nome>_NUM' accanto a quella testuale
+#   required:     colonne che devono avere un valore dopo la conversione
+SCHEMAS = {
+    "generico": {},
+    "portfolio": {
+        "key_columns": [2],  # Colonna C (TICKER)
+        "numeric": {8: "euro"},  # Colonna I (VALUE)
+    },
+    "portfolio_dati": {
+        "numeric": {2: "percent"},  # Colonna C (P&L%)
+    },
+    "ordini": {
+        "drop_unnamed": True,
+        "columns": COLONNE_ORDINI,
+        "row_number": True,
+        "defaults": {"STATO": "Attivo"},
+        "dates": {"DATA": "%d/%m/%Y"},
+        "numeric": {"N.AZIONI": "decimal", "ENTRY PRICE": "decimal"},
+    },
+    "proposte": {
+        "columns": COLONNE_PROPOSTE,
+        "row_number": True,
+        "key_columns": ['STRUMENTO', 'OPERAZIONE', 'RESPONSABILE'],
+        "dates": {
+            # Il webhook scrive l'ora con i punti (14.30.00)
+            "DATA": ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H.%M.%S"),
+            "ORIZZONTE TEMPORALE": "%d/%m/%Y",
+        },
+        "dtypes": {"ESITO": "Int64"},
+        "numeric": {"QUANTITA": "decimal", "PMC": "decimal"},
+    },
+    "transazioni": {
+        "columns": COLONNE_TRANSAZIONI,
+        "dates": {"Data": "%d/%m/%Y"},
+        "categories": ['Operazione', 'Strumento', 'Valuta'],
+        "required": ['Data'],
+    },
+}
+
+
+def _celle_vuote(df):
+    """Maschera delle celle vuote: NaN oppure stringa di soli spazi"""
+    vuote = df.isna().to_numpy().copy()
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object or pd.api.types.is_string_dtype(dtype):
+            testo = df.iloc[:, i]
+            vuote[:, i] |= testo.str.strip().eq('').fillna(False).to_numpy(dtype=bool)
+    return vuote
+
+
+def _risolvi_colonne(df, colonne):
+    """Converte posizioni intere in nomi di colonna, ignorando quelle assenti"""
+    nomi = []
+    for col in colonne:
+        if isinstance(col, int) and col not in df.columns:
+            if col < len(df.columns):
+                nomi.append(df.columns[col])
+        elif col in df.columns:
+            nomi.append(col)
+    return nomi
+
+
+def _converti_date(serie, formati):
+    """Prova i formati in ordine, riempiendo solo le celle non ancora convertite"""
+    if isinstance(formati, str):
+        formati = (formati,)
+    testo = serie.astype(str).str.strip()
+    risultato = pd.to_datetime(testo, format=formati[0], errors='coerce')
+    for formato in formati[1:]:
+        mancanti = risultato.isna()
+        if not mancanti.any():
+            break
+        risultato = risultato.where(~mancanti, pd.to_datetime(testo, format=formato, errors='coerce'))
+    return risultato
+
+
+def apply_schema(df, schema):
+    """Applica uno schema a un DataFrame grezzo (senza cache)"""
+    righe_originali = len(df)
+    df = df.copy()
+
+    if schema.get("drop_unnamed"):
+        df = df.loc[:, ~df.columns.astype(str).str.startswith('Unnamed')]
+
+    columns = schema.get("columns")
+    if columns and len(df.columns) >= len(columns):
+        df = df.iloc[:, :len(columns)]
+        df.columns = columns
+
+    if schema.get("row_number"):
+        # Numerata prima di scartare righe: deve restare la riga reale del foglio
+        df['ROW_NUMBER'] = np.arange(2, len(df) + 2)
+
+    # ⭐ Righe vuote rimosse con una sola maschera, ovunque si trovino ⭐
+    chiavi = _risolvi_colonne(df, schema.get("key_columns") or [c for c in df.columns if c != 'ROW_NUMBER'])
+    if chiavi and len(df):
+        vuote = _celle_vuote(df[chiavi]).all(axis=1)
+        df = df[~vuote]
+
+    for col, valore in schema.get("defaults", {}).items():
+        if col in df.columns:
+            df[col] = df[col].mask(_celle_vuote(df[[col]])[:, 0], valore)
+
+    for col, formati in schema.get("dates", {}).items():
+        if col in df.columns:
+            df[col] = _converti_date(df[col], formati)
+
+    for col, dtype in schema.get("dtypes", {}).items():
+        if col in df.columns:
+            if pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype)):
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+
+    to_categoricals(df, schema.get("categories", []))
+    
+    # ⭐ Valori italiani (€ 1.234,56 / 6,68%) convertiti una volta sola in float64 ⭐
+    numeric = {}
+    for col, tipo in schema.get("numeric", {}).items():
+        for nome in _risolvi_colonne(df, [col]):
+            numeric[nome] = tipo
+    apply_converters(df, numeric)
+
+    required = [col for col in schema.get("required", []) if col in df.columns]
+    if required:
+        df = df.dropna(subset=required)
+
+    df = df.reset_index(drop=True)
+    df.attrs['righe_originali'] = righe_originali
+    return df
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _normalizza(nome, digest, _df):
+    """Normalizzazione calcolata una volta per contenuto (chiave = nome schema + digest)"""
+    if _df.empty:
+        return None
+    return apply_schema(_df, SCHEMAS[nome])
+
+
+def normalize_sheet(nome, df, digest=None):
+    """
+    Normalizza un foglio con lo schema registrato
+
+    Args:
+        nome: chiave in SCHEMAS
+        df: DataFrame grezzo letto dal CSV
+        digest: digest del contenuto (da load_sheet); se assente niente cache
+
+    Returns:
+        DataFrame normalizzato, None se il foglio è vuoto
+    """
+    if digest is None:
+        return None if df.empty else apply_schema(df, SCHEMAS[nome])
+    return _normalizza(nome, digest, df)
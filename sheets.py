@@ -0,0 +1,721 @@
+"""
+Modulo condiviso per scaricare i fogli Google Sheets
+Tutti i loader (portfolio, transazioni, ordini, proposte) passano da qui,
+così riutilizzano le stesse connessioni keep-alive verso docs.google.com
+
+Ogni foglio è rivalidato (ETag/Last-Modified + hash del contenuto): se il CSV
+non è cambiato si riusa il DataFrame già parsato e il digest resta lo stesso,
+quindi anche le cache a valle indicizzate sul digest restano valide
+
+L'ultimo frame valido di ogni foglio è salvato su disco (Parquet): dopo un
+riavvio le pagine partono subito dallo snapshot mentre un thread in background
+scarica il foglio aggiornato, e se Google non risponde si resta sullo snapshot
+
+I fogli registrati con register_sheet() sono aggiornati da un unico thread di
+processo a intervalli fissi (con jitter e backoff): le sessioni leggono sempre
+l'ultimo frame in memoria senza mai attendere Google
+
+Dopo una scrittura via webhook patch_sheet() applica subito la stessa modifica
+al frame in cache (write-through ottimistico); il refresher lo riconcilia con
+il foglio reale pochi secondi dopo
+"""
+
+import streamlit as st
+import pandas as pd
+import requests
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import pyarrow  # noqa: F401 - motore Parquet per gli snapshot
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+# ==================== CONFIGURAZIONE ====================
+# URL base di export e webhook: sovrascrivibili per usare il server locale
+# fake_sheets_server.py (test ripetibili senza Google)
+SHEETS_BASE_URL = os.environ.get("FLUSSO_SHEETS_BASE_URL", "https://docs.google.com")
+WEBHOOK_URL_OVERRIDE = os.environ.get("FLUSSO_WEBHOOK_URL", "")
+
+# Connessioni massime tenute aperte per host (docs.google.com + redirect googleusercontent)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 10
+
+# Retry limitati: solo errori di rete e risposte 429/5xx
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+REQUEST_TIMEOUT = (5, 20)  # (connessione, lettura) in secondi
+
+# Fogli scaricati in parallelo da load_sheets (non oltre POOL_MAXSIZE)
+MAX_PARALLEL_FETCH = 6
+
+# Secondi entro cui un foglio già scaricato si considera fresco (nessuna richiesta)
+REVALIDATE_AFTER = 30
+
+# Refresh in background dei fogli registrati
+REFRESH_INTERVAL = 120       # secondi tra due aggiornamenti (default)
+REFRESH_JITTER = 0.1         # ±10% sull'intervallo, per non allineare le richieste
+REFRESH_MAX_BACKOFF = 900    # attesa massima dopo errori consecutivi
+
+# Write-through: riconciliazione delle patch ottimistiche
+RECONCILE_DELAY = 5          # secondi prima di riscaricare un foglio modificato
+PENDING_TTL = 300            # oltre questo tempo vince comunque il foglio reale
+
+# Cartella degli snapshot su disco (uno per foglio e opzioni di parsing)
+SNAPSHOT_DIR = os.environ.get("FLUSSO_SNAPSHOT_DIR", os.path.join(".flusso_cache", "sheets"))
+
+
+def sheet_export_url(spreadsheet_id, gid):
+    """URL di export CSV di un foglio pubblico"""
+    return f"{SHEETS_BASE_URL}/spreadsheets/d/{spreadsheet_id}/export?format=csv&gid={gid}"
+
+
+def resolve_webhook_url(url):
+    """URL del webhook Apps Script (FLUSSO_WEBHOOK_URL, se impostato, vale per tutti)"""
+    return WEBHOOK_URL_OVERRIDE or url
+
+
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    """
+    Sessione HTTP condivisa da tutte le sessioni Streamlit del processo
+    Pool di connessioni per host, gzip e retry con backoff
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    # pool_block=True: oltre POOL_MAXSIZE richieste contemporanee per host si attende
+    # una connessione libera invece di aprirne di nuove
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+        pool_block=True,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Accept": "text/csv,*/*;q=0.8",
+    })
+    return session
+
+
+def sheet_key(spreadsheet_id, gid):
+    """Chiave normalizzata di un foglio (gid può arrivare come int o str)"""
+    return (str(spreadsheet_id), str(gid))
+
+
+@st.cache_resource(show_spinner=False)
+def _get_sheet_store():
+    """Cache di processo dei fogli: contenuto, digest e frame parsati per chiave"""
+    return {
+        "lock": threading.Lock(),
+        "entries": {},
+        "key_locks": {},
+        "refreshing": set(),
+        "registry": {},
+        "wakeup": threading.Event(),
+    }
+
+
+def _key_lock(store, key):
+    """Lock dedicato al singolo foglio: rivalidazioni concorrenti fanno una sola richiesta"""
+    with store["lock"]:
+        return store["key_locks"].setdefault(key, threading.Lock())
+
+
+def _frame_key(read_csv_kwargs):
+    return tuple(sorted(read_csv_kwargs.items()))
+
+
+# ==================== SNAPSHOT SU DISCO ====================
+
+def _snapshot_paths(key, read_csv_kwargs):
+    """Percorsi (parquet, json) dello snapshot di un foglio per le opzioni date"""
+    suffix = hashlib.sha1(repr(_frame_key(read_csv_kwargs)).encode("utf-8")).hexdigest()[:10]
+    base = os.path.join(SNAPSHOT_DIR, f"{key[0]}_{key[1]}", suffix)
+    return base + ".parquet", base + ".json"
+
+
+def _save_snapshot(key, entry, read_csv_kwargs, df):
+    """Salva l'ultimo frame valido (scrittura atomica, errori ignorati)"""
+    if not PARQUET_AVAILABLE:
+        return
+    parquet_path, meta_path = _snapshot_paths(key, read_csv_kwargs)
+    try:
+        os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+        
+        # Parquet vuole nomi di colonna stringa (header=None produce interi)
+        int_columns = all(isinstance(c, int) for c in df.columns)
+        df_disk = df.copy()
+        df_disk.columns = [str(c) for c in df.columns]
+        
+        df_disk.to_parquet(parquet_path + ".tmp", index=False)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "digest": entry["digest"],
+                "etag": entry["etag"],
+                "last_modified": entry["last_modified"],
+                "fetched_at": entry["checked_at"],
+                "read_csv_kwargs": read_csv_kwargs,
+                "int_columns": int_columns,
+            }, f)
+        os.replace(parquet_path + ".tmp", parquet_path)
+        os.replace(meta_path + ".tmp", meta_path)
+    except Exception:
+        # Lo snapshot è solo un'ottimizzazione: non deve mai rompere il caricamento
+        return
+    _prune_snapshots(key, entry["digest"], entry["checked_at"])
+
+
+def _prune_snapshots(key, digest, fetched_at):
+    """
+    Elimina gli snapshot dello stesso foglio con un altro digest scaricati prima di fetched_at
+
+    Uno snapshot più recente (salvato da un thread con un'entry più nuova) resta sempre
+    """
+    cartella = os.path.join(SNAPSHOT_DIR, f"{key[0]}_{key[1]}")
+    try:
+        nomi = os.listdir(cartella)
+    except OSError:
+        return
+    for nome in nomi:
+        if not nome.endswith(".json"):
+            continue
+        meta_path = os.path.join(cartella, nome)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("digest") == digest or meta.get("fetched_at", 0) >= fetched_at:
+            continue
+        for path in (meta_path[:-len(".json")] + ".parquet", meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _load_snapshot(key, read_csv_kwargs):
+    """
+    Ricostruisce un'entry (stale) dallo snapshot su disco
+    
+    Returns:
+        dict o None: entry senza contenuto grezzo, con il solo frame richiesto
+    """
+    if not PARQUET_AVAILABLE:
+        return None
+    parquet_path, meta_path = _snapshot_paths(key, read_csv_kwargs)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        df = pd.read_parquet(parquet_path)
+    except Exception:
+        return None
+    
+    if meta.get("int_columns"):
+        df.columns = [int(c) for c in df.columns]
+    
+    return {
+        "content": None,
+        "digest": meta["digest"],
+        "etag": meta.get("etag"),
+        "last_modified": meta.get("last_modified"),
+        "checked_at": 0.0,  # sempre da rivalidare
+        "forced": False,
+        "from_snapshot": True,
+        "snapshot_time": meta.get("fetched_at"),
+        "frames": {_frame_key(read_csv_kwargs): (df, read_csv_kwargs)},
+    }
+
+
+# ==================== RIVALIDAZIONE ====================
+
+def _parse_frame(key, entry, read_csv_kwargs):
+    """Parsa il contenuto grezzo, lo memorizza nell'entry e aggiorna lo snapshot"""
+    df = pd.read_csv(BytesIO(entry["content"]), **read_csv_kwargs)
+    entry["frames"][_frame_key(read_csv_kwargs)] = (df, read_csv_kwargs)
+    _save_snapshot(key, entry, read_csv_kwargs, df)
+    return df
+
+
+def _revalidate(store, session, key):
+    """
+    Richiesta condizionale del foglio (If-None-Match / If-Modified-Since)
+    Con 304 o con lo stesso hash del contenuto l'entry esistente viene riusata
+    senza riparsare; altrimenti la nuova entry sostituisce la vecchia, già
+    parsata con le stesse opzioni, così lo scambio non costa nulla ai lettori
+    """
+    requested_at = time.time()
+    with _key_lock(store, key):
+        entry = store["entries"].get(key)
+        
+        # Rivalidata da un altro thread mentre si attendeva il lock: riusala
+        if entry is not None and not entry["forced"] and entry["checked_at"] >= requested_at:
+            return entry
+        
+        # no-cache: eventuali proxy devono rivalidare (sostituisce il vecchio &t=timestamp)
+        headers = {"Cache-Control": "no-cache"}
+        if entry is not None and entry["content"] is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        
+        response = session.get(
+            sheet_export_url(*key),
+            headers=headers,
+            timeout=REQUEST_TIMEOUT,
+            allow_redirects=True,
+        )
+        now = time.time()
+        
+        if response.status_code == 304 and entry is not None:
+            entry.update(checked_at=now, forced=False)
+            return entry
+        
+        response.raise_for_status()
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        
+        if entry is not None and entry.get("pending"):
+            # Patch ottimistica: finché Google restituisce il contenuto precedente alla
+            # scrittura si tiene la patch; contenuto nuovo (o attesa scaduta) la sostituisce
+            if digest == entry["base_digest"] and now - entry["pending_since"] < PENDING_TTL:
+                entry.update(checked_at=now, forced=False)
+                return entry
+        elif entry is not None and entry["digest"] == digest:
+            # Contenuto identico: niente parsing, frame e digest restano validi
+            entry.update(
+                content=content, checked_at=now, forced=False, from_snapshot=False,
+                etag=etag, last_modified=last_modified,
+            )
+            return entry
+        
+        new_entry = {
+            "content": content,
+            "digest": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "checked_at": now,
+            "forced": False,
+            "from_snapshot": False,
+            "snapshot_time": None,
+            "frames": {},
+        }
+        if entry is not None:
+            for _, read_csv_kwargs in entry["frames"].values():
+                _parse_frame(key, new_entry, read_csv_kwargs)
+        
+        store["entries"][key] = new_entry
+        return new_entry
+
+
+def _refresh_in_background(store, session, key):
+    """Rivalida il foglio in un thread daemon (al massimo uno in volo per foglio)"""
+    with store["lock"]:
+        if key in store["refreshing"]:
+            return
+        store["refreshing"].add(key)
+    
+    def worker():
+        try:
+            _revalidate(store, session, key)
+        except Exception:
+            # Offline o errore HTTP: si continua a servire l'entry esistente
+            pass
+        finally:
+            with store["lock"]:
+                store["refreshing"].discard(key)
+    
+    threading.Thread(target=worker, name=f"sheet-refresh-{key[1]}", daemon=True).start()
+
+
+def _get_entry(store, session, key, max_age, read_csv_kwargs):
+    """
+    Stale-while-revalidate:
+    - entry fresca -> restituita subito
+    - entry scaduta o caricata da snapshot -> restituita subito, refresh in background
+    - nessuna entry, refresh forzato o frame mancante -> download bloccante,
+      con fallback sull'entry esistente se Google non è raggiungibile
+    """
+    entry = store["entries"].get(key)
+    
+    frame_key = _frame_key(read_csv_kwargs)
+    
+    if entry is None:
+        entry = _load_snapshot(key, read_csv_kwargs)
+        if entry is not None:
+            with store["lock"]:
+                entry = store["entries"].setdefault(key, entry)
+    elif frame_key not in entry["frames"] and entry["content"] is None:
+        # Entry da snapshot con altre opzioni di parsing: prova lo snapshot corrispondente
+        snapshot = _load_snapshot(key, read_csv_kwargs)
+        if snapshot is not None and snapshot["digest"] == entry["digest"]:
+            entry["frames"].update(snapshot["frames"])
+    
+    if entry is not None and not entry["forced"]:
+        has_frame = frame_key in entry["frames"] or entry["content"] is not None
+        if has_frame:
+            # I fogli registrati sono aggiornati dal refresher di processo
+            if time.time() - entry["checked_at"] >= max_age and not _is_registered(store, key):
+                _refresh_in_background(store, session, key)
+            return entry
+    
+    try:
+        return _revalidate(store, session, key)
+    except Exception:
+        if entry is not None and frame_key in entry["frames"]:
+            # Google non raggiungibile: si serve l'ultimo frame valido
+            entry["forced"] = False
+            return entry
+        raise
+
+
+def _frame_from_entry(key, entry, read_csv_kwargs):
+    """DataFrame parsato dall'entry, calcolato una sola volta per digest e opzioni"""
+    cached = entry["frames"].get(_frame_key(read_csv_kwargs))
+    if cached is not None:
+        return cached[0]
+    if entry["content"] is None:
+        # Entry con patch ottimistica: le altre opzioni di parsing leggono l'ultimo
+        # contenuto di Google (senza la patch), senza memorizzarlo nell'entry
+        base_content = entry.get("base_content")
+        if base_content is None:
+            raise LookupError(f"Foglio {key[1]}: contenuto non disponibile per queste opzioni di parsing")
+        return pd.read_csv(BytesIO(base_content), **read_csv_kwargs)
+    return _parse_frame(key, entry, read_csv_kwargs)
+
+
+def fetch_sheet(spreadsheet_id, gid, max_age=REVALIDATE_AFTER, session=None):
+    """
+    Restituisce l'entry in cache del foglio, rivalidandola in modo bloccante
+    se più vecchia di max_age
+    
+    Returns:
+        dict: content, digest, etag, last_modified, checked_at, frames
+    """
+    store = _get_sheet_store()
+    key = sheet_key(spreadsheet_id, gid)
+    entry = store["entries"].get(key)
+    if entry is not None and not entry["forced"] and time.time() - entry["checked_at"] < max_age:
+        return entry
+    return _revalidate(store, session or get_http_session(), key)
+
+
+def load_sheet(spreadsheet_id, gid, max_age=REVALIDATE_AFTER, **read_csv_kwargs):
+    """
+    Carica un foglio (stale-while-revalidate, con snapshot su disco)
+    
+    Returns:
+        tuple: (DataFrame condiviso - non modificarlo in place, digest del contenuto)
+    """
+    return _load_frame(_get_sheet_store(), get_http_session(), sheet_key(spreadsheet_id, gid),
+                       max_age, read_csv_kwargs)
+
+
+def _load_frame(store, session, key, max_age, read_csv_kwargs):
+    """Entry del foglio e DataFrame parsato: (DataFrame, digest)"""
+    entry = _get_entry(store, session, key, max_age, read_csv_kwargs)
+    return _frame_from_entry(key, entry, read_csv_kwargs), entry["digest"]
+
+
+def read_sheet_csv(spreadsheet_id, gid, max_age=REVALIDATE_AFTER, **read_csv_kwargs):
+    """Scarica un foglio e lo converte in DataFrame (argomenti extra passati a pd.read_csv)"""
+    df, _ = load_sheet(spreadsheet_id, gid, max_age=max_age, **read_csv_kwargs)
+    return df
+
+
+def load_sheets(sheets, max_age=REVALIDATE_AFTER, **read_csv_kwargs):
+    """
+    Versione batch di load_sheet: download e parsing dei fogli avvengono
+    in parallelo nei worker, i duplicati una sola volta
+    
+    Args:
+        sheets: lista di coppie (spreadsheet_id, gid)
+    
+    Returns:
+        list: coppie (DataFrame, digest) nello stesso ordine di `sheets`
+    """
+    keys = list(dict.fromkeys(sheet_key(sid, gid) for sid, gid in sheets))
+    if not keys:
+        return []
+    
+    # Store e sessione vanno risolti nel thread dello script, non nei worker
+    store = _get_sheet_store()
+    session = get_http_session()
+    
+    with ThreadPoolExecutor(max_workers=min(len(keys), MAX_PARALLEL_FETCH)) as executor:
+        futures = {
+            key: executor.submit(_load_frame, store, session, key, max_age, read_csv_kwargs)
+            for key in keys
+        }
+        # result() rilancia l'eventuale eccezione del singolo foglio
+        loaded = {key: future.result() for key, future in futures.items()}
+    
+    return [loaded[sheet_key(sid, gid)] for sid, gid in sheets]
+
+
+def mark_sheets_stale(sheets=None):
+    """
+    Forza una rivalidazione bloccante al prossimo accesso (tutti i fogli se sheets è None)
+    Non scarta nulla: se il contenuto non è cambiato frame e digest restano validi
+    """
+    store = _get_sheet_store()
+    keys = None if sheets is None else {sheet_key(sid, gid) for sid, gid in sheets}
+    for key, entry in list(store["entries"].items()):
+        if keys is None or key in keys:
+            entry["forced"] = True
+
+
+# ==================== REFRESH IN BACKGROUND ====================
+
+def _is_registered(store, key):
+    with store["lock"]:
+        return any(job["key"] == key for job in store["registry"].values())
+
+
+def _run_refresh_job(store, session, job):
+    """Aggiorna un foglio registrato e pianifica il prossimo giro (backoff sugli errori)"""
+    key = job["key"]
+    try:
+        entry = store["entries"].get(key)
+        # Se un altro job sullo stesso foglio l'ha appena rivalidato, basta il parsing;
+        # una patch in attesa si riconcilia sempre (il job è stato anticipato apposta)
+        if (entry is None or entry["forced"] or entry.get("pending")
+                or time.time() - entry["checked_at"] >= job["interval"] / 2):
+            entry = _revalidate(store, session, key)
+        _frame_from_entry(key, entry, job["read_csv_kwargs"])
+        job["failures"] = 0
+        delay = job["interval"]
+    except Exception:
+        job["failures"] += 1
+        delay = min(job["interval"] * 2 ** job["failures"], REFRESH_MAX_BACKOFF)
+    
+    job["next_run"] = time.time() + delay * (1 + random.uniform(-REFRESH_JITTER, REFRESH_JITTER))
+
+
+def _refresher_loop(store, session):
+    """Loop del thread di refresh: esegue i job scaduti e dorme fino al prossimo"""
+    while True:
+        now = time.time()
+        with store["lock"]:
+            due = [job for job in store["registry"].values() if job["next_run"] <= now]
+        
+        for job in due:
+            _run_refresh_job(store, session, job)
+        
+        with store["lock"]:
+            next_runs = [job["next_run"] for job in store["registry"].values()]
+        timeout = max(0.5, min(next_runs) - time.time()) if next_runs else None
+        
+        # register_sheet() sveglia il thread per eseguire subito i nuovi job
+        store["wakeup"].wait(timeout)
+        store["wakeup"].clear()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_refresher():
+    """Thread di refresh unico per processo, condiviso da tutte le sessioni"""
+    thread = threading.Thread(
+        target=_refresher_loop,
+        args=(_get_sheet_store(), get_http_session()),
+        name="sheet-refresher",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def register_sheet(name, spreadsheet_id, gid, interval=REFRESH_INTERVAL, **read_csv_kwargs):
+    """
+    Registra un foglio nel refresher di processo (idempotente)
+    
+    Args:
+        name: nome logico del foglio (es. "ordini")
+        interval: secondi tra due aggiornamenti
+        read_csv_kwargs: opzioni di parsing con cui tenere pronto il frame
+    """
+    store = _get_sheet_store()
+    key = sheet_key(spreadsheet_id, gid)
+    
+    with store["lock"]:
+        job = store["registry"].get(name)
+        changed = (
+            job is None
+            or job["key"] != key
+            or job["interval"] != interval
+            or job["read_csv_kwargs"] != read_csv_kwargs
+        )
+        if changed:
+            store["registry"][name] = {
+                "key": key,
+                "interval": interval,
+                "read_csv_kwargs": read_csv_kwargs,
+                "next_run": time.time(),
+                "failures": 0,
+            }
+    
+    _get_refresher()
+    if changed:
+        store["wakeup"].set()
+
+
+def invalidate(*names):
+    """
+    Invalida solo i fogli registrati indicati (es. invalidate("ordini") dopo un webhook)
+    Il prossimo accesso li rivalida in modo bloccante; tutte le altre cache restano calde
+    
+    Returns:
+        int: numero di fogli invalidati (i nomi non registrati vengono ignorati)
+    """
+    store = _get_sheet_store()
+    with store["lock"]:
+        keys = [store["registry"][name]["key"] for name in names if name in store["registry"]]
+    mark_sheets_stale(keys)
+    return len(keys)
+
+
+# ==================== WRITE-THROUGH ====================
+
+def _schedule_reconcile(store, key):
+    """Anticipa il refresh del foglio per riconciliare la patch con Google"""
+    reconcile_at = time.time() + RECONCILE_DELAY
+    with store["lock"]:
+        for job in store["registry"].values():
+            if job["key"] == key:
+                job["next_run"] = min(job["next_run"], reconcile_at)
+    store["wakeup"].set()
+
+
+def patch_sheet(name, mutate):
+    """
+    Applica subito una modifica al frame in cache di un foglio registrato
+    
+    Args:
+        name: nome logico del foglio (es. "ordini")
+        mutate: funzione che riceve una copia del frame grezzo e restituisce il frame modificato
+    
+    Returns:
+        bool: True se la patch è stata applicata, False se il foglio non era in cache
+              (in quel caso viene solo invalidato)
+    """
+    store = _get_sheet_store()
+    with store["lock"]:
+        job = store["registry"].get(name)
+    if job is None:
+        return False
+    
+    key = job["key"]
+    frame_key = _frame_key(job["read_csv_kwargs"])
+    
+    with _key_lock(store, key):
+        entry = store["entries"].get(key)
+        if entry is None or frame_key not in entry["frames"]:
+            entry = None
+        else:
+            df, read_csv_kwargs = entry["frames"][frame_key]
+            patched_df = mutate(df.copy())
+            
+            pending = entry.get("pending", False)
+            base_digest = entry["base_digest"] if pending else entry["digest"]
+            
+            # Nuova entry (le sessioni che leggono quella vecchia non vedono frame a metà).
+            # Il digest cambia, così anche le cache a valle si aggiornano; il contenuto
+            # grezzo non corrisponde più al frame e le altre opzioni di parsing vengono scartate
+            store["entries"][key] = dict(
+                entry,
+                content=None,
+                digest=hashlib.sha256(f"{entry['digest']}|patch|{time.time()}".encode("utf-8")).hexdigest(),
+                frames={frame_key: (patched_df, read_csv_kwargs)},
+                pending=True,
+                base_digest=base_digest,
+                base_content=entry["base_content"] if pending else entry["content"],
+                pending_since=entry["pending_since"] if pending else time.time(),
+                forced=False,
+            )
+    
+    if entry is None:
+        mark_sheets_stale([key])
+        return False
+    
+    _schedule_reconcile(store, key)
+    return True
+
+
+def is_sheet_pending(name):
+    """True se il foglio ha modifiche ottimistiche non ancora confermate da Google"""
+    store = _get_sheet_store()
+    with store["lock"]:
+        job = store["registry"].get(name)
+    if job is None:
+        return False
+    entry = store["entries"].get(job["key"])
+    return bool(entry is not None and entry.get("pending"))
+
+
+def _ensure_column_accepts(df, column, value):
+    """Converte la colonna in object se il dtype non può contenere il valore (es. float tutta NaN)"""
+    if isinstance(value, str) and not (
+        pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])
+    ):
+        df[column] = df[column].astype(object)
+
+
+def set_cell(df, row_number, column_position, value):
+    """
+    Imposta una cella del frame grezzo usando il numero di riga del foglio
+    (riga 1 = intestazione, quindi la riga N è la posizione N-2 del frame)
+    """
+    position = int(row_number) - 2
+    if 0 <= position < len(df) and 0 <= column_position < len(df.columns):
+        column = df.columns[column_position]
+        _ensure_column_accepts(df, column, value)
+        df.iloc[position, column_position] = value
+    return df
+
+
+def append_row(df, values):
+    """
+    Aggiunge una riga con i valori in ordine di colonna (le colonne mancanti restano vuote)
+
+    Come appendRow di Apps Script la riga va subito dopo l'ultima con contenuto:
+    le righe vuote in coda vengono scartate, così il numero di riga coincide col foglio
+    """
+    vuote = df.isna() | df.apply(lambda colonna: colonna.astype(str).str.strip().eq(""))
+    piene = (~vuote.all(axis=1)).to_numpy().nonzero()[0]
+    ultime = piene[-1] + 1 if len(piene) else 0
+    if ultime < len(df):
+        df = df.iloc[:ultime].copy()
+    
+    values = list(values)[:len(df.columns)]
+    values += [float("nan")] * (len(df.columns) - len(values))
+    for column, value in zip(df.columns, values):
+        _ensure_column_accepts(df, column, value)
+    row = pd.DataFrame([values], columns=df.columns).astype(df.dtypes.to_dict(), errors="ignore")
+    return pd.concat([df, row], ignore_index=True)
@@ -0,0 +1,31 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# I moduli dell'app sono nella radice del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sheets  # noqa: E402
+from fake_sheets_server import FakeSheets, make_handler  # noqa: E402
+
+
+@pytest.fixture
+def fake_google(monkeypatch, tmp_path):
+    fogli = FakeSheets()
+    # Niente snapshot da esecuzioni precedenti
+    monkeypatch.setattr(sheets, "SNAPSHOT_DIR", str(tmp_path))
+    sheets._get_sheet_store()["entries"].clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(fogli))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(sheets, "SHEETS_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(sheets, "RECONCILE_DELAY", 0.5)
+    yield fogli
+    server.shutdown()
+    server.server_close()
+    store = sheets._get_sheet_store()
+    with store["lock"]:
+        store["registry"].clear()
+    store["entries"].clear()
@@ -0,0 +1,26 @@
+import portfolio
+import portfolio_global
+from converters import numeric_name
+from fake_sheets_server import GID_RIEPILOGO
+
+
+def test_posizioni_e_riepilogo_dalle_fixture(fake_google, monkeypatch):
+    # Portfolio: gid 0 come tabella delle posizioni (header=0, schema "portfolio")
+    posizioni = portfolio.load_sheet_csv(portfolio_global.SPREADSHEET_ID_PORTFOLIO, "0", "portfolio")
+    assert posizioni['TICKER'].tolist() == ['AAPL', 'MSFT', 'ENI.MI', 'VWCE', 'ISP.MI', 'BTP35', 'NVDA', 'SWDA']
+    valori = posizioni[numeric_name('VALUE')]
+    assert valori.dtype == 'float64'
+    assert valori.iloc[0] == 25699.05
+
+    # Riepilogo: foglio dedicato letto con header=None a celle fisse
+    monkeypatch.setattr(portfolio_global, "GID_PORTFOLIO", GID_RIEPILOGO)
+    portfolio_global._load_portfolio_from_sheets.clear()
+    dati = portfolio_global._load_portfolio_from_sheets()
+
+    assert dati is not None
+    assert dati['deposit'] == 67490.92
+    assert dati['value_eur'] == 74989.92
+    assert dati['pl_tot'] == 7498.99
+    assert dati['commission_tax'] == 312.40
+    assert dati['cash_disp'] == 15230.55
+    assert dati['cash_indisp'] == 1200.00
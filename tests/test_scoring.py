@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import scoring
+
+
+# ==================== VERSIONE SCALARE PRECEDENTE ====================
+# Copia delle funzioni riga per riga usate prima dei profili vettoriali
+
+def _rsi(rsi):
+    if pd.isna(rsi):
+        return 0
+    if 50 <= rsi <= 70:
+        return 10
+    elif 40 <= rsi < 50:
+        return 7
+    elif 30 <= rsi < 40:
+        return 5
+    elif rsi > 80:
+        return 2
+    return 1
+
+
+def _macd(macd, signal):
+    if pd.isna(macd) or pd.isna(signal):
+        return 0
+    diff = macd - signal
+    if diff > 0.05:
+        return 10
+    elif diff > 0:
+        return 7
+    elif diff > -0.05:
+        return 4
+    return 1
+
+
+def _trend(price, sma50, sma200):
+    if pd.isna(price) or pd.isna(sma50) or pd.isna(sma200):
+        return 0
+    score = 0
+    if price > sma50:
+        score += 5
+    if price > sma200:
+        score += 3
+    if sma50 > sma200:
+        score += 2
+    return score
+
+
+def _rating(rating):
+    if pd.isna(rating):
+        return 0
+    if rating >= 0.5:
+        return 10
+    elif rating >= 0.3:
+        return 8
+    elif rating >= 0.1:
+        return 6
+    elif rating >= -0.1:
+        return 4
+    return 2
+
+
+def _volatility(vol):
+    if pd.isna(vol):
+        return 0
+    if 0.5 <= vol <= 2.0:
+        return 10
+    elif 0.3 <= vol < 0.5:
+        return 7
+    elif 2.0 < vol <= 3.0:
+        return 6
+    elif vol > 3.0:
+        return 3
+    return 2
+
+
+def _mcap(mcap):
+    if pd.isna(mcap):
+        return 0
+    if 1e9 <= mcap <= 50e9:
+        return 10
+    elif 50e9 < mcap <= 200e9:
+        return 8
+    elif 500e6 <= mcap < 1e9:
+        return 6
+    return 4
+
+
+def _score_scalare(df):
+    out = pd.DataFrame(index=df.index)
+    out['RSI_Score'] = df['RSI'].apply(_rsi)
+    out['MACD_Score'] = [_macd(m, s) for m, s in zip(df['MACD.macd'], df['MACD.signal'])]
+    out['Trend_Score'] = [_trend(p, a, b) for p, a, b in zip(df['close'], df['SMA50'], df['SMA200'])]
+    out['Tech_Rating_Score'] = df['Recommend.All'].apply(_rating)
+    out['Volatility_Score'] = df['Volatility.D'].apply(_volatility)
+    out['MCap_Score'] = df['market_cap_basic'].apply(_mcap)
+    totale = (out['RSI_Score'] * 0.20 + out['MACD_Score'] * 0.15 + out['Trend_Score'] * 0.25
+              + out['Tech_Rating_Score'] * 0.20 + out['Volatility_Score'] * 0.10 + out['MCap_Score'] * 0.10)
+    out['Investment_Score'] = (totale / (10 * 1.0) * 100).round(1)
+    return out
+
+
+# ==================== CASI AI CONFINI DELLE FASCE ====================
+
+def _frame_confini():
+    nan = np.nan
+    colonne = {
+        'RSI': [nan, 0, 29.99, 30, 39.99, 40, 49.99, 50, 60, 70, 70.01, 80, 80.01],
+        'MACD.macd': [nan, 0.0, 0.05, 0.06, 0.01, 0.0, -0.05, -0.06, 1.0],
+        'MACD.signal': [0.0, nan, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
+        'close': [nan, 10, 10, 11, 9, 10, 12],
+        'SMA50': [10, nan, 10, 10, 10, 11, 11],
+        'SMA200': [10, 10, nan, 10, 10, 10, 11],
+        'Recommend.All': [nan, -1, -0.11, -0.1, 0.0, 0.1, 0.29, 0.3, 0.5, 1],
+        'Volatility.D': [nan, 0, 0.29, 0.3, 0.49, 0.5, 2.0, 2.01, 3.0, 3.01],
+        'market_cap_basic': [nan, 1e8, 500e6, 999e6, 1e9, 50e9, 50.1e9, 200e9, 201e9],
+    }
+    righe = max(len(v) for v in colonne.values())
+    return pd.DataFrame({k: v + [nan] * (righe - len(v)) for k, v in colonne.items()})
+
+
+def _profilo_default():
+    path = os.path.join(scoring.PROFILES_DIR, f"{scoring.DEFAULT_PROFILE}.json")
+    return scoring.compile_profile(scoring.load_profile(path))
+
+
+def test_profilo_vettoriale_uguale_alla_versione_scalare():
+    df = _frame_confini()
+    atteso = _score_scalare(df)
+    ottenuto = scoring.score_profiles(df, [_profilo_default()])
+
+    for colonna in atteso.columns:
+        np.testing.assert_array_equal(
+            ottenuto[colonna].to_numpy(dtype=float), atteso[colonna].to_numpy(dtype=float), err_msg=colonna
+        )
+
+
+def test_colonna_score_solo_per_i_profili_non_primari():
+    profili = [scoring.compile_profile(scoring.load_profile(os.path.join(scoring.PROFILES_DIR, nome)))
+               for nome in sorted(os.listdir(scoring.PROFILES_DIR))]
+    primario = _profilo_default()["name"]
+    df = _frame_confini()
+
+    solo_primario = scoring.score_profiles(df, [p for p in profili if p["name"] == primario])
+    assert not [c for c in solo_primario.columns if c.startswith("Score_")]
+
+    tutti = scoring.score_profiles(df, profili, primary=primario)
+    assert sorted(c for c in tutti.columns if c.startswith("Score_")) == sorted(
+        scoring.score_column(p["name"]) for p in profili if p["name"] != primario
+    )
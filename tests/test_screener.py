@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import screener
+
+
+def _frame():
+    return pd.DataFrame({
+        'ticker': ['NASDAQ:AAA', 'NASDAQ:BBB'],
+        'name': ['AAA', 'BBB'],
+        'description': ['Aaa Inc.', 'Bbb Inc.'],
+        'country': ['United States', 'United States'],
+        'sector': ['Technology', 'Energy'],
+        'currency': ['USD', 'USD'],
+        'close': [100.0, 50.0],
+        'change': [1.0, -1.0],
+        'RSI': [49.96, 60.0],
+        'MACD.macd': [1.0, 1.0],
+        'MACD.signal': [0.5, 0.5],
+        'SMA50': [90.0, 45.0],
+        'SMA200': [80.0, 40.0],
+        'Recommend.All': [0.4, 0.2],
+        'Volatility.D': [1.0, 1.0],
+        'market_cap_basic': [5e9, 5e9],
+    })
+
+
+def test_rescoring_usa_rsi_non_arrotondato(monkeypatch):
+    df = screener.prepare_screener_frame(_frame())
+    # 49.96 arrotondato a 50.0 finirebbe nella fascia 50-70
+    assert df['RSI'].iloc[0] == 49.96
+    assert df['RSI_Score'].iloc[0] == 7
+
+    quotes = pd.DataFrame({'close': [101.0, 50.0], 'change': [2.0, -1.0]}, index=['NASDAQ:AAA', 'NASDAQ:BBB'])
+    monkeypatch.setattr(screener, "fetch_tickers", lambda tickers, columns, ttl=None: (quotes, {}))
+
+    aggiornato, mosse = screener.refresh_quotes(df)
+    assert mosse == 1
+    assert aggiornato['RSI_Score'].iloc[0] == 7
+    np.testing.assert_array_equal(aggiornato['Investment_Score'].to_numpy(), df['Investment_Score'].to_numpy())
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from screener_cube import build_screener_cube, cube_options
+
+
+def test_rating_mancante_non_diventa_nan():
+    df = pd.DataFrame({
+        'Country': ['Italy', 'Italy', 'Germany'],
+        'Sector': ['Energy', 'Finance', 'Energy'],
+        'Rating': pd.Categorical(['🟢 Buy', np.nan, 'N/A']),
+        'Investment_Score': [70.0, 55.0, 40.0],
+    })
+
+    opzioni = cube_options(build_screener_cube(df))
+
+    assert 'nan' not in opzioni['Rating']
+    assert opzioni['Rating'] == ['N/A', '🟢 Buy']
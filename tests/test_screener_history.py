@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import screener_history
+
+
+def test_storico_per_ticker_e_colonna_del_profilo(monkeypatch, tmp_path):
+    monkeypatch.setattr(screener_history, "HISTORY_DIR", str(tmp_path))
+    df = pd.DataFrame({
+        'ticker': ['MIL:ENI', 'XETR:ENI'],
+        'Symbol': ['ENI', 'ENI'],
+        'Investment_Score': [70.0, 40.0],
+        'Score_value_quality': [55.0, 65.0],
+        'Price': [14.0, 14.1],
+        'Rating': ['🟢 Buy', '🟡 Neutral'],
+    })
+    adesso = datetime.now()
+    screener_history.append_snapshot(df, adesso - timedelta(hours=1))
+    screener_history.append_snapshot(df, adesso)
+
+    storico = screener_history.score_history(['MIL:ENI'], days=7, score_column='Score_value_quality')
+
+    assert storico['ticker'].tolist() == ['MIL:ENI', 'MIL:ENI']
+    assert storico['Score_value_quality'].tolist() == [55.0, 55.0]
+    assert 'Investment_Score' not in storico.columns
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import sheets
+from fake_sheets_server import GID_ORDINI, GID_PROPOSTE
+
+
+def _attendi(condizione, timeout=5):
+    fine = time.time() + timeout
+    while time.time() < fine:
+        if condizione():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_patch_riconciliata_dopo_reconcile_delay(fake_google):
+    # Prima il download, poi la registrazione: il primo giro del refresher trova l'entry
+    # fresca e non scarica di nuovo il foglio dopo la scrittura del webhook
+    sheets.load_sheet("fake", GID_ORDINI)
+    sheets.register_sheet("ordini_test", "fake", GID_ORDINI, interval=600)
+
+    # Il webhook scrive su Google, l'app applica la stessa modifica in cache
+    fake_google.set_cell(GID_ORDINI, 2, 5, "Eseguito")
+    assert sheets.patch_sheet("ordini_test", lambda df: sheets.set_cell(df, 2, 5, "Eseguito"))
+    assert sheets.is_sheet_pending("ordini_test")
+
+    assert _attendi(lambda: not sheets.is_sheet_pending("ordini_test"))
+    df, _ = sheets.load_sheet("fake", GID_ORDINI)
+    assert df.iloc[0, 5] == "Eseguito"
+
+
+def test_entry_in_attesa_con_altre_opzioni_di_parsing(fake_google):
+    sheets.register_sheet("ordini_test_2", "fake", GID_ORDINI, interval=600)
+    sheets.load_sheet("fake", GID_ORDINI)
+    assert sheets.patch_sheet("ordini_test_2", lambda df: sheets.set_cell(df, 2, 5, "Eseguito"))
+
+    # Stesso foglio letto con header=None mentre la patch è in attesa: niente TypeError
+    df, _ = sheets.load_sheet("fake", GID_ORDINI, header=None)
+    assert len(df) > 1
+
+
+def test_snapshot_di_digest_precedenti_eliminati(fake_google, tmp_path):
+    sheets.load_sheet("fake", GID_ORDINI)
+    sheets.load_sheet("fake", GID_ORDINI, header=None)
+    cartella = tmp_path / f"fake_{GID_ORDINI}"
+    assert len(list(cartella.glob("*.parquet"))) == 2
+
+    # Riavvio con il foglio cambiato nel frattempo: la rivalidazione dello snapshot
+    # salva il nuovo digest ed elimina lo snapshot rimasto al digest precedente
+    sheets._get_sheet_store()["entries"].clear()
+    fake_google.set_cell(GID_ORDINI, 2, 5, "Annullato")
+    sheets.load_sheet("fake", GID_ORDINI)
+    assert _attendi(lambda: len(list(cartella.glob("*.parquet"))) == 1)
+    assert len(list(cartella.glob("*.json"))) == 1
+
+
+def test_append_row_dopo_ultima_riga_con_contenuto(fake_google):
+    # Righe vuote in coda, come nell'export di Google
+    larghezza = len(fake_google.rows[GID_PROPOSTE][0])
+    fake_google.rows[GID_PROPOSTE].extend([[""] * larghezza, [""] * larghezza])
+    df, _ = sheets.load_sheet("fake", GID_PROPOSTE)
+    assert df.iloc[-1].isna().all()
+
+    valori = ["10/03/2025 10.00.00", "ALE", "BUY", "AAPL"]
+    riga_foglio = fake_google.append_row(GID_PROPOSTE, valori)
+    patched = sheets.append_row(df, valori)
+
+    # Riga N del foglio = posizione N-2 del frame (riga 1 = intestazione)
+    assert len(patched) + 1 == riga_foglio
+    assert patched.iloc[riga_foglio - 2, 3] == "AAPL"
+
+
+def test_load_sheets_parsa_nei_worker(fake_google, monkeypatch):
+    thread = []
+    originale = sheets._parse_frame
+
+    def parse_registrato(key, entry, read_csv_kwargs):
+        thread.append(threading.current_thread() is threading.main_thread())
+        return originale(key, entry, read_csv_kwargs)
+
+    monkeypatch.setattr(sheets, "_parse_frame", parse_registrato)
+    risultati = sheets.load_sheets([("fake", GID_ORDINI), ("fake", GID_PROPOSTE)], header=0)
+
+    assert [len(df) > 0 for df, _ in risultati] == [True, True]
+    assert thread == [False, False]
+
+
+def test_salvataggio_tardivo_non_elimina_snapshot_piu_recenti(fake_google, tmp_path):
+    df, _ = sheets.load_sheet("fake", GID_ORDINI)
+    key = sheets.sheet_key("fake", GID_ORDINI)
+    cartella = tmp_path / f"fake_{GID_ORDINI}"
+    recente = sheets._get_sheet_store()["entries"][key]
+
+    # Un thread con un'entry più vecchia (altro digest) salva dopo con altre opzioni
+    vecchia = dict(recente, digest="vecchio", checked_at=recente["checked_at"] - 60)
+    sheets._save_snapshot(key, vecchia, {"header": None}, df)
+
+    assert len(list(cartella.glob("*.parquet"))) == 2
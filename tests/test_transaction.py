@@ -0,0 +1,21 @@
+import sheets
+import transaction
+from fake_sheets_server import GID_TRANSAZIONI
+
+
+def test_riga_in_cache_uguale_a_quella_del_webhook(fake_google):
+    sheets.load_sheet("fake", GID_TRANSAZIONI)
+    sheets.register_sheet("transazioni", "fake", GID_TRANSAZIONI, interval=600)
+    dati = {
+        'Data': '10/03/2025', 'Operazione': 'BUY', 'Strumento': 'AAPL', 'PMC': 190.5,
+        'Quantita': 3, 'Totale': 571.5, 'Valuta': 'USD', 'Tasso_cambio': 1.08,
+        'Commissioni': 2.5, 'Controvalore': 531.66, 'Lungo_breve': 'LUNGO', 'Nome_strumento': 'Apple Inc.',
+    }
+
+    successo, _ = fake_google.handle_webhook(transaction.transaction_payload(dati))
+    assert successo
+    assert transaction.applica_transazione_in_cache(dati)
+
+    df, _ = sheets.load_sheet("fake", GID_TRANSAZIONI)
+    scritta = fake_google.rows[GID_TRANSAZIONI][len(df)]
+    assert [str(v) for v in df.iloc[-1].tolist()] == scritta
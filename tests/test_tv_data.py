@@ -0,0 +1,36 @@
+import pandas as pd
+from tradingview_screener import Query
+
+import tv_data
+
+
+def test_pagine_successive_usano_range_inizio_fine(monkeypatch):
+    ranges = []
+
+    def finto_scanner(self, **kwargs):
+        inizio, fine = self.query['range']
+        ranges.append((inizio, fine))
+        righe = max(0, min(fine, 600) - inizio)
+        return 600, pd.DataFrame({'ticker': [f"X:{inizio + i}" for i in range(righe)]})
+
+    monkeypatch.setattr(Query, "get_scanner_data", finto_scanner)
+
+    pagine = {offset: df for offset, _, df in tv_data.iter_query_pages(Query(), page_size=250, max_rows=600)}
+
+    assert sorted(ranges) == [(0, 250), (250, 500), (500, 600)]
+    assert {offset: len(df) for offset, df in pagine.items()} == {0: 250, 250: 250, 500: 100}
+
+
+def test_query_ticker_chiede_tutti_i_simboli(monkeypatch):
+    ranges = []
+
+    def finto_scanner(self, **kwargs):
+        ranges.append(tuple(self.query['range']))
+        return 0, pd.DataFrame()
+
+    monkeypatch.setattr(Query, "get_scanner_data", finto_scanner)
+
+    simboli = [f"NASDAQ:T{i}" for i in range(120)]
+    tv_data._query_tickers(simboli, ['close', 'change'], groups=[("america",)])
+
+    assert ranges == [(0, 120)]
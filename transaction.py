@@ -8,28 +8,21 @@ import requests
 import json
 import time
 
+from sheets import load_sheet, invalidate, register_sheet, patch_sheet, append_row, resolve_webhook_url
+from sheet_schema import COLONNE_TRANSAZIONI, normalize_sheet
+from filter_index import apply_filters, build_filter_index, cached_filter_index
 
 # ==================== FUNZIONI ====================
 
 
-@st.cache_data(ttl=120)
 def load_sheet_csv_transactions(spreadsheet_id, gid):
-    """Carica foglio pubblico via CSV export"""
-    url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export?format=csv&gid={gid}"
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            df = pd.read_csv(url)
-            if not df.empty:
-                return df
-            time.sleep(1)
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            time.sleep(2)
-    
-    return None
+    """Carica foglio pubblico via CSV export (rivalidato ogni 2 minuti) e lo normalizza"""
+    df, digest = load_sheet(spreadsheet_id, gid, max_age=120)
+    df = normalize_sheet("transazioni", df, digest)
+    if df is not None:
+        # Versione dei dati per l'indice dei filtri
+        df.attrs['digest'] = digest
+    return df
 
 
 def format_decimal(value):
@@ -41,6 +34,31 @@ def format_decimal(value):
     return str(value)
 
 
+# Campi del webhook nell'ordine delle colonne del foglio (appendRow di Apps Script)
+CAMPI_WEBHOOK = [
+    "data", "operazione", "strumento", "pmc", "quantita", "totale", "valuta",
+    "tasso_cambio", "commissioni", "controvalore", "lungo_breve", "nome_strumento",
+]
+
+
+def transaction_payload(transaction_data):
+    """Riga della transazione come la scrive il webhook (decimali con la virgola)"""
+    return {
+        "data": transaction_data['Data'],
+        "operazione": transaction_data['Operazione'],
+        "strumento": transaction_data['Strumento'],
+        "pmc": format_decimal(transaction_data.get('PMC', 0)),
+        "quantita": format_decimal(transaction_data.get('Quantita', 0)),
+        "totale": format_decimal(transaction_data.get('Totale', 0)),
+        "valuta": transaction_data['Valuta'],
+        "tasso_cambio": format_decimal(transaction_data.get('Tasso_cambio', 1)),
+        "commissioni": format_decimal(transaction_data.get('Commissioni', 0)),
+        "controvalore": format_decimal(transaction_data.get('Controvalore', 0)),
+        "lungo_breve": transaction_data.get('Lungo_breve', ''),
+        "nome_strumento": transaction_data.get('Nome_strumento', transaction_data.get('Strumento', ''))
+    }
+
+
 def append_transaction_via_webhook(transaction_data, webhook_url):
     """
     Invia transazione al Google Apps Script webhook
@@ -48,20 +66,7 @@ def append_transaction_via_webhook(transaction_data, webhook_url):
     """
     try:
         # Prepara i dati per il webhook con virgole come separatore
-        payload = {
-            "data": transaction_data['Data'],
-            "operazione": transaction_data['Operazione'],
-            "strumento": transaction_data['Strumento'],
-            "pmc": format_decimal(transaction_data.get('PMC', 0)),
-            "quantita": format_decimal(transaction_data.get('Quantita', 0)),
-            "totale": format_decimal(transaction_data.get('Totale', 0)),
-            "valuta": transaction_data['Valuta'],
-            "tasso_cambio": format_decimal(transaction_data.get('Tasso_cambio', 1)),
-            "commissioni": format_decimal(transaction_data.get('Commissioni', 0)),
-            "controvalore": format_decimal(transaction_data.get('Controvalore', 0)),
-            "lungo_breve": transaction_data.get('Lungo_breve', ''),
-            "nome_strumento": transaction_data.get('Nome_strumento', transaction_data.get('Strumento', ''))
-        }
+        payload = transaction_payload(transaction_data)
         
         # ✅ FIX PRINCIPALE: Configura la sessione per seguire i redirect
         session = requests.Session()
@@ -101,6 +106,13 @@ def append_transaction_via_webhook(transaction_data, webhook_url):
         return False, f"❌ Errore imprevisto: {str(e)}"
 
 
+def applica_transazione_in_cache(transaction_data):
+    """Write-through: aggiunge subito la transazione al foglio in cache (stessa riga del webhook)"""
+    payload = transaction_payload(transaction_data)
+    valori = [payload[campo] for campo in CAMPI_WEBHOOK]
+    return patch_sheet("transazioni", lambda df: append_row(df, valori))
+
+
 # ==================== APP PRINCIPALE ====================
 
 
@@ -125,14 +137,15 @@ def transaction_tracker_app():
     # Configurazione
     spreadsheet_id = "1mD9jxDJv26aZwCdIbvQVjlJGBhRwKWwQnPpPPq0ON5Y"
     gid_transactions = 1594640549
+    register_sheet("transazioni", spreadsheet_id, gid_transactions, interval=120)
     
-    WEBHOOK_URL = "https://script.google.com/macros/s/AKfycbyu8f1-wz-UA7NAsiYmX0hRUgUiRv3pEmCYwYWMi9uQZAAoddPfHxN3iz1ldfY3fc0u/exec"
+    WEBHOOK_URL = resolve_webhook_url("https://script.google.com/macros/s/AKfycbyu8f1-wz-UA7NAsiYmX0hRUgUiRv3pEmCYwYWMi9uQZAAoddPfHxN3iz1ldfY3fc0u/exec")
     
     # Sidebar
     st.sidebar.markdown("### ⚙️ Opzioni Transazioni")
     
     if st.sidebar.button("🔄 Aggiorna Transazioni", type="primary"):
-        st.cache_data.clear()
+        invalidate("transazioni")
         st.rerun()
     
     st.sidebar.markdown("---")
@@ -156,25 +169,13 @@ def transaction_tracker_app():
                 st.info("💡 Verifica che il foglio sia pubblico")
                 st.stop()
             
-            expected_columns = [
-                'Data', 'Operazione', 'Strumento', 'PMC', 'Quantità',
-                'Totale', 'Valuta', 'Tasso di cambio', 'Commissioni', 'Controvalore €'
-            ]
+            expected_columns = COLONNE_TRANSAZIONI
             
-            if len(df_transactions.columns) >= 10:
-                df_transactions = df_transactions.iloc[:, :10]
-                df_transactions.columns = expected_columns
-            else:
+            if list(df_transactions.columns) != expected_columns:
                 st.error(f"❌ Il foglio ha solo {len(df_transactions.columns)} colonne, ne servono 10")
                 st.stop()
             
-            # Converti date
-            df_transactions['Data'] = pd.to_datetime(
-                df_transactions['Data'],
-                format='%d/%m/%Y',
-                errors='coerce'
-            )
-            df_transactions = df_transactions.dropna(subset=['Data'])
+            # Date convertite e righe senza data scartate dallo schema "transazioni"
             df_transactions = df_transactions.sort_values('Data', ascending=False).reset_index(drop=True)
             
             st.success(f"✅ {len(df_transactions)} transazioni caricate!")
@@ -214,24 +215,18 @@ def transaction_tracker_app():
                 max_value=max_date
             )
             
-            # Applica filtri
-            df_filtered = df_transactions.copy()
-            
-            if operazione_filter:
-                df_filtered = df_filtered[df_filtered['Operazione'].isin(operazione_filter)]
-            
-            if strumento_filter:
-                df_filtered = df_filtered[df_filtered['Strumento'].isin(strumento_filter)]
-            
-            if valuta_filter:
-                df_filtered = df_filtered[df_filtered['Valuta'].isin(valuta_filter)]
-            
-            if len(date_range) == 2:
-                start_date, end_date = date_range
-                df_filtered = df_filtered[
-                    (df_filtered['Data'].dt.date >= start_date) &
-                    (df_filtered['Data'].dt.date <= end_date)
-                ]
+            # Applica filtri: bitmask per valore calcolate una volta per versione del foglio
+            colonne_filtro = ('Operazione', 'Strumento', 'Valuta')
+            digest = df_transactions.attrs.get('digest')
+            if digest:
+                indice = cached_filter_index(digest, df_transactions, columns=colonne_filtro, date_column='Data')
+            else:
+                indice = build_filter_index(df_transactions, colonne_filtro, date_column='Data')
+            df_filtered = apply_filters(
+                df_transactions, indice,
+                selections={'Operazione': operazione_filter, 'Strumento': strumento_filter, 'Valuta': valuta_filter},
+                date_range=tuple(date_range) if len(date_range) == 2 else None
+            )
             
             df_filtered = df_filtered.sort_values('Data', ascending=False).reset_index(drop=True)
             
@@ -462,8 +457,8 @@ def transaction_tracker_app():
                     df_preview = pd.DataFrame([new_transaction])
                     st.dataframe(df_preview, use_container_width=True, hide_index=True)
                     
-                    st.cache_data.clear()
-                    st.info("🔄 Torna a 'Visualizza Transazioni' e clicca 'Aggiorna'")
+                    applica_transazione_in_cache(new_transaction)
+                    st.info("🔄 La transazione è già visibile in 'Visualizza Transazioni'")
                 else:
                     st.error(f"❌ {message}")
                     st.warning("Verifica che l'URL del webhook sia corretto e che segua i redirect.")
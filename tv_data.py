@@ -0,0 +1,515 @@
+"""
+Accesso ai dati TradingView per lo screener
+Le query verso lo scanner passano da qui: paginazione dei risultati oltre
+il limite di una singola richiesta, con più pagine in volo contemporaneamente
+
+Le query su tutti i mercati sono divise per mercato (o gruppo di mercati
+piccoli) ed eseguite in parallelo su un pool limitato: un mercato lento va
+in timeout da solo senza bloccare gli altri, e la latenza di ogni mercato
+viene registrata
+
+I risultati sono condivisi tra tutte le sessioni in una cache di processo
+indicizzata sull'impronta della query (mercati, colonne, filtri, ordinamento),
+con TTL ed eviction LRU; richieste identiche contemporanee aspettano un'unica
+chiamata a TradingView
+
+Le ricerche di un singolo ticker (EXCHANGE:TICKER) interrogano solo il
+mercato dell'exchange, letto da un indice exchange -> mercati inizializzato
+da una tabella statica e arricchito con i risultati dei fan-out precedenti
+(salvato su disco); gli exchange sconosciuti passano dal fan-out completo
+
+fetch_tickers scarica più ticker insieme (una richiesta per gruppo di
+mercati) e tiene in cache ogni ticker per conto suo
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from tradingview_screener import Query
+
+
+# ==================== CONFIGURAZIONE ====================
+MARKETS = (
+    'america', 'australia', 'belgium', 'brazil', 'canada', 'chile', 'china', 'italy',
+    'czech', 'denmark', 'egypt', 'estonia', 'finland', 'france', 'germany', 'greece',
+    'hongkong', 'hungary', 'india', 'indonesia', 'ireland', 'israel', 'japan', 'korea',
+    'kuwait', 'lithuania', 'luxembourg', 'malaysia', 'mexico', 'morocco', 'netherlands',
+    'newzealand', 'norway', 'peru', 'philippines', 'poland', 'portugal', 'qatar', 'russia',
+    'singapore', 'slovakia', 'spain', 'sweden', 'switzerland', 'taiwan', 'uae', 'uk',
+    'venezuela', 'vietnam', 'crypto',
+)
+
+# Mercati grandi interrogati da soli; gli altri raggruppati a blocchi
+HEAVY_MARKETS = ('america', 'china', 'india', 'japan', 'hongkong', 'korea', 'taiwan', 'uk', 'germany', 'canada', 'crypto')
+MARKETS_PER_GROUP = 8
+
+MAX_PARALLEL_MARKETS = 8       # richieste per mercato contemporanee
+MARKET_TIMEOUT = 10            # secondi per la richiesta di un mercato
+FANOUT_DEADLINE = 20           # attesa massima complessiva del fan-out
+
+SHARED_CACHE_TTL = 120         # secondi di validità di un risultato condiviso
+SHARED_CACHE_MAX_ENTRIES = 16  # risultati tenuti in memoria (LRU)
+
+TICKER_CACHE_TTL = 60          # secondi di validità dei dati di un singolo ticker
+TICKER_CACHE_MAX_ENTRIES = 2000
+
+# Indice exchange -> mercati imparato dai risultati (file JSON)
+EXCHANGE_INDEX_PATH = os.environ.get("FLUSSO_EXCHANGE_INDEX", os.path.join(".flusso_cache", "exchanges.json"))
+
+# Exchange noti (prefisso del ticker TradingView) -> mercati dello scanner
+EXCHANGE_MARKETS = {
+    'NASDAQ': ('america',), 'NYSE': ('america',), 'AMEX': ('america',), 'OTC': ('america',), 'CBOE': ('america',),
+    'MIL': ('italy',), 'EUROTLX': ('italy',),
+    'XETR': ('germany',), 'FWB': ('germany',), 'GETTEX': ('germany',), 'TRADEGATE': ('germany',),
+    'LSE': ('uk',), 'LSIN': ('uk',),
+    'EURONEXT': ('france', 'netherlands', 'belgium', 'portugal'),
+    'BME': ('spain',), 'SIX': ('switzerland',),
+    'OMXSTO': ('sweden',), 'OMXCOP': ('denmark',), 'OMXHEX': ('finland',), 'OSL': ('norway',),
+    'TSX': ('canada',), 'TSXV': ('canada',), 'NEO': ('canada',),
+    'BMFBOVESPA': ('brazil',), 'BMV': ('mexico',),
+    'TSE': ('japan',), 'HKEX': ('hongkong',), 'SSE': ('china',), 'SZSE': ('china',),
+    'NSE': ('india',), 'BSE': ('india',), 'KRX': ('korea',), 'TWSE': ('taiwan',), 'TPEX': ('taiwan',),
+    'ASX': ('australia',), 'SGX': ('singapore',), 'TASE': ('israel',), 'GPW': ('poland',),
+    'IDX': ('indonesia',), 'MYX': ('malaysia',),
+    'BINANCE': ('crypto',), 'COINBASE': ('crypto',), 'KRAKEN': ('crypto',), 'BITSTAMP': ('crypto',),
+}
+
+PAGE_SIZE = 250                # righe per richiesta
+MAX_PAGES_IN_FLIGHT = 4        # richieste di pagina contemporanee
+MAX_UNIVERSE_ROWS = 10_000     # tetto di sicurezza per l'universo completo
+QUERY_TIMEOUT = 20             # secondi per singola richiesta allo scanner
+
+
+def fetch_page(query, offset, limit, timeout=QUERY_TIMEOUT):
+    """Una pagina di risultati: (totale righe che soddisfano la query, DataFrame)"""
+    # range dello scanner = [inizio, fine): limit() imposta la fine, non il numero di righe
+    return query.copy().offset(offset).limit(offset + limit).get_scanner_data(timeout=timeout)
+
+
+def iter_query_pages(query, page_size=PAGE_SIZE, max_rows=MAX_UNIVERSE_ROWS,
+                     max_in_flight=MAX_PAGES_IN_FLIGHT):
+    """
+    Scorre tutti i risultati di una Query a pagine (offset/limit)
+
+    La prima pagina è sincrona e fornisce il totale; le altre partono in
+    parallelo (al massimo max_in_flight alla volta) e sono restituite
+    appena arrivano, quindi non necessariamente in ordine di offset.
+
+    Yields:
+        (offset, totale, DataFrame della pagina)
+    """
+    total, first = fetch_page(query, 0, page_size)
+    yield 0, total, first
+
+    offsets = list(range(page_size, min(total, max_rows), page_size))
+    if not offsets:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = {}
+        coda = iter(offsets)
+
+        def avvia_prossima():
+            offset = next(coda, None)
+            if offset is not None:
+                limit = min(page_size, max_rows - offset)
+                pending[executor.submit(fetch_page, query, offset, limit)] = offset
+
+        for _ in range(max_in_flight):
+            avvia_prossima()
+
+        while pending:
+            completate, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completate:
+                offset = pending.pop(future)
+                avvia_prossima()
+                _, df = future.result()
+                yield offset, total, df
+
+
+def market_groups(markets=MARKETS, per_group=MARKETS_PER_GROUP):
+    """Gruppi di mercati per il fan-out: i mercati grandi da soli, gli altri a blocchi"""
+    pesanti = [(m,) for m in markets if m in HEAVY_MARKETS]
+    altri = [m for m in markets if m not in HEAVY_MARKETS]
+    return pesanti + [tuple(altri[i:i + per_group]) for i in range(0, len(altri), per_group)]
+
+
+def _group_label(group):
+    """Etichetta leggibile di un gruppo di mercati"""
+    return "+".join(group)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_fanout_executor():
+    """Pool di processo per le richieste per mercato (limita il carico verso TradingView)"""
+    return ThreadPoolExecutor(max_workers=MAX_PARALLEL_MARKETS, thread_name_prefix="tv-market")
+
+
+@st.cache_resource(show_spinner=False)
+def _get_latency_store():
+    """Latenze per gruppo di mercati condivise da tutte le sessioni"""
+    return {"lock": threading.Lock(), "groups": {}}
+
+
+def _record_latency(label, seconds, error=None):
+    store = _get_latency_store()
+    with store["lock"]:
+        stats = store["groups"].setdefault(label, {"count": 0, "errors": 0, "avg": 0.0})
+        stats["count"] += 1
+        stats["last"] = seconds
+        # Media mobile esponenziale: pesa di più le richieste recenti
+        stats["avg"] = seconds if stats["count"] == 1 else 0.7 * stats["avg"] + 0.3 * seconds
+        if error:
+            stats["errors"] += 1
+            stats["last_error"] = error
+        stats["at"] = time.time()
+
+
+def get_market_latency():
+    """
+    Statistiche di latenza per gruppo di mercati
+
+    Returns:
+        DataFrame con mercati, ultima latenza, media, richieste ed errori
+    """
+    store = _get_latency_store()
+    with store["lock"]:
+        righe = [
+            {"Mercati": label, "Ultima (s)": round(stats["last"], 2), "Media (s)": round(stats["avg"], 2),
+             "Richieste": stats["count"], "Errori": stats["errors"]}
+            for label, stats in store["groups"].items()
+        ]
+    return pd.DataFrame(righe).sort_values("Media (s)", ascending=False) if righe else pd.DataFrame()
+
+
+def _query_group(query, group, timeout):
+    """Esegue la query su un solo gruppo di mercati registrandone la latenza"""
+    label = _group_label(group)
+    inizio = time.perf_counter()
+    try:
+        result = query.copy().set_markets(*group).get_scanner_data(timeout=timeout)
+    except Exception as e:
+        _record_latency(label, time.perf_counter() - inizio, error=str(e))
+        raise
+    _record_latency(label, time.perf_counter() - inizio)
+    return result
+
+
+def fan_out(query, groups=None, timeout=MARKET_TIMEOUT, deadline=FANOUT_DEADLINE):
+    """
+    Esegue una Query separatamente per ogni gruppo di mercati e unisce i risultati
+
+    Args:
+        query: Query TradingView (i mercati impostati vengono sostituiti)
+        groups: gruppi di mercati (default: market_groups())
+        timeout: timeout della singola richiesta
+        deadline: oltre questo tempo i gruppi non ancora arrivati sono scartati
+
+    Returns:
+        (totale righe, DataFrame unito nell'ordine dei gruppi, {gruppo: errore})
+    """
+    groups = [tuple(g) for g in (groups or market_groups())]
+    executor = _get_fanout_executor()
+    futures = {executor.submit(_query_group, query, group, timeout): group for group in groups}
+    done, not_done = wait(futures, timeout=deadline)
+
+    risultati = {}
+    errori = {}
+    for future in done:
+        group = futures[future]
+        try:
+            risultati[group] = future.result()
+        except Exception as e:
+            errori[_group_label(group)] = str(e)
+    for future in not_done:
+        # Se non è ancora partita la si toglie dalla coda del pool; quelle già in corso
+        # arrivano al più entro il timeout della richiesta e il risultato viene scartato
+        future.cancel()
+        errori[_group_label(futures[future])] = f"timeout dopo {deadline}s"
+
+    total = sum(r[0] for r in risultati.values())
+    frames = [risultati[g][1] for g in groups if g in risultati and not risultati[g][1].empty]
+    learn_exchanges({g: risultati[g][1] for g in risultati})
+    if not frames:
+        return total, pd.DataFrame(), errori
+    df = pd.concat(frames, ignore_index=True)
+    if 'ticker' in df.columns:
+        df = df.drop_duplicates('ticker').reset_index(drop=True)
+    return total, df, errori
+
+
+# ==================== INDICE EXCHANGE -> MERCATI ====================
+def exchange_of(symbol):
+    """Prefisso exchange di un simbolo 'EXCHANGE:TICKER' (None se manca)"""
+    prefisso, sep, _ = str(symbol).partition(':')
+    return prefisso.strip().upper() if sep and prefisso.strip() else None
+
+
+@st.cache_resource(show_spinner=False)
+def _get_exchange_index():
+    """Exchange imparati (caricati dal disco una volta per processo)"""
+    learned = {}
+    try:
+        with open(EXCHANGE_INDEX_PATH, encoding="utf-8") as f:
+            learned = {k: tuple(v) for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        pass
+    return {"lock": threading.Lock(), "learned": learned}
+
+
+def _save_exchange_index(learned):
+    """Scrittura atomica dell'indice; gli errori non devono rompere le query"""
+    try:
+        os.makedirs(os.path.dirname(EXCHANGE_INDEX_PATH) or ".", exist_ok=True)
+        with open(EXCHANGE_INDEX_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({k: list(v) for k, v in sorted(learned.items())}, f, indent=1)
+        os.replace(EXCHANGE_INDEX_PATH + ".tmp", EXCHANGE_INDEX_PATH)
+    except OSError:
+        pass
+
+
+def resolve_markets(symbol):
+    """Mercati in cui cercare un simbolo, None se l'exchange non è noto"""
+    exchange = exchange_of(symbol)
+    if exchange is None:
+        return None
+    index = _get_exchange_index()
+    with index["lock"]:
+        return EXCHANGE_MARKETS.get(exchange) or index["learned"].get(exchange)
+
+
+def learn_exchanges(risultati):
+    """
+    Aggiorna l'indice con gli exchange visti nei risultati di ogni gruppo
+
+    Args:
+        risultati: {gruppo di mercati: DataFrame con la colonna 'ticker'}
+    """
+    index = _get_exchange_index()
+    modificato = False
+    with index["lock"]:
+        for group, df in risultati.items():
+            if df.empty or 'ticker' not in df.columns:
+                continue
+            for exchange in df['ticker'].map(exchange_of).dropna().unique():
+                if exchange in EXCHANGE_MARKETS:
+                    continue
+                # Un exchange visto in più gruppi resta associato a tutti
+                noti = index["learned"].get(exchange, ())
+                unione = tuple(m for m in MARKETS if m in noti or m in group)
+                if unione != noti:
+                    index["learned"][exchange] = unione
+                    modificato = True
+        if modificato:
+            _save_exchange_index(index["learned"])
+
+
+def fan_out_symbol(query, symbol, timeout=MARKET_TIMEOUT, deadline=FANOUT_DEADLINE):
+    """
+    Come fan_out, ma per un simbolo EXCHANGE:TICKER interroga solo il suo mercato
+
+    Se l'exchange è sconosciuto (o il mercato indicato non restituisce nulla)
+    esegue il fan-out completo, che aggiorna l'indice per le volte successive.
+    """
+    markets = resolve_markets(symbol)
+    if markets:
+        total, df, errori = fan_out(query, groups=[markets], timeout=timeout, deadline=deadline)
+        if not df.empty:
+            return total, df, errori
+    return fan_out(query, timeout=timeout, deadline=deadline)
+
+
+# ==================== TICKER IN BLOCCO ====================
+@st.cache_resource(show_spinner=False)
+def _get_ticker_cache():
+    """Righe per (ticker, colonne) condivise tra le sessioni"""
+    return {"lock": threading.Lock(), "rows": OrderedDict()}
+
+
+def _split_by_markets(symbols):
+    """Raggruppa i simboli per mercati risolti; i simboli senza exchange noto a parte"""
+    gruppi = {}
+    sconosciuti = []
+    for symbol in symbols:
+        markets = resolve_markets(symbol)
+        if markets:
+            gruppi.setdefault(markets, []).append(symbol)
+        else:
+            sconosciuti.append(symbol)
+    return gruppi, sconosciuti
+
+
+def _query_tickers(symbols, columns, groups=None):
+    """Una query set_tickers per i simboli dati, eseguita per gruppo di mercati"""
+    # Il range di default dello scanner è [0, 50]: senza limit i ticker oltre il 50° si perdono
+    query = Query().set_tickers(*symbols).select(*columns).limit(len(symbols))
+    _, df, errori = fan_out(query, groups=groups)
+    return df, errori
+
+
+def fetch_tickers(symbols, columns, ttl=TICKER_CACHE_TTL):
+    """
+    Dati di più simboli EXCHANGE:TICKER con una richiesta per gruppo di mercati
+
+    I simboli già in cache (stesse colonne, meno di ttl secondi) non vengono
+    richiesti; quelli con exchange noto vanno solo ai loro mercati, gli altri
+    (e quelli non trovati) al fan-out completo, che aggiorna l'indice.
+
+    Args:
+        symbols: lista di simboli (duplicati ignorati)
+        columns: colonne TradingView da selezionare
+        ttl: validità in secondi della cache per ticker
+
+    Returns:
+        (DataFrame indicizzato per simbolo nell'ordine richiesto, {gruppo: errore})
+        I simboli non trovati non compaiono nel DataFrame.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    columns = tuple(columns)
+    cache = _get_ticker_cache()
+    adesso = time.time()
+
+    righe = {}
+    with cache["lock"]:
+        for symbol in symbols:
+            entry = cache["rows"].get((symbol, columns))
+            if entry is not None and adesso - entry["at"] < ttl:
+                cache["rows"].move_to_end((symbol, columns))
+                righe[symbol] = entry["row"]
+
+    mancanti = [s for s in symbols if s not in righe]
+    errori = {}
+    if mancanti:
+        gruppi, sconosciuti = _split_by_markets(mancanti)
+        trovati = []
+        if gruppi:
+            # ⭐ Un'unica query con tutti i ticker, una richiesta per ogni gruppo di mercati ⭐
+            df, err = _query_tickers([s for g in gruppi.values() for s in g], columns, groups=list(gruppi))
+            trovati.append(df)
+            errori.update(err)
+            visti = set(df['ticker']) if 'ticker' in df.columns else set()
+            sconosciuti += [s for g in gruppi.values() for s in g if s not in visti]
+        if sconosciuti:
+            df, err = _query_tickers(sconosciuti, columns)
+            trovati.append(df)
+            errori.update(err)
+
+        nuove = {}
+        for df in trovati:
+            if df.empty or 'ticker' not in df.columns:
+                continue
+            for row in df.drop_duplicates('ticker').to_dict('records'):
+                symbol = row.pop('ticker')
+                nuove[symbol] = {col: row.get(col, np.nan) for col in columns}
+        righe.update(nuove)
+
+        adesso = time.time()
+        with cache["lock"]:
+            for symbol, row in nuove.items():
+                cache["rows"][(symbol, columns)] = {"row": row, "at": adesso}
+                cache["rows"].move_to_end((symbol, columns))
+            while len(cache["rows"]) > TICKER_CACHE_MAX_ENTRIES:
+                cache["rows"].popitem(last=False)
+
+    ordine = [s for s in symbols if s in righe]
+    df = pd.DataFrame([righe[s] for s in ordine], index=pd.Index(ordine, name='ticker'), columns=list(columns))
+    return df, errori
+
+
+# ==================== CACHE CONDIVISA ====================
+class _LeaderAborted(Exception):
+    """La sessione che stava scaricando è stata interrotta (rerun/stop): chi aspettava riprova"""
+
+
+def query_fingerprint(query, *extra):
+    """Impronta di una Query: endpoint, mercati, colonne, filtri, ordinamento e range (+ extra)"""
+    payload = json.dumps({"url": query.url, "query": query.query, "extra": extra}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_query_cache():
+    """Risultati condivisi tra le sessioni e richieste in corso, per impronta"""
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "inflight": {}}
+
+
+def shared_query(fingerprint, fetch, ttl=SHARED_CACHE_TTL, cacheable=None):
+    """
+    Restituisce il risultato di fetch() condiviso tra tutte le sessioni
+
+    Se un risultato con la stessa impronta ha meno di ttl secondi viene
+    riusato; se un'altra sessione lo sta già scaricando si attende quella
+    richiesta invece di farne un'altra. Il valore restituito è condiviso:
+    non va modificato in place.
+
+    Args:
+        fingerprint: chiave (query_fingerprint)
+        fetch: funzione senza argomenti che scarica il risultato
+        ttl: validità in secondi
+        cacheable: funzione valore -> bool; False = servito ma non salvato
+                   (es. risultati parziali)
+
+    Returns:
+        (valore, timestamp del download)
+    """
+    cache = _get_query_cache()
+    while True:
+        with cache["lock"]:
+            entry = cache["entries"].get(fingerprint)
+            if entry is not None and time.time() - entry["at"] < ttl:
+                cache["entries"].move_to_end(fingerprint)
+                return entry["value"], entry["at"]
+            future = cache["inflight"].get(fingerprint)
+            leader = future is None
+            if leader:
+                future = Future()
+                cache["inflight"][fingerprint] = future
+
+        if not leader:
+            try:
+                return future.result()
+            except _LeaderAborted:
+                continue
+
+        try:
+            value = fetch()
+        except Exception as e:
+            with cache["lock"]:
+                cache["inflight"].pop(fingerprint, None)
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Rerun/stop di Streamlit nella sessione che scaricava: gli altri riprovano
+            with cache["lock"]:
+                cache["inflight"].pop(fingerprint, None)
+            future.set_exception(_LeaderAborted())
+            raise
+
+        fetched_at = time.time()
+        with cache["lock"]:
+            cache["inflight"].pop(fingerprint, None)
+            if cacheable is None or cacheable(value):
+                cache["entries"][fingerprint] = {"value": value, "at": fetched_at}
+                cache["entries"].move_to_end(fingerprint)
+                while len(cache["entries"]) > SHARED_CACHE_MAX_ENTRIES:
+                    cache["entries"].popitem(last=False)
+        future.set_result((value, fetched_at))
+        return value, fetched_at
+
+
+def clear_query_cache():
+    """Svuota i risultati condivisi e la cache per ticker (le richieste in corso non sono toccate)"""
+    cache = _get_query_cache()
+    with cache["lock"]:
+        cache["entries"].clear()
+    ticker_cache = _get_ticker_cache()
+    with ticker_cache["lock"]:
+        ticker_cache["rows"].clear()